@@ -7,7 +7,7 @@ class ArgGroupWithDefault(universum.lib.module_arguments.ModuleArgumentGroup):
             kwargs["required"] = False
             kwargs["default"] = ""
 
-        super(ArgGroupWithDefault, self).add_argument(*args, **kwargs)
+        return super(ArgGroupWithDefault, self).add_argument(*args, **kwargs)
 
 
 class ArgParserWithDefault(universum.lib.module_arguments.ModuleArgumentParser):
@@ -16,7 +16,7 @@ class ArgParserWithDefault(universum.lib.module_arguments.ModuleArgumentParser):
             kwargs["required"] = False
             kwargs["default"] = ""
 
-        super(ArgParserWithDefault, self).add_argument(*args, **kwargs)
+        return super(ArgParserWithDefault, self).add_argument(*args, **kwargs)
 
     def add_argument_group(self, *args, **kwargs):
         group = super(ArgParserWithDefault, self).add_argument_group(*args, **kwargs)
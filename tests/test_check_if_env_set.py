@@ -1,11 +1,13 @@
 # pylint: disable = redefined-outer-name
 
 import os
+import time
 from typing import Optional
 import pytest
 
 from universum.configuration_support import Variations
-from universum.modules.launcher import check_if_env_set
+from universum.modules import launcher
+from universum.modules.launcher import EnvConditionChecker, check_if_env_set
 
 
 @pytest.fixture(autouse=True)
@@ -201,3 +203,67 @@ def test_multiplication_filter_all_true():
     assert_equal_multiplication([{'if_env_set': 'VAR_1 == value_1 && VAR_3 == value_3'},
                                  {'if_env_set': 'VAR_2 == value_2 && VAR_3 == value_3'}],
                                 {"VAR_1": "value_1", "VAR_2": "value_2", "VAR_3": "value_3"})
+
+
+##########################################################################
+# checking many configurations with shared conditions
+##########################################################################
+
+def make_leaves_with_shared_conditions():
+    setup_env_vars({"PLATFORM": "linux", "RUN_TESTS": "yes"})
+    platforms = Variations([dict(name=f"{platform} ", if_env_set=f"PLATFORM == {platform}")
+                            for platform in ("linux", "windows", "macos")])
+    options = Variations([dict(name=f"option {index} ") for index in range(100)])
+    tests = Variations([dict(name=f"test {index}", if_env_set=" && RUN_TESTS && NO_SUCH_VAR != 1")
+                        for index in range(100)])
+    return list((platforms * options * tests).iterate_leaves())
+
+
+def test_env_condition_checker_memoization(monkeypatch):
+    leaves = make_leaves_with_shared_conditions()
+
+    launcher.parse_env_conditions.cache_clear()
+    expected = [check_if_env_set(leaf) for leaf in leaves]
+    # All the leaves share 3 distinct expressions, so each of them is only parsed once
+    assert launcher.parse_env_conditions.cache_info().misses == 3
+    assert launcher.parse_env_conditions.cache_info().hits == len(leaves) - 3
+
+    evaluated = []
+
+    def evaluate_env_conditions(conditions, environment):
+        evaluated.append(conditions)
+        return original_evaluate(conditions, environment)
+
+    original_evaluate = launcher.evaluate_env_conditions
+    monkeypatch.setattr(launcher, "evaluate_env_conditions", evaluate_env_conditions)
+    checker = EnvConditionChecker()
+    result = [checker(leaf) for leaf in leaves]
+
+    assert result == expected
+    assert result.count(True) == 100 * 100
+    assert len(checker.results) == 3
+    assert len(evaluated) == 3
+
+
+# Timings depend on the machine load, so the benchmark only prints them, and is only run on demand
+@pytest.mark.skipif(not os.environ.get("UNIVERSUM_BENCHMARKS"),
+                    reason="benchmarks are run only if UNIVERSUM_BENCHMARKS is set")
+def test_env_condition_checker_throughput():
+    leaves = make_leaves_with_shared_conditions()
+    started = time.process_time()
+    _ = [check_if_env_set(leaf) for leaf in leaves]
+    plain_time = time.process_time() - started
+    started = time.process_time()
+    checker = EnvConditionChecker()
+    _ = [checker(leaf) for leaf in leaves]
+    memorized_time = time.process_time() - started
+    print(f"\nCPU time spent on checking {len(leaves)} configurations: "
+          f"{plain_time:.3f} s for each one, {memorized_time:.3f} s with memorized results")
+
+
+def test_env_condition_checker_snapshot():
+    setup_env_vars({"VAR": "value"})
+    checker = EnvConditionChecker()
+    os.environ["VAR"] = "other value"
+    assert checker(dict(if_env_set="VAR == value")) is True
+    assert check_if_env_set(dict(if_env_set="VAR == value")) is False
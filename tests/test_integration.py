@@ -1,3 +1,4 @@
+import json
 import os
 import signal
 import subprocess
@@ -52,6 +53,75 @@ configs = mkdir * dirs1 + mkdir * dirs2 + mkfile * files1 + mkfile * files2 + ar
     assert os.path.exists(os.path.join(docker_main.artifact_dir, "file.sh"))
 
 
+def test_configs_dump_json_lines(docker_main):
+    docker_main.run("""
+from universum.configuration_support import Variations
+
+configs = Variations([dict(name="Build ")]) * Variations([dict(name="debug", command=["make", "debug"]),
+                                                          dict(name="release", command=["make", "release"])])
+""", additional_parameters="--configs-dump-format jsonl")
+    with open(os.path.join(docker_main.artifact_dir, "CONFIGS_DUMP.jsonl")) as dump_file:
+        dump = [json.loads(line) for line in dump_file]
+    assert dump == [dict(name="Build debug", command=["make", "debug"]),
+                    dict(name="Build release", command=["make", "release"])]
+
+
+
+def test_config_profile(docker_main):
+    docker_main.run("""
+from universum.configuration_support import Variations
+
+platforms = Variations([dict(name="linux "), dict(name="windows ", if_env_set="NO_SUCH_VAR")])
+configs = platforms * Variations([dict(name=str(index), command=["echo", str(index)]) for index in range(3)])
+""", additional_parameters="--profile-config")
+    with open(os.path.join(docker_main.artifact_dir, "CONFIGS_PROFILE.json")) as profile_file:
+        profile = json.load(profile_file)
+    assert set(profile["seconds"]) == {"evaluation", "dumping", "filtering", "planning"}
+    assert profile["leaves"] == dict(evaluated=6, filtered=3)
+    assert profile["multiplication"]["count"] == 1
+    assert profile["largest_products"][0]["leaves"] == 6
+    assert profile["largest_products"][0]["factors"] == [2, 3]
+    assert profile["peak_memory_mb"] > 0
+
+
+def test_build_timings(docker_main):
+    log = docker_main.run("""
+from universum.configuration_support import Variations
+
+configs = Variations([dict(name="Sleeping step", command=["sleep", "1"]),
+                      dict(name="Computing step", command=["python3", "-c", "sum(range(10 ** 8))"])])
+""")
+    assert "Sleeping step - Success (" in log
+    with open(os.path.join(docker_main.artifact_dir, "BUILD_TIMINGS.json")) as timings_file:
+        timings = json.load(timings_file)
+    steps_block = next(block for block in timings["blocks"] if block["name"] == "Executing build steps")
+    sleeping, computing = steps_block["children"]
+    assert sleeping["duration"] >= 1 and sleeping["cpu_time"] < 0.5
+    assert computing["cpu_time"] > 0.5 and computing["max_rss_mb"] > 0
+    # Values are rounded to milliseconds
+    assert computing["started"] + 0.01 >= sleeping["started"] + sleeping["duration"]
+    assert steps_block["duration"] + 0.01 >= sleeping["duration"] + computing["duration"]
+
+
+def test_trace_file(docker_main):
+    trace_path = os.path.join(docker_main.artifact_dir, "trace.json")
+    docker_main.run("""
+from universum.configuration_support import Variations
+
+configs = Variations([dict(name="Background step", command=["sleep", "1"], background=True),
+                      dict(name="Foreground step", command=["echo", "text"])])
+""", additional_parameters=f"--trace-file '{trace_path}'")
+    with open(trace_path) as trace_file:
+        events = json.load(trace_file)["traceEvents"]
+    blocks = {event["name"]: event for event in events if event["ph"] == "X" and event["cat"] == "block"}
+    assert {"Preparing repository", "Processing project configs", "Executing build steps",
+            "Collecting artifacts", "Reporting build result", "Finalizing"} <= set(blocks)
+    # Overlapping steps are placed to different threads
+    assert blocks["[ 1/2 ] Background step"]["tid"] != blocks["[ 2/2 ] Foreground step"]["tid"]
+    assert blocks["[ 1/2 ] Background step"]["dur"] >= 1000000
+    assert len([event for event in events if event["ph"] == "X" and event["cat"] == "process"]) == 2
+
+
 def test_background_steps(docker_main_and_nonci):
     log = docker_main_and_nonci.run("""
 from universum.configuration_support import Variations
@@ -196,6 +266,238 @@ configs += Variations([dict(name="Additional step", command=["echo", "This shoul
     assert "This should be in log - 3" in log
 
 
+def test_step_dependencies(docker_main_and_nonci):
+    log = docker_main_and_nonci.run("""
+from universum.configuration_support import Variations
+
+configs = Variations([dict(name="Bad step", command=["ls", "not_a_file"]),
+                      dict(name="Good step", command=["echo", "step succeeded"], background=True),
+                      dict(name="Dependent bad", command=["echo", "This shouldn't be in log."],
+                           depends_on=["Good step", "Bad step"]),
+                      dict(name="Dependent good", command=["echo", "This should be in log."],
+                           depends_on=["Good step"])])
+""")
+    assert "Dependent bad skipped because of failure of step 'Bad step'" in log
+    assert "This shouldn't be in log." not in log
+    assert "This should be in log." in log
+    assert "Waiting for background step 'Good step' to finish..." in log
+
+
+@pytest.mark.parametrize("jobs", ["1", "4"])
+def test_parallel_steps(docker_main_and_nonci, jobs):
+    log = docker_main_and_nonci.run("""
+from universum.configuration_support import Variations
+
+sleep = Variations([dict(name="Sleep", command=["sleep", "1"])])
+multiply = Variations([dict(name=" 1"), dict(name=" 2"), dict(name=" 3"), dict(name=" 4")])
+
+configs = sleep * multiply
+configs += Variations([dict(name="After sleep", command=["echo", "first dependent"], depends_on=["Sleep 2"]),
+                       dict(name="Bad step", command=["ls", "not_a_file"], critical=True),
+                       dict(name="Extra step", command=["echo", "This shouldn't be in log."])])
+""", additional_parameters="-j " + jobs)
+    # logs of parallel steps are printed in the order of configuration
+    assert log.index("Sleep 1") < log.index("Sleep 2") < log.index("Sleep 4") < log.index("first dependent")
+    assert "Extra step skipped because of critical step failure" in log
+    assert "This shouldn't be in log." not in log
+
+
+def test_step_resources(docker_main_and_nonci):
+    log = docker_main_and_nonci.run("""
+from universum.configuration_support import Variations
+
+configs = Variations([dict(name="Heavy step 1", command=["sh", "-c", "sleep 1; echo heavy step 1 finished"],
+                           background=True, memory_mb=600),
+                      dict(name="Heavy step 2", command=["echo", "heavy step 2 started"],
+                           background=True, memory_mb=600)])
+""", additional_parameters="--memory-mb 1000")
+    assert "Not enough CPUs or memory for this step" in log
+    assert log.index("heavy step 1 finished") < log.index("heavy step 2 started")
+
+
+@pytest.mark.parametrize("jobs", ["1", "4"])
+def test_fail_fast(docker_main_and_nonci, jobs):
+    log = docker_main_and_nonci.run("""
+from universum.configuration_support import Variations
+
+configs = Variations([dict(name="Long step", command=["sh", "-c", "sleep 600; echo long step finished"],
+                           background=True),
+                      dict(name="Bad step", command=["ls", "not_a_file"], critical=True),
+                      dict(name="Extra step", command=["echo", "This shouldn't be in log."])])
+""", additional_parameters="--fail-fast -j " + jobs)
+    assert "Step was cancelled, so all its processes were killed" in log
+    assert "Cancelled" in log
+    assert "long step finished" not in log
+    assert "This shouldn't be in log." not in log
+
+
+def test_step_timeout(docker_main_and_nonci):
+    log = docker_main_and_nonci.run("""
+from universum.configuration_support import Variations
+
+configs = Variations([dict(name="Hanging step", command=["sleep", "600"], timeout=1),
+                      dict(name="Hanging background step", command=["sleep", "600"], background=True),
+                      dict(name="Quick step", command=["echo", "quick step finished"])])
+""", additional_parameters="--step-timeout 3")
+    assert "Step timed out after 1 seconds" in log
+    assert "Step timed out after 3 seconds" in log
+    assert "quick step finished" in log
+
+
+def test_python_pool_runner(docker_main_and_nonci):
+    script = docker_main_and_nonci.local.root_directory.join("pooled_script.py")
+    script.write("""
+import os
+import sys
+
+print("Variable is " + os.environ.get("POOL_VAR", "not set"))
+sys.exit(int(sys.argv[1]))
+""")
+    log = docker_main_and_nonci.run("""
+from universum.configuration_support import Variations
+
+configs = Variations([dict(name="Pooled script", command=["python3.7", "pooled_script.py", "0"],
+                           runner="python-pool", environment={"POOL_VAR": "set"}),
+                      dict(name="Failed script", command=["python3.7", "pooled_script.py", "2"],
+                           runner="python-pool"),
+                      dict(name="Pooled module", command=["python3.7", "-m", "platform"], runner="python-pool"),
+                      dict(name="Unsupported command", command=["python3.7", "-c", "print(1)"],
+                           runner="python-pool")])
+""")
+    assert "Variable is set" in log
+    assert "Variable is not set" in log
+    assert "Python pool process got exit code 2" in log
+    assert "Linux" in log
+    assert "Only commands like 'python -m module [args]'" in log
+
+
+def test_step_cache(docker_main_and_nonci):
+    cache_dir = os.path.join(docker_main_and_nonci.working_dir, "step_cache")
+    input_file = docker_main_and_nonci.local.root_directory.join("cache_input.txt")
+    input_file.write("input")
+    config = """
+from universum.configuration_support import Variations
+
+configs = Variations([dict(name="Cached step", command=["echo", "cached step output"],
+                           cache_inputs="cache_input.txt")])
+"""
+    log = docker_main_and_nonci.run(config, additional_parameters="--cache-dir " + cache_dir)
+    assert "restored from cache" not in log
+    assert "cached step output" in log
+
+    log = docker_main_and_nonci.run(config, additional_parameters="--cache-dir " + cache_dir)
+    assert "restored from cache" in log
+    assert "cached step output" in log
+
+    input_file.write("changed input")
+    log = docker_main_and_nonci.run(config, additional_parameters="--cache-dir " + cache_dir)
+    assert "restored from cache" not in log
+
+
+def test_step_cache_environment_and_failures(docker_main_and_nonci):
+    cache_dir = os.path.join(docker_main_and_nonci.working_dir, "step_cache")
+    docker_main_and_nonci.local.root_directory.join("cache_input.txt").write("input")
+    config = """
+from universum.configuration_support import Variations
+
+configs = Variations([dict(name="Inherited variable", command=["bash", "-c", "echo value=$MY_VAR"],
+                           cache_inputs="cache_input.txt"),
+                      dict(name="Listed variable", command=["bash", "-c", "echo other=$OTHER_VAR"],
+                           cache_inputs="cache_input.txt", cache_environment=["OTHER_VAR"]),
+                      dict(name="Failing step", command=["bash", "-c", "echo failing; exit 3"],
+                           cache_inputs="cache_input.txt")])
+"""
+    parameters = "--cache-dir " + cache_dir
+    docker_main_and_nonci.run(config, additional_parameters=parameters, environment=["MY_VAR=1", "OTHER_VAR=1"])
+    log = docker_main_and_nonci.run(config, additional_parameters=parameters,
+                                    environment=["MY_VAR=1", "OTHER_VAR=1"])
+    assert log.count("restored from cache") == 2  # failed step is not cached
+    assert "bash -c 'echo failing; exit 3'" in log
+
+    # Changing the inherited variable invalidates the steps not listing the variables they depend on
+    log = docker_main_and_nonci.run(config, additional_parameters=parameters,
+                                    environment=["MY_VAR=2", "OTHER_VAR=1"])
+    assert "value=2" in log
+    assert log.count("restored from cache") == 1
+
+    docker_main_and_nonci.run(config, additional_parameters=parameters + " --cache-failures",
+                              environment=["MY_VAR=2", "OTHER_VAR=1"])
+    log = docker_main_and_nonci.run(config, additional_parameters=parameters + " --cache-failures",
+                                    environment=["MY_VAR=2", "OTHER_VAR=1"])
+    assert log.count("restored from cache") == 3
+
+
+def test_longest_first_order(docker_main_and_nonci):
+    cache_dir = os.path.join(docker_main_and_nonci.working_dir, "step_cache")
+    order_file = os.path.join(cache_dir, "order.txt")
+    config = f"""
+from universum.configuration_support import Variations
+
+configs = Variations([dict(name="Short step", command=["sh", "-c", "echo started short >> {order_file}"]),
+                      dict(name="Long step", command=["sh", "-c", "echo started long >> {order_file}; sleep 2"]),
+                      dict(name="Print order", command=["cat", "{order_file}"],
+                           depends_on=["Short step", "Long step"])])
+"""
+    docker_main_and_nonci.run(config, additional_parameters="--cache-dir " + cache_dir)
+    # Durations of the previous run are used to start the longest step first
+    log = docker_main_and_nonci.run(config, additional_parameters="--order longest-first --cache-dir " + cache_dir)
+    assert log.rindex("started short") > log.rindex("started long")
+    assert log.index("Short step") < log.index("Long step")
+
+
+def test_config_cache(docker_main_and_nonci):
+    cache_dir = os.path.join(docker_main_and_nonci.working_dir, "step_cache")
+    manifest = docker_main_and_nonci.local.root_directory.join("manifest.txt")
+    manifest.write("first")
+    config = """
+import os
+
+from universum.configuration_support import Variations, get_project_root
+
+with open(get_project_root() + "/manifest.txt") as manifest:
+    name = manifest.read().strip() + os.environ.get("MANIFEST_SUFFIX", "")
+configs = Variations([dict(name="Step", command=["echo", "step of " + name + " manifest"])])
+"""
+    parameters = "--cache-configs --config-inputs manifest.txt --config-environment MANIFEST_SUFFIX " \
+                 "--cache-dir " + cache_dir
+    log = docker_main_and_nonci.run(config, additional_parameters=parameters)
+    assert "configurations are loaded from cache" not in log
+    assert "step of first manifest" in log
+
+    log = docker_main_and_nonci.run(config, additional_parameters=parameters)
+    assert "configurations are loaded from cache" in log
+    assert "step of first manifest" in log
+
+    manifest.write("second")
+    log = docker_main_and_nonci.run(config, additional_parameters=parameters)
+    assert "configurations are loaded from cache" not in log
+    assert "step of second manifest" in log
+
+    # Only the listed environment variables are checked
+    log = docker_main_and_nonci.run(config, additional_parameters=parameters, environment=["UNRELATED_VAR=1"])
+    assert "configurations are loaded from cache" in log
+    assert "step of second manifest" in log
+
+    log = docker_main_and_nonci.run(config, additional_parameters=parameters, environment=["MANIFEST_SUFFIX=-a"])
+    assert "configurations are loaded from cache" not in log
+    assert "step of second-a manifest" in log
+
+
+@pytest.mark.parametrize("shard_index, expected, unexpected", [["0", "shard step 1", "shard step 2"],
+                                                                ["1", "shard step 2", "shard step 1"]])
+def test_shards(docker_main_and_nonci, shard_index, expected, unexpected):
+    log = docker_main_and_nonci.run("""
+from universum.configuration_support import Variations
+
+configs = Variations([dict(name="Step 1", command=["echo", "shard step 1"]),
+                      dict(name="Step 2", command=["echo", "shard step 2"])])
+""", additional_parameters="--shard-count 2 --shard-index " + shard_index)
+    assert "executing 1 of 2 steps" in log
+    assert expected in log
+    assert unexpected not in log
+    assert "Build result is saved to be reported together with other shards" in log
+
+
 def test_minimal_git(docker_main_with_vcs):
     log = docker_main_with_vcs.run("""
 from universum.configuration_support import Variations
@@ -0,0 +1,96 @@
+# pylint: disable = redefined-outer-name
+
+import json
+
+import pytest
+
+from universum import __main__
+from universum.lib import gravity
+from universum.merge_reports import MergeReports
+from universum.modules.reporter import ReportObserver
+from . import default_args
+
+
+class RecordingObserver(ReportObserver):
+    def __init__(self):
+        self.results = []
+        self.code_reports = []
+
+    def get_review_link(self):
+        return ""
+
+    def report_start(self, report_text):
+        pass
+
+    def report_result(self, result, report_text=None, no_vote=False):
+        self.results.append((result, report_text))
+
+    def code_report_to_review(self, report):
+        self.code_reports.append(report)
+
+
+def make_step(name, status="Success"):
+    return dict(name=name, status=status, children=[])
+
+
+def make_shard_report(steps, step_indexes, artifacts=None, code_report=None, durations=None):
+    return dict(blocks=[dict(name="Executing build steps", status="Success", children=steps)],
+                artifacts=artifacts or [], code_report=code_report or {}, durations=durations or {},
+                step_indexes=step_indexes)
+
+
+@pytest.fixture()
+def merge_reports(tmpdir):
+    observer = RecordingObserver()
+
+    class ObservedMergeReports(MergeReports):
+        def __init__(self, *args, **kwargs):
+            super(ObservedMergeReports, self).__init__(*args, **kwargs)
+            self.reporter.observers.append(observer)
+
+    def run(*reports):
+        paths = []
+        for index, report in enumerate(reports):
+            path = tmpdir.join(f"SHARD_REPORT_{index}.json")
+            if report is not None:
+                path.write(json.dumps(report))
+            paths.append(str(path))
+
+        argument_parser = default_args.ArgParserWithDefault()
+        argument_parser.set_defaults(main_class=ObservedMergeReports)
+        gravity.define_arguments_recursive(ObservedMergeReports, argument_parser)
+        settings = argument_parser.parse_args(paths)
+        settings.Output.type = "term"
+        settings.Vcs.type = "none"
+        settings.LocalMainVcs.source_dir = str(tmpdir)
+        settings.StepDurations.durations_file = str(tmpdir.join("durations.json"))
+        return __main__.run(settings)
+
+    run.observer = observer
+    run.durations_file = tmpdir.join("durations.json")
+    return run
+
+
+def test_merge_shard_reports(merge_reports):
+    first = make_shard_report([make_step(" [ 1/2 ] First"), make_step(" [ 2/2 ] Third", "Failed")], [0, 2],
+                              artifacts=["first.txt"], code_report={"first.py": [dict(line=1, message="issue")]},
+                              durations={"First": 1.5, "Third": 2.0})
+    second = make_shard_report([make_step(" [ 1/1 ] Second")], [1], artifacts=["second.txt"],
+                               durations={"Second": 3.0})
+
+    assert merge_reports(first, second) == 0
+
+    [(is_successful, text)] = merge_reports.observer.results
+    assert not is_successful
+    steps = [line.strip() for line in text.splitlines() if "] " in line]
+    assert steps == ["1.1.  [ 1/3 ] First - Success", "1.2.  [ 2/3 ] Second - Success", "1.3.  [ 3/3 ] Third - Failed"]
+    assert "* first.txt" in text
+    assert "* second.txt" in text
+    assert merge_reports.observer.code_reports == [{"first.py": [dict(line=1, message="issue")]}]
+    assert json.loads(merge_reports.durations_file.read()) == {"First": 1.5, "Second": 3.0, "Third": 2.0}
+
+
+def test_merge_missing_shard_report(merge_reports):
+    assert merge_reports(make_shard_report([make_step(" [ 1/1 ] First")], [0]), None) == 1
+    assert not merge_reports.observer.results
+    assert not merge_reports.durations_file.exists()
@@ -1,3 +1,9 @@
+import os
+
+from universum import nonci
+from universum.lib import gravity
+from . import default_args
+
 config = """
 from universum.configuration_support import Variations
 
@@ -68,3 +74,117 @@ configs = Variations([dict(name="test_step",
 def test_custom_artifact_dir(docker_nonci):
     docker_nonci.run(config, additional_parameters='-ad ' + '/my/artifacts/')
     docker_nonci.environment.assert_successful_execution("test -f /my/artifacts/test_nonci.txt")
+
+
+def test_compressed_step_logs(docker_nonci):
+    cwd = docker_nonci.local.root_directory.strpath
+    docker_nonci.project_root = None
+    log = docker_nonci.run(config.format(cwd), additional_parameters='-lo file --log-compression gzip', workdir=cwd)
+    assert f"Adding file {cwd}/artifacts/test_step_log.txt.gz to artifacts" in log
+
+    step_log = docker_nonci.environment.assert_successful_execution(f"zcat {cwd}/artifacts/test_step_log.txt.gz")
+    assert f"pwd:[{cwd}]" in step_log
+    index = docker_nonci.environment.assert_successful_execution(
+        f"cat {cwd}/artifacts/test_step_log.txt.gz.index.json")
+    assert '"compression": "gzip"' in index
+
+
+watched_config = """
+from universum.configuration_support import Variations
+
+def record(name):
+    return ["bash", "-c", f"echo {name} >> '{record_path}'"]
+
+configs = Variations([dict(name="first", command=record("first"), cache_inputs=["first.txt"]),
+                      dict(name="second", command=record("second"), cache_inputs=["src"]),
+                      dict(name="dependent", command=record("dependent"), cache_inputs=[], depends_on=["second"])])
+"""
+
+
+class WatchedProject:
+    def __init__(self, tmpdir, config=watched_config):
+        self.record_path = tmpdir.join("record.txt")
+        self.root = tmpdir.mkdir("project")
+        self.root.join("first.txt").write("first")
+        self.root.mkdir("src").join("second.txt").write("second")
+        self.root.join("unrelated.txt").write("unrelated")
+        self.config = self.root.join("configs.py")
+        self.config.write(f"record_path = '{self.record_path}'\n" + config)
+
+        argument_parser = default_args.ArgParserWithDefault()
+        argument_parser.set_defaults(main_class=nonci.Nonci)
+        gravity.define_arguments_recursive(nonci.Nonci, argument_parser)
+        settings = argument_parser.parse_args([])
+        settings.Launcher.config_path = str(self.config)
+        settings.ProjectDirectory.project_root = str(self.root)
+        settings.ArtifactCollector.artifact_dir = str(tmpdir.join("artifacts"))
+        settings.Output.type = "term"
+        self.nonci = gravity.construct_component(nonci.Nonci, settings)
+        self.nonci.execute()
+        self.snapshot = self.nonci.take_snapshot()
+
+    def rerun(self):
+        """
+        :return: names of the steps executed again, and whether anything was executed
+        """
+        self.record_path.write("")
+        new_snapshot = self.nonci.take_snapshot()
+        executed = self.nonci.rerun(nonci.get_changed_paths(self.snapshot, new_snapshot))
+        self.snapshot = self.nonci.take_snapshot()
+        return self.record_path.read().split(), executed
+
+
+def touch(path):
+    stat = os.stat(str(path))
+    os.utime(str(path), ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+
+
+def test_watch_reruns_affected_steps(tmpdir):
+    project = WatchedProject(tmpdir)
+    assert project.record_path.read().split() == ["first", "second", "dependent"]
+
+    project.root.join("first.txt").write("changed")
+    assert project.rerun() == (["first"], True)
+
+    # Changes in directories listed in 'cache_inputs' affect the steps depending on them as well
+    touch(project.root.join("src", "second.txt"))
+    assert project.rerun() == (["second", "dependent"], True)
+
+
+def test_watch_matches_input_patterns(tmpdir):
+    project = WatchedProject(tmpdir, watched_config.replace('cache_inputs=["src"]', 'cache_inputs=["src/**/*.txt"]'))
+    # Recursive wildcard matches the files in the directory itself as well
+    project.root.join("src", "second.txt").write("changed")
+    assert project.rerun() == (["second", "dependent"], True)
+    project.root.join("src", "second.txt").remove()
+    assert project.rerun() == (["second", "dependent"], True)
+    project.root.join("src").mkdir("nested").join("notes.md").write("notes")
+    assert project.rerun() == ([], False)
+
+
+def test_watch_ignores_unrelated_changes(tmpdir):
+    project = WatchedProject(tmpdir)
+    project.root.join("unrelated.txt").write("changed")
+    assert project.rerun() == ([], False)
+    # Files in artifact directory and hidden directories are not watched
+    project.root.mkdir(".hidden").join("file.txt").write("text")
+    assert nonci.get_changed_paths(project.snapshot, project.nonci.take_snapshot()) == set()
+
+
+def test_watch_reprocesses_changed_config(tmpdir):
+    project = WatchedProject(tmpdir)
+    project.config.write(project.config.read().replace('dict(name="first"', 'dict(name="renamed"'))
+    touch(project.config)
+    assert project.rerun() == (["first", "second", "dependent"], True)
+    assert [step["name"] for step in project.nonci.step_plan.get_steps()][0] == "renamed"
+
+
+def test_watch_rewrites_step_logs(tmpdir):
+    project = WatchedProject(tmpdir)
+    project.nonci.output = "file"
+    project.root.join("first.txt").write("changed")
+    project.rerun()
+    project.root.join("first.txt").write("changed again")
+    project.rerun()
+    log = tmpdir.join("artifacts", "first_log.txt").read()
+    assert log.count("$ ") == 1
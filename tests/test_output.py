@@ -0,0 +1,114 @@
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from universum.lib.gravity import construct_component
+from universum.modules.output.buffered_writer import BufferedWriter, stdout_writer
+from universum.modules.output.output import Output, OutputRecorder
+from universum.modules.output.terminal_based_output import TerminalBasedOutput
+
+
+class CountingStream(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.write_count = 0
+
+    def write(self, text):
+        self.write_count += 1
+        return super().write(text)
+
+
+def test_buffered_writer_keeps_order():
+    stream = CountingStream()
+    # With latency longer than the test, the text is only written when there is enough of it, and on closing
+    writer = BufferedWriter(lambda: stream, latency=600, size_limit=4096)
+
+    def write_lines(thread_index):
+        for line_index in range(10000):
+            writer.write(f"{thread_index} {line_index}\n")
+
+    threads = [threading.Thread(target=write_lines, args=(index,)) for index in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    writer.close()
+
+    lines = [line.split() for line in stream.getvalue().splitlines()]
+    assert len(lines) == 40000
+    for thread_index in range(4):
+        assert [int(line) for thread, line in lines if int(thread) == thread_index] == list(range(10000))
+    assert stream.write_count <= len(stream.getvalue()) // 4096 + 1
+
+
+def test_buffered_writer_latency():
+    stream = CountingStream()
+    writer = BufferedWriter(lambda: stream, latency=0.05)
+    writer.write("first line\n")
+    for _ in range(100):
+        if stream.getvalue():
+            break
+        time.sleep(0.01)
+    assert stream.getvalue() == "first line\n"
+
+    writer.write("second line\n")
+    writer.flush()
+    assert stream.getvalue() == "first line\nsecond line\n"
+    writer.close()
+
+
+def test_terminal_output_format(capsys):
+    output = construct_component(TerminalBasedOutput, argparse.Namespace())
+    output.open_block("1.", "Block")
+    output.log("first line\nsecond line")
+    output.log_shell_output("")
+    output.close_block("1.", "Block", "Failed")
+    stdout_writer.flush()
+    assert capsys.readouterr().out == "1. \033[1;34mBlock\033[00m\n" \
+                                      " |   ==> first line\n" \
+                                      " |   second line\n" \
+                                      " └ \033[1;31m[Failed]\033[00m\n" \
+                                      "\n"
+
+
+def test_event_log(tmp_path, capsys):
+    event_log = tmp_path / "events.jsonl"
+    output = construct_component(Output, argparse.Namespace(
+        Output=argparse.Namespace(type="term", event_log=str(event_log))))
+    output.open_block("1.", "Step")
+    output.log_external_command("echo text")
+    output.log_shell_output("text")
+    with output.postponed(OutputRecorder()) as recorder:
+        output.log_stderr("postponed error")
+    output.replay(recorder)
+    output.close_block("1.", "Step", "Failed")
+    output.flush()
+    capsys.readouterr()
+
+    events = [json.loads(line) for line in event_log.read_text().splitlines()]
+    assert [(event.pop("event"), event.pop("time") > 0) for event in events] == \
+           [("open_block", True), ("command", True), ("stderr", True), ("close_block", True)]
+    assert events == [{"number": "1.", "name": "Step"}, {"text": "echo text"}, {"text": "postponed error"},
+                      {"number": "1.", "name": "Step", "status": "Failed"}]
+
+
+def test_event_log_closed_on_abort(tmp_path):
+    event_log = tmp_path / "events.jsonl"
+    script = f"""
+import argparse
+from universum.lib.gravity import construct_component
+from universum.modules.output.output import Output
+
+output = construct_component(Output, argparse.Namespace(
+    Output=argparse.Namespace(type="term", event_log={str(event_log)!r})))
+output.log("last message")
+raise KeyboardInterrupt
+"""
+    subprocess.run([sys.executable, "-c", script], cwd=os.path.dirname(os.path.dirname(__file__)),
+                   capture_output=True, check=False)
+    assert [json.loads(line)["text"] for line in event_log.read_text().splitlines()] == ["last message"]
@@ -40,3 +40,18 @@ def test_steps_filter_few_flags(docker_main_and_nonci):
         assert log_str in console_out_log
 
     assert "step 1" not in console_out_log
+
+
+@pytest.mark.parametrize("filter_type, filters, expected_logs, unexpected_logs", (
+        ["glob", "parent 1 step ?:!*2", ["parent 1 step 1"], ["parent 2", "step 2"]],
+        ["glob", "step*", [], ["parent 1", "parent 2"]],
+        ["regex", "^parent [12] step 1$", ["parent 1 step 1", "parent 2 step 1"], ["step 2"]],
+        ["regex", "2$:!^parent 1", ["parent 2 step 2"], ["parent 1", "step 1"]],))
+def test_steps_filter_types(docker_main_and_nonci, filter_type, filters, expected_logs, unexpected_logs):
+    console_out_log = docker_main_and_nonci.run(config, additional_parameters="-o console --filter-type={} -f='{}'"
+                                                .format(filter_type, filters))
+    for log_str in expected_logs:
+        assert log_str in console_out_log
+
+    for log_str in unexpected_logs:
+        assert log_str not in console_out_log
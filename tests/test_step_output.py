@@ -0,0 +1,100 @@
+import codecs
+import os
+import sys
+import time
+
+import pytest
+
+from universum.lib.step_output import PostponedOutput
+from universum.modules.launcher import Step
+
+LINE_COUNT = 200000
+LINE_TEXT = "line number {} of step output, with some payload to make it look like a real build log"
+
+# Timings depend on the machine load, so benchmarks only print them, and are only run on demand
+benchmark = pytest.mark.skipif(not os.environ.get("UNIVERSUM_BENCHMARKS"),
+                               reason="benchmarks are run only if UNIVERSUM_BENCHMARKS is set")
+
+
+class SilentOutput:
+    def __getattr__(self, name):
+        return lambda *args: None
+
+
+class CountingLog:
+    """
+    Log file counting the writes of step output to it; if `chunked`, provides binary stream of the file,
+    making Step write the output in chunks; otherwise Step falls back to the line by line output handling
+    """
+    def __init__(self, log_file, chunked):
+        self.log_file = log_file
+        self.write_count = 0
+        if chunked:
+            self.stream = self
+
+    def write(self, data):
+        self.write_count += 1
+        if isinstance(data, bytes):
+            self.log_file.stream.write(data)
+        else:
+            self.log_file.write(data)
+
+    def close(self):
+        self.log_file.close()
+
+
+def fail_block(line=None):
+    raise AssertionError(line)
+
+
+def run_step(log_path, chunked):
+    item = dict(name="Verbose step",
+                command=[sys.executable, "-c",
+                         f"for i in range({LINE_COUNT}): print({LINE_TEXT!r}.format(i))"])
+    log_file = CountingLog(codecs.open(log_path, "a", encoding="utf-8"), chunked)
+    step = Step(item, SilentOutput(), fail_block, None, log_file, None, {})
+    # Process time includes output handling in all threads of current process, but not the step itself
+    started = time.process_time()
+    step.start(is_background=False)
+    step.finalize()
+    return log_file.write_count, time.process_time() - started
+
+
+def test_chunked_log_writes(tmpdir):
+    line_by_line_log = tmpdir.join("line_by_line.txt")
+    chunked_log = tmpdir.join("chunked.txt")
+
+    line_by_line_writes, _ = run_step(str(line_by_line_log), chunked=False)
+    chunked_writes, _ = run_step(str(chunked_log), chunked=True)
+
+    lines = chunked_log.read().splitlines()
+    assert lines[1:LINE_COUNT + 1] == [LINE_TEXT.format(i) for i in range(LINE_COUNT)]
+    assert line_by_line_log.read().splitlines()[1:] == chunked_log.read().splitlines()[1:]
+    # Both logs also contain the command line and the empty line written on step finalizing
+    assert line_by_line_writes == LINE_COUNT + 2
+    # Output is read in chunks of fixed size, each of them is written at once, and the last one might be incomplete
+    output_size = sum(len(line) + 1 for line in lines[1:LINE_COUNT + 1])
+    assert chunked_writes <= output_size // Step.log_chunk_size + 1 + 2
+
+
+@benchmark
+def test_chunked_log_throughput(tmpdir):
+    chunked_log = tmpdir.join("chunked.txt")
+    _, line_by_line_time = run_step(str(tmpdir.join("line_by_line.txt")), chunked=False)
+    _, chunked_time = run_step(str(chunked_log), chunked=True)
+    print(f"\nCPU time spent on {chunked_log.size() / 1024 ** 2:.1f} MB of output: "
+          f"{line_by_line_time:.2f} s line by line, {chunked_time:.2f} s chunked")
+
+
+def test_postponed_output_spilling():
+    output = PostponedOutput(size_limit=100)
+    expected = [(i % 3 == 0, f"line {i}\r with carriage return") for i in range(1000)]
+    for is_stderr, line in expected:
+        output.append(is_stderr, line)
+
+    assert output.file is not None
+    assert not output.lines
+    assert list(output) == expected
+
+    output.close()
+    assert not list(output)
@@ -7,6 +7,7 @@ from universum import __version__, __title__
 from universum.api import Api
 from universum.main import Main
 from universum.github_handler import GithubHandler
+from universum.merge_reports import MergeReports
 from universum.nonci import Nonci
 from universum.poll import Poll
 from universum.submit import Submit
@@ -23,7 +24,7 @@ def define_arguments():
     define_arguments_recursive(Main, parser)
 
     subparsers = parser.add_subparsers(title="Additional commands",
-                                       metavar="{poll,submit,nonci,github-handler}",
+                                       metavar="{poll,submit,nonci,github-handler,merge-reports}",
                                        help="Use 'universum <subcommand> --help' for more info")
 
     def define_command(klass, command):
@@ -37,6 +38,7 @@ def define_arguments():
     define_command(Submit, "submit")
     define_command(Nonci, "nonci")
     define_command(GithubHandler, "github-handler")
+    define_command(MergeReports, "merge-reports")
 
     return parser
 
@@ -66,6 +68,7 @@ def run(settings):
         result = 2
 
     main_module.out.log("{} {} finished execution".format(__title__, __version__))
+    main_module.out.flush()
     return result
 
 
@@ -1,9 +1,14 @@
+import collections.abc
 import copy
+import io
+import json
 import os
+import sys
 import six
 
 __all__ = [
     "Variations",
+    "StepConfig",
     "combine",
     "set_project_root",
     "get_project_root"
@@ -37,12 +42,7 @@ def combine(dictionary_a, dictionary_b):
         if key in skip_attributes:
             continue
         if key in dictionary_b:
-            if isinstance(dictionary_a[key], dict) and isinstance(dictionary_b[key], dict):
-                new_value = dictionary_a[key].copy()
-                new_value.update(dictionary_b[key])
-                result[key] = new_value
-            else:
-                result[key] = dictionary_a[key] + dictionary_b[key]
+            result[key] = combine_values(dictionary_a[key], dictionary_b[key])
         else:
             result[key] = dictionary_a[key]
 
@@ -55,6 +55,141 @@ def combine(dictionary_a, dictionary_b):
     return result
 
 
+def combine_values(value_a, value_b):
+    """
+    Combine two values of the same configuration key: dictionaries are merged, other values are added
+
+    >>> combine_values(["make"], ["all"]), combine_values({"A": "1"}, {"B": "2"})
+    (['make', 'all'], {'A': '1', 'B': '2'})
+    """
+    if isinstance(value_a, dict) and isinstance(value_b, dict):
+        result = value_a.copy()
+        result.update(value_b)
+        return result
+    return value_a + value_b
+
+
+class _KeyLayout:
+    """
+    Keys of :class:`StepConfig` objects in the order of adding. Layouts are shared: adding a key
+    to the same layout always returns the same object, so all configurations with the same keys
+    refer to one tuple of interned keys
+    """
+    __slots__ = ("keys", "indexes", "_extended")
+
+    def __init__(self, keys):
+        self.keys = keys
+        self.indexes = {key: index for index, key in enumerate(keys)}
+        self._extended = {}
+
+    def add(self, key):
+        result = self._extended.get(key)
+        if result is None:
+            result = _KeyLayout(self.keys + (sys.intern(key) if isinstance(key, str) else key,))
+            self._extended[key] = result
+        return result
+
+
+class StepConfig(collections.abc.MutableMapping):
+    """
+    Configuration of a single step, combined with all its parents. Instead of a dictionary of its own,
+    the object only stores a tuple of values and a reference to the layout of keys, shared by all
+    configurations having the same keys. Otherwise it is used the same way as a dictionary:
+
+    >>> config = StepConfig.create(dict(name="Run ", command=["./run.sh"]), dict(name="tests", my_key=1))
+    >>> config
+    {'name': 'Run tests', 'command': ['./run.sh'], 'my_key': 1}
+    >>> config["name"], config.get("critical", False), "my_key" in config, "artifacts" in config
+    ('Run tests', False, True, False)
+    >>> config == dict(name="Run tests", command=["./run.sh"], my_key=1)
+    True
+    """
+
+    __slots__ = ("_layout", "_values")
+    _empty_layout = _KeyLayout(())
+
+    def __init__(self, configuration=None, _base=None):
+        # `_base` is the layout of keys and the values of another object to start with; values are stored
+        # in a tuple, so they are shared with that object until any of them is changed
+        self._layout, self._values = _base or (self._empty_layout, ())
+        if configuration is not None:
+            self._add_values(configuration)
+
+    @classmethod
+    def create(cls, parent, configuration):
+        """
+        :param parent: combined configuration of the parent group, or None for top level configurations
+        :param configuration: configuration to combine with `parent` by the same rules as :func:`combine()` uses
+        :return: new :class:`StepConfig` object
+        """
+        if not isinstance(parent, StepConfig):
+            parent = cls(parent)
+        return parent.combined(configuration)
+
+    def combined(self, configuration):
+        """
+        :return: new :class:`StepConfig` object, combining this one with `configuration`
+        """
+        return type(self)(configuration, _base=(self._layout, self._values))
+
+    def _add_values(self, configuration):
+        layout = self._layout
+        values = list(self._values)
+        for key in configuration:
+            if key in skip_attributes:
+                continue
+            index = layout.indexes.get(key)
+            if index is None:
+                layout = layout.add(key)
+                values.append(configuration[key])
+            else:
+                values[index] = combine_values(values[index], configuration[key])
+        self._layout = layout
+        self._values = tuple(values)
+
+    def __getitem__(self, key):
+        return self._values[self._layout.indexes[key]]
+
+    def get(self, key, default=None):
+        index = self._layout.indexes.get(key)
+        return default if index is None else self._values[index]
+
+    def __setitem__(self, key, value):
+        index = self._layout.indexes.get(key)
+        if index is None:
+            self._layout = self._layout.add(key)
+            self._values += (value,)
+        else:
+            self._values = self._values[:index] + (value,) + self._values[index + 1:]
+
+    def __delitem__(self, key):
+        if key not in self._layout.indexes:
+            raise KeyError(key)
+        remaining = [(name, value) for name, value in zip(self._layout.keys, self._values) if name != key]
+        self._layout = self._empty_layout
+        self._values = ()
+        self._add_values(dict(remaining))
+
+    def __contains__(self, key):
+        return key in self._layout.indexes
+
+    def __iter__(self):
+        return iter(self._layout.keys)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def __reduce__(self):
+        # Key layouts are shared, so they are not copied or pickled along with the values
+        return StepConfig, (dict(self),)
+
+    def copy(self):
+        return self.combined({})
+
+
 def stringify(obj):
     result = False
     command_line = ""
@@ -134,26 +269,30 @@ class Variations(list):
         The resulting object is created by combining every `self` list member with
         every `other` list member using :func:`.combine()` function.
 
+        Configurations are not combined right away: a copy of `other` becomes the children of every `self`
+        list member, so the size of the result does not grow with the number of combinations.
+        The combined configurations are only created by :meth:`all()`. The values of both operands are copied,
+        so changing the result does not affect the operands; but the children are shared by all the products,
+        so changing them affects all the products at once.
+
+        >>> v1, v2 = Variations([dict(name="a"), dict(name="b")]), Variations([dict(name="1", command=["x"])])
+        >>> v = v1 * v2
+        >>> v[0]["children"] is v[1]["children"]
+        True
+        >>> [item["name"] for item in v.all()]
+        ['a1', 'b1']
+        >>> v[0]["children"][0]["command"].append("y")
+        >>> v2
+        [{'name': '1', 'command': ['x']}]
+
         :param other: `Variations` object to be multiplied to `self`
         :return: new `Variations` object, consisting of the list of combined configurations
         """
 
         if isinstance(other, six.integer_types):
-            result_list = list.__mul__(list(self), other)
-        else:
-            result_list = []
-            for obj_a in self:
-                obj_a_copy = copy.deepcopy(obj_a)
-                if "children" in obj_a:
-                    obj_a_copy["children"] = obj_a["children"] * other
-                else:
-                    obj_a_copy["children"] = copy.deepcopy(other)
-                obj_a_copy["skip_numbering_level"] = len(self) <= 1
-
-                result_list.append(obj_a_copy)
-
-        result = Variations(result_list)
-        return result
+            return Variations(list.__mul__(list(self), other))
+        # Copied once, as it is shared by all the products
+        return _add_children(self, copy.deepcopy(other))
 
     def all(self):
         """
@@ -161,17 +300,24 @@ class Variations(list):
 
         :return: iterable for all dictionary objects in :class:`.Variations` list
         """
-        for obj_a in self:
+        # Only the resulting configurations are copied, so that changing them does not affect the source ones
+        for obj_a in self.iterate_leaves():
+            yield copy.deepcopy(obj_a)
 
-            obj_a_copy = copy.deepcopy(obj_a)
-
-            if "children" in obj_a_copy:
-                for obj_b in obj_a_copy["children"].all():
-                    res = combine(obj_a_copy, obj_b)
+    def iterate_leaves(self, parent=None):
+        """
+        Same as :meth:`all()`, but without copying: configurations without children are returned as is,
+        and others are combined with their parents level by level
 
-                    yield res
+        :param parent: configuration to combine the list members with; None for no combining
+        :return: iterable for all dictionary objects in :class:`.Variations` list
+        """
+        for obj_a in self:
+            item = obj_a if parent is None else combine(parent, obj_a)
+            if "children" in obj_a:
+                yield from obj_a["children"].iterate_leaves(item)
             else:
-                yield obj_a_copy
+                yield item
 
     def dump(self, produce_string_command=True):
         """
@@ -180,24 +326,48 @@ class Variations(list):
         :param produce_string_command: if set to False, prints "command" as list instead of string
         :return: a user-friendly string representation of all configurations list
         """
+        result = io.StringIO()
+        self.dump_to(result, produce_string_command)
+        return result.getvalue()
+
+    def dump_to(self, stream, produce_string_command=True, json_lines=False):
+        """
+        Same as :meth:`dump()`, but the configurations are written to `stream` one by one as they are generated,
+        so the whole text is not kept in memory.
+
+        >>> import sys
+        >>> Variations([dict(name="Build", command=["make", "all"])]).dump_to(sys.stdout, json_lines=True)
+        {"name": "Build", "command": ["make", "all"]}
+
+        :param stream: file-like object to write the text to
+        :param produce_string_command: if set to False, prints "command" as list instead of string
+        :param json_lines: if set to True, each configuration is written as a JSON object on a separate line,
+            with "command" always being a list; values not supported by JSON are written as strings
+        """
+        if json_lines:
+            for obj in self.iterate_leaves():
+                stream.write(json.dumps(obj, default=str) + "\n")
+            return
+
         space_found = False
-        result = "["
-        for obj in self.all():
-            if len(result) > 1:
-                result += ",\n"
+        stream.write("[")
+        for index, obj in enumerate(self.iterate_leaves()):
+            if index:
+                stream.write(",\n")
 
             if produce_string_command and "command" in obj:
+                # Leaves are not copied, so the original configuration should not be changed
+                obj = dict(obj)
                 if stringify(obj):
                     space_found = True
 
-            result += str(obj)
+            stream.write(str(obj))
 
-        result += "]"
+        stream.write("]")
 
         if space_found:
-            result += "\n\nWARNING! We have detected space character within some of the command-line parameters.\n"
-            result += "Please make sure you are not trying to pass two or more parameters as one."
-        return result
+            stream.write("\n\nWARNING! We have detected space character within some of the command-line parameters.\n")
+            stream.write("Please make sure you are not trying to pass two or more parameters as one.")
 
     def filter(self, checker, parent=None):
         """
@@ -205,6 +375,10 @@ class Variations(list):
         It uses provided `checker` to find all the configurations that pass the check,
         removing those not matching conditions.
 
+        Configurations are not copied: the groups with all members passing the check are shared
+        with the original object, so several conditions should better be checked by one `checker`
+        than by several calls of this function.
+
         :param checker: a function that returns `True` if configuration passes the filter and `False` otherwise
         :param parent: an inner parameter for recursive usage; should be None when function is called from outside
         :return: new `Variations` object without configurations not matching `checker` conditions
@@ -216,24 +390,27 @@ class Variations(list):
         filtered_variations = []
 
         for obj_a in self:
-            item = combine(parent, copy.deepcopy(obj_a))
+            item = combine(parent, obj_a)
 
             if "children" in obj_a:
                 active_children = obj_a["children"].filter(checker, item)
-                if active_children:
-                    if len(active_children) == 1:
-                        obj_a_copy = combine(obj_a, active_children[0])
-                        if "children" in active_children[0]:
-                            obj_a_copy["children"] = active_children[0]["children"]
-                        obj_a_copy["critical"] = \
-                            obj_a.get("critical", False) or active_children[0].get("critical", False)
-                    else:
-                        obj_a_copy = copy.deepcopy(obj_a)
-                        obj_a_copy["children"] = active_children
-                    filtered_variations.append(obj_a_copy)
-            else:
-                if checker(item):
-                    filtered_variations.append(copy.deepcopy(obj_a))
+                if not active_children:
+                    continue
+                if len(active_children) == 1:
+                    obj_a_copy = combine(obj_a, active_children[0])
+                    if "children" in active_children[0]:
+                        obj_a_copy["children"] = active_children[0]["children"]
+                    obj_a_copy["critical"] = \
+                        obj_a.get("critical", False) or active_children[0].get("critical", False)
+                elif all(child is original for child, original in zip(active_children, obj_a["children"])) \
+                        and len(active_children) == len(obj_a["children"]):
+                    obj_a_copy = obj_a
+                else:
+                    obj_a_copy = dict(obj_a)
+                    obj_a_copy["children"] = active_children
+                filtered_variations.append(obj_a_copy)
+            elif checker(item):
+                filtered_variations.append(obj_a)
 
         return Variations(filtered_variations)
 
@@ -241,6 +418,24 @@ class Variations(list):
 global_project_root = os.getcwd()
 
 
+def _add_children(variations, children):
+    """
+    :return: copy of `variations` with `children` added to the deepest level of every list member
+    """
+    result_list = []
+    for obj_a in variations:
+        obj_a_copy = {key: copy.deepcopy(value) for key, value in obj_a.items() if key != "children"}
+        if "children" in obj_a:
+            obj_a_copy["children"] = _add_children(obj_a["children"], children)
+        else:
+            obj_a_copy["children"] = children
+        obj_a_copy["skip_numbering_level"] = len(variations) <= 1
+
+        result_list.append(obj_a_copy)
+
+    return Variations(result_list)
+
+
 def set_project_root(project_root):
     """
     Function to be called from main script; not supposed to be used in configuration file.
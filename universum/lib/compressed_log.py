@@ -0,0 +1,174 @@
+"""
+Log files compressed in a separate thread, as a sequence of independently compressed blocks.
+
+Concatenated gzip members (or zstd frames) form a valid gzip (or zstd) file, so the log can be read
+by standard tools as a whole. In addition, an index of the blocks is stored next to the log, so that
+a viewer can decompress only the block containing the required line or offset.
+"""
+
+import gzip
+import importlib
+import json
+import queue
+import threading
+
+__all__ = [
+    "compressions",
+    "CompressedLogFile",
+    "make_compressor",
+    "read_block"
+]
+
+# File name extensions by supported compression types
+compressions = {
+    "gzip": ".gz",
+    "zstd": ".zst"
+}
+
+
+def make_compressor(compression):
+    """
+    :return: function compressing bytes by the given compression type
+    """
+    if compression == "gzip":
+        return lambda data: gzip.compress(data, compresslevel=6)
+    if compression == "zstd":
+        try:
+            zstandard = importlib.import_module("zstandard")
+        except ImportError:
+            text = "Error: using 'zstd' log compression requires Python package 'zstandard' " \
+                   "to be installed to the system"
+            raise ImportError(text)
+        return zstandard.ZstdCompressor(level=3).compress
+    raise ValueError(f"Unknown compression type '{compression}'")
+
+
+class _CompressedStream:
+    """
+    Binary stream splitting the written data into blocks, that are compressed and written to the file
+    by a separate thread
+    """
+
+    def __init__(self, path, index_path, compression, block_size, queue_size):
+        self.compress = make_compressor(compression)
+        self.compression = compression
+        self.file = open(path, "wb")
+        self.index_path = index_path
+        self.block_size = block_size
+        self.blocks = []  # index entries of the blocks already written to the file
+
+        self._lock = threading.Lock()
+        self._pending = []
+        self._pending_size = 0
+        self._uncompressed_offset = 0
+        self._line_count = 0
+        self._error = None
+        # Limited, so that the blocks are not collected in memory faster than they are compressed
+        self._queue = queue.Queue(queue_size)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self, data):
+        with self._lock:
+            self._pending.append(data)
+            self._pending_size += len(data)
+            if self._pending_size >= self.block_size:
+                self._split_block()
+
+    def _split_block(self, final=False):
+        data = b"".join(self._pending)
+        # Blocks start with the beginning of a line if possible, for a viewer to show them separately
+        end = len(data) if final else data.rfind(b"\n") + 1
+        if not end:
+            end = len(data)
+        block, rest = data[:end], data[end:]
+        self._pending = [rest] if rest else []
+        self._pending_size = len(rest)
+        if block:
+            self._queue.put((block, self._uncompressed_offset, self._line_count))
+            self._uncompressed_offset += len(block)
+            self._line_count += block.count(b"\n")
+
+    def _run(self):
+        offset = 0
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            block, uncompressed_offset, first_line = item
+            if self._error is not None:
+                continue
+            try:
+                compressed = self.compress(block)
+                self.file.write(compressed)
+            except Exception as e:  # pylint: disable = broad-except
+                self._error = e
+                continue
+            self.blocks.append(dict(offset=offset, size=len(compressed), uncompressed_offset=uncompressed_offset,
+                                    uncompressed_size=len(block), first_line=first_line))
+            offset += len(compressed)
+
+    def close(self):
+        with self._lock:
+            self._split_block(final=True)
+        self._queue.put(None)
+        self._thread.join()
+        self.file.close()
+        if self._error is not None:
+            raise self._error
+        index = dict(compression=self.compression, line_count=self._line_count,
+                     uncompressed_size=self._uncompressed_offset, blocks=self.blocks)
+        with open(self.index_path, "w", encoding="utf-8") as index_file:
+            json.dump(index, index_file)
+
+
+class CompressedLogFile:
+    """
+    Text file, compressed as a sequence of blocks of about `block_size` bytes; the index of the blocks is written
+    to `index_path` on closing. Like the file objects returned by :func:`codecs.open`, writes text to the file,
+    and provides underlying binary stream in `stream` attribute
+
+    >>> import tempfile, os
+    >>> directory = tempfile.mkdtemp()
+    >>> log = CompressedLogFile(os.path.join(directory, "log.gz"), os.path.join(directory, "log.json"),
+    ...                         "gzip", block_size=10)
+    >>> log.write("first line\\n")
+    >>> log.stream.write(b"second line\\nthird ")
+    >>> log.write("line\\n")
+    >>> log.close()
+    >>> with gzip.open(os.path.join(directory, "log.gz"), "rt") as log_file:
+    ...     log_file.read()
+    'first line\\nsecond line\\nthird line\\n'
+    >>> with open(os.path.join(directory, "log.json")) as index_file:
+    ...     index = json.load(index_file)
+    >>> [(block["first_line"], block["uncompressed_offset"]) for block in index["blocks"]]
+    [(0, 0), (1, 11), (2, 23)]
+    >>> read_block(os.path.join(directory, "log.gz"), index, 2)
+    b'third line\\n'
+    """
+
+    def __init__(self, path, index_path, compression, block_size=1024 * 1024, queue_size=4):
+        self.stream = _CompressedStream(path, index_path, compression, block_size, queue_size)
+
+    def write(self, text):
+        self.stream.write(text.encode("utf-8", errors="replace"))
+
+    def close(self):
+        self.stream.close()
+
+
+def read_block(path, index, number):
+    """
+    :param path: path to the compressed log
+    :param index: index of the log, as stored by :class:`CompressedLogFile`
+    :param number: number of the block to read
+    :return: decompressed contents of the block
+    """
+    block = index["blocks"][number]
+    with open(path, "rb") as log_file:
+        log_file.seek(block["offset"])
+        data = log_file.read(block["size"])
+    if index["compression"] == "gzip":
+        return gzip.decompress(data)
+    zstandard = importlib.import_module("zstandard")
+    return zstandard.ZstdDecompressor().decompress(data)
@@ -0,0 +1,110 @@
+"""
+Resource usage of the processes of steps, sampled from '/proc'.
+
+The processes of steps are waited for by 'sh' (or by the pool of Python interpreters), so their own
+resource usage is not available to Universum. Instead, each step is launched in a separate session,
+and all processes of this session are periodically found in '/proc'. The sum of their CPU time
+(including the time of their finished children) and RSS is taken, and the maximum of all the samples
+is reported. So the usage of the processes finished less than sampling interval ago is not counted,
+and the usage of steps finishing faster than that is not known at all.
+"""
+
+import os
+import threading
+import time
+
+__all__ = [
+    "SessionUsage",
+    "SessionUsageSampler",
+    "parse_process_stat"
+]
+
+
+def parse_process_stat(text):
+    """
+    Parse the contents of '/proc/<pid>/stat'
+
+    :return: session ID, CPU time of the process and its finished children in clock ticks, and RSS in pages
+
+    >>> parse_process_stat("42 (my (odd) cmd) S 1 42 40 0 -1 4194560 100 0 0 0 7 3 5 1 20 0 1 0 100 1000 25 0")
+    (40, 16, 25)
+    """
+    # Command name can contain spaces and brackets, so the fields are counted from its end
+    fields = text[text.rindex(")") + 2:].split()
+    return int(fields[3]), sum(int(value) for value in fields[11:15]), int(fields[21])
+
+
+class SessionUsage:
+    """
+    CPU time in seconds and peak RSS in megabytes of all the processes of the session; None if not known
+    """
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.cpu_time = None
+        self.max_rss = None
+
+    def update(self, cpu_time, rss):
+        self.cpu_time = cpu_time if self.cpu_time is None else max(self.cpu_time, cpu_time)
+        self.max_rss = rss if self.max_rss is None else max(self.max_rss, rss)
+
+
+class SessionUsageSampler:
+    # Time in seconds between the samples
+    interval = 0.1
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._thread = None
+
+    def start(self, session_id):
+        """
+        :return: :class:`SessionUsage` updated until passed to :meth:`finish`
+        """
+        usage = SessionUsage(session_id)
+        if not os.path.isdir("/proc"):
+            return usage
+        with self._lock:
+            self._sessions[session_id] = usage
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        return usage
+
+    def finish(self, usage):
+        with self._lock:
+            if self._sessions.get(usage.session_id) is usage:
+                del self._sessions[usage.session_id]
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._sessions:
+                    self._thread = None
+                    return
+                session_ids = set(self._sessions)
+            time.sleep(self.interval)
+            self._sample(session_ids)
+
+    def _sample(self, session_ids):
+        totals = {}
+        for entry in os.scandir("/proc"):
+            if not entry.name.isdigit():
+                continue
+            try:
+                with open(os.path.join(entry.path, "stat"), encoding="utf-8", errors="replace") as stat_file:
+                    session_id, ticks, pages = parse_process_stat(stat_file.read())
+            except (OSError, ValueError, IndexError):
+                # The process has already exited
+                continue
+            if session_id in session_ids:
+                total_ticks, total_pages = totals.get(session_id, (0, 0))
+                totals[session_id] = total_ticks + ticks, total_pages + pages
+
+        ticks_per_second = os.sysconf("SC_CLK_TCK")
+        page_size = os.sysconf("SC_PAGE_SIZE")
+        with self._lock:
+            for session_id, (ticks, pages) in totals.items():
+                usage = self._sessions.get(session_id)
+                if usage is not None:
+                    usage.update(ticks / ticks_per_second, pages * page_size / (1024 * 1024))
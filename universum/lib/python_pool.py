@@ -0,0 +1,337 @@
+"""
+Launching of Python steps in processes forked from a warm interpreter.
+
+This file is also executed by the target interpreter as a script to become such warm interpreter
+(see :func:`serve`), so it must only import standard library modules.
+"""
+
+import atexit
+import codecs
+import importlib
+import importlib.util
+import json
+import os
+import runpy
+import shutil
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import traceback
+import tty
+from multiprocessing.reduction import recvfds, sendfds
+
+__all__ = [
+    "PoolError",
+    "PythonPool",
+    "PooledProcess",
+    "parse_python_command"
+]
+
+CHUNK_SIZE = 64 * 1024
+
+
+class PoolError(Exception):
+    pass
+
+
+def parse_python_command(command):
+    """
+    Split the command launching Python into interpreter, run mode ('module' or 'path') and arguments
+
+    >>> parse_python_command(["python3", "-m", "pylint", "--version"])
+    ('python3', 'module', 'pylint', ['--version'])
+    >>> parse_python_command(["python3.7", "scripts/check.py"])
+    ('python3.7', 'path', 'scripts/check.py', [])
+    >>> parse_python_command(["python3", "-u", "-m", "pylint"])
+    Traceback (most recent call last):
+        ...
+    universum.lib.python_pool.PoolError: Only commands like 'python -m module [args]' or \
+'python script.py [args]' can be launched in Python pool
+    """
+    if len(command) >= 2 and os.path.basename(command[0]).startswith("python"):
+        if command[1] == "-m" and len(command) >= 3:
+            return command[0], "module", command[2], list(command[3:])
+        if not command[1].startswith("-"):
+            return command[0], "path", command[1], list(command[2:])
+    raise PoolError("Only commands like 'python -m module [args]' or 'python script.py [args]' "
+                    "can be launched in Python pool")
+
+
+def _send_message(sock, message):
+    data = json.dumps(message).encode("utf-8")
+    sock.sendall(struct.pack("!I", len(data)) + data)
+
+
+def _receive_exactly(sock, size):
+    result = b""
+    while len(result) < size:
+        chunk = sock.recv(size - len(result))
+        if not chunk:
+            raise EOFError()
+        result += chunk
+    return result
+
+
+def _receive_message(sock):
+    size = struct.unpack("!I", _receive_exactly(sock, 4))[0]
+    return json.loads(_receive_exactly(sock, size).decode("utf-8"))
+
+
+def _run_task(task, stdout_fd, stderr_fd, status_fd):
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    null_fd = os.open(os.devnull, os.O_RDONLY)
+    for source, target in ((null_fd, 0), (stdout_fd, 1), (stderr_fd, 2)):
+        os.dup2(source, target)
+        os.close(source)
+    os.set_inheritable(status_fd, False)
+    # Same as 'sh' does, to avoid translation of newlines to '\r\n'
+    tty.setraw(1)
+    sys.stdin = open(0, closefd=False)
+    sys.stdout = open(1, "w", buffering=1 if os.isatty(1) else -1, closefd=False)
+    sys.stderr = open(2, "w", buffering=1, errors="backslashreplace", closefd=False)
+
+    os.environ.clear()
+    os.environ.update(task["environment"])
+    os.chdir(task["directory"])
+    sys.argv = [task["target"]] + task["arguments"]
+
+    exit_code = 0
+    try:
+        if task["mode"] == "module":
+            sys.path[0] = os.getcwd()
+            runpy.run_module(task["target"], run_name="__main__", alter_sys=True)
+        else:
+            sys.path[0] = os.path.dirname(os.path.abspath(task["target"]))
+            runpy.run_path(task["target"], run_name="__main__")
+    except SystemExit as e:
+        if e.code is None:
+            exit_code = 0
+        elif isinstance(e.code, int):
+            exit_code = e.code
+        else:
+            sys.stderr.write(str(e.code) + "\n")
+            exit_code = 1
+    except BaseException:  # pylint: disable = broad-except
+        traceback.print_exc()
+        exit_code = 1
+
+    try:
+        atexit._run_exitfuncs()  # pylint: disable = protected-access
+        sys.stdout.flush()
+        sys.stderr.flush()
+    finally:
+        os.write(status_fd, str(exit_code).encode("ascii"))
+        os._exit(exit_code)  # pylint: disable = protected-access
+
+
+def _preload(task, preloaded):
+    """
+    Import the top-level package of the module run by the task, so that the forked processes do not import it
+    again. Only the packages installed outside the current directory (e.g. analysis tools) are imported,
+    as project modules might depend on the environment and working directory of the task
+    """
+    if task["mode"] != "module":
+        return
+    name = task["target"].split(".")[0]
+    if name in preloaded or name in sys.modules:
+        return
+    preloaded.add(name)
+    sys.path.remove("")
+    try:
+        if importlib.util.find_spec(name) is not None:
+            importlib.import_module(name)
+    except BaseException:  # pylint: disable = broad-except
+        pass  # the task itself reports the error
+    finally:
+        sys.path.insert(0, "")
+
+
+def _fork_task(sock, task, fds):
+    """
+    :return: PID of the forked process running the task; it is returned only after the process
+        has become a session leader, so that its whole process group can already be killed
+    """
+    ready_read, ready_write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        sock.close()
+        os.close(ready_read)
+        # The task becomes a session leader, so that the whole process group can be killed on timeout
+        os.setsid()
+        os.close(ready_write)
+        _run_task(task, *fds)
+    os.close(ready_write)
+    # Closing the pipe by the forked process is the signal, so nothing is actually read
+    os.read(ready_read, 1)
+    os.close(ready_read)
+    return pid
+
+
+def serve(fd):
+    """
+    Main loop of the warm interpreter: for each task received via socket, fork a process running it
+    and send back its PID. The exit code is written by the process itself to the status pipe passed with the task
+    """
+    # Forked processes are reaped automatically
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    # The directory of this file should not be visible to the tasks
+    del sys.path[0]
+    sys.path.insert(0, "")
+    sock = socket.socket(fileno=fd)
+    preloaded = set()
+    while True:
+        try:
+            fds = recvfds(sock, 3)
+            task = _receive_message(sock)
+        except (EOFError, OSError, RuntimeError):
+            break
+        _preload(task, preloaded)
+        pid = _fork_task(sock, task, fds)
+        for task_fd in fds:
+            os.close(task_fd)
+        _send_message(sock, pid)
+
+
+class PooledProcess:
+    """
+    Python command launched in :class:`PythonPool`. Output handlers are treated the same way as by 'sh':
+    a callable is called for each line of output, and an object with 'write' method gets chunks of raw output
+    """
+    def __init__(self, ran, stdout_fd, stderr_fd, status_fd, out, err):
+        self.ran = ran
+        self.pid = None
+        self.exit_code = None
+        self._status_fd = status_fd
+        self._join_lock = threading.Lock()
+        self._readers = [threading.Thread(target=self._read, args=(stdout_fd, out), daemon=True),
+                         threading.Thread(target=self._read, args=(stderr_fd, err), daemon=True)]
+
+    def start(self, pid):
+        self.pid = pid
+        for reader in self._readers:
+            reader.start()
+
+    @staticmethod
+    def _read_chunks(fd):
+        while True:
+            try:
+                chunk = os.read(fd, CHUNK_SIZE)
+            except OSError:  # pseudo-terminal raises EIO when the other end is closed
+                break
+            if not chunk:
+                break
+            yield chunk
+        os.close(fd)
+
+    def _read(self, fd, handler):
+        if hasattr(handler, "write"):
+            for chunk in self._read_chunks(fd):
+                handler.write(chunk)
+            return
+
+        decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        incomplete_line = ""
+        for chunk in self._read_chunks(fd):
+            lines = (incomplete_line + decoder.decode(chunk)).split("\n")
+            incomplete_line = lines.pop()
+            for line in lines:
+                handler(line + "\n")
+        incomplete_line += decoder.decode(b"", final=True)
+        if incomplete_line:
+            handler(incomplete_line)
+
+    def join(self):
+        """
+        Wait for the process to exit and return its exit code, without raising an exception on failure
+        """
+        for reader in self._readers:
+            reader.join()
+        with self._join_lock:
+            if self.exit_code is None:
+                status = b""
+                for chunk in iter(lambda: os.read(self._status_fd, 16), b""):
+                    status += chunk
+                os.close(self._status_fd)
+                # No status means that the process was killed before it could report it
+                self.exit_code = int(status) if status else -signal.SIGKILL
+        return self.exit_code
+
+    def wait(self):
+        if self.join():
+            raise PoolError(f"Python pool process got exit code {self.exit_code}")
+
+
+class PythonPool:
+    """
+    Warm interpreters, one per Python executable, started on first request and kept until :meth:`close`.
+    Every command is executed in a new process forked from the interpreter, so the commands do not pay
+    for interpreter startup, but still have separate environment, working directory and module state
+    """
+    def __init__(self):
+        self._servers = {}
+        self._lock = threading.Lock()
+
+    def _get_server(self, interpreter):
+        executable = shutil.which(interpreter)
+        if not executable:
+            raise PoolError(f"No such file or command as '{interpreter}'")
+        server = self._servers.get(executable)
+        if server is None or server[1].poll() is not None:
+            local, remote = socket.socketpair()
+            # Output of the modules preloaded by the interpreter should not get to the build log
+            process = subprocess.Popen([executable, os.path.abspath(__file__), str(remote.fileno())],
+                                       pass_fds=[remote.fileno()], stdin=subprocess.DEVNULL,
+                                       stdout=subprocess.DEVNULL)
+            remote.close()
+            server = (local, process)
+            self._servers[executable] = server
+        return server[0]
+
+    def _send_task(self, interpreter, task, fds):
+        """
+        Pass the task and the ends of its output and status pipes to the interpreter, closing these ends
+        in current process
+
+        :return: PID of the process running the task
+        """
+        try:
+            with self._lock:
+                sock = self._get_server(interpreter)
+                sendfds(sock, fds)
+                _send_message(sock, task)
+                return _receive_message(sock)
+        except (EOFError, OSError) as e:
+            raise PoolError(f"Python pool for '{interpreter}' failed: {e}")
+        finally:
+            for fd in fds:
+                os.close(fd)
+
+    def run(self, command, environment, directory, out, err):
+        interpreter, mode, target, arguments = parse_python_command(command)
+        task = dict(mode=mode, target=target, arguments=arguments,
+                    environment=dict(environment), directory=directory or os.getcwd())
+        # Reading and writing ends of stdout, stderr and status pipes; stdout is a pseudo-terminal, same as in 'sh'
+        pipes = [os.openpty(), os.pipe(), os.pipe()]
+        try:
+            pid = self._send_task(interpreter, task, [write_fd for _, write_fd in pipes])
+        except PoolError:
+            for read_fd, _ in pipes:
+                os.close(read_fd)
+            raise
+        process = PooledProcess(" ".join(command), *[read_fd for read_fd, _ in pipes], out, err)
+        process.start(pid)
+        return process
+
+    def close(self):
+        with self._lock:
+            for sock, process in self._servers.values():
+                sock.close()
+                process.wait()
+            self._servers = {}
+
+
+if __name__ == "__main__":
+    serve(int(sys.argv[1]))
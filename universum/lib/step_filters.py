@@ -0,0 +1,92 @@
+"""
+Matching of step names to the filters passed by '--filter' command-line parameter.
+"""
+
+import fnmatch
+import re
+
+from .module_arguments import IncorrectParameterError
+
+__all__ = [
+    "StepNameMatcher",
+    "make_trie_pattern"
+]
+
+
+def make_trie_pattern(strings):
+    """
+    Build a regular expression searching for any of the strings. The alternatives are arranged as a trie,
+    so that the time of search depends on the length of searched text, but not on the number of strings
+
+    >>> make_trie_pattern(["step1", "step2", "stop", "step12"])
+    'st(?:ep(?:1|2)|op)'
+    >>> re.search(make_trie_pattern(["step 1", "stop"]), "the step 12 is running") is not None
+    True
+    """
+    trie = {}
+    for string in strings:
+        node = trie
+        for char in string:
+            node = node.setdefault(char, {})
+        node[""] = {}
+    return _trie_to_pattern(trie)
+
+
+def _trie_to_pattern(node):
+    # If one string is found, there is no need to search for the longer strings starting with it
+    if "" in node:
+        return ""
+    alternatives = [re.escape(char) + _trie_to_pattern(child) for char, child in sorted(node.items())]
+    if len(alternatives) == 1:
+        return alternatives[0]
+    return "(?:" + "|".join(alternatives) + ")"
+
+
+class StepNameMatcher:
+    """
+    Check whether the step name matches any of 'include' patterns (if there are any),
+    and does not match any of 'exclude' patterns. All patterns of each kind are compiled into one
+    regular expression, so the names are not checked against every pattern one by one
+
+    >>> StepNameMatcher([], [])("step 1"), StepNameMatcher(["step 1"], [])("step 1")
+    (True, True)
+    >>> StepNameMatcher(["step "], ["1"])("step 1")
+    False
+    >>> StepNameMatcher(["test*"], [], "glob")("test 1"), StepNameMatcher(["test*"], [], "glob")("my test")
+    (True, False)
+    >>> StepNameMatcher(["test [0-9]+$"], [], "regex")("unit test 12")
+    True
+    >>> StepNameMatcher(["test ("], [], "regex")
+    Traceback (most recent call last):
+        ...
+    universum.lib.module_arguments.IncorrectParameterError: invalid regular expression 'test (' in step filters: \
+missing ), unterminated subpattern at position 5
+    """
+
+    def __init__(self, include, exclude, filter_type="substring"):
+        """
+        :param filter_type: 'substring' to search for patterns in names, 'glob' to match names to shell-style
+            wildcards, or 'regex' to search for regular expressions in names
+        """
+        self.include = self._compile(include, filter_type)
+        self.exclude = self._compile(exclude, filter_type)
+
+    @staticmethod
+    def _compile(patterns, filter_type):
+        if not patterns:
+            return None
+        if filter_type == "glob":
+            return re.compile("|".join(fnmatch.translate(pattern) for pattern in patterns)).match
+        if filter_type == "regex":
+            for pattern in patterns:
+                try:
+                    re.compile(pattern)
+                except re.error as e:
+                    raise IncorrectParameterError(f"invalid regular expression '{pattern}' in step filters: {e}")
+            return re.compile("|".join("(?:" + pattern + ")" for pattern in patterns)).search
+        return re.compile(make_trie_pattern(patterns)).search
+
+    def __call__(self, name):
+        if self.exclude is not None and self.exclude(name):
+            return False
+        return self.include is None or self.include(name) is not None
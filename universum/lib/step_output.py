@@ -0,0 +1,87 @@
+"""
+Handlers of the output of step processes.
+"""
+
+import codecs
+import tempfile
+
+__all__ = [
+    "ChunkedLogWriter",
+    "PostponedOutput"
+]
+
+
+class ChunkedLogWriter:
+    """
+    Output handler for steps with logs redirected to files: the chunks of output are written
+    to the binary stream of the log file as is, without splitting them into separate lines.
+    Only the incomplete last line of each chunk is held back, so that the lines of stderr,
+    written to the same file, do not break the lines of stdout.
+    Deliberately has no 'flush' method, so that 'sh' does not flush the log file after every chunk
+    """
+    def __init__(self, stream, cache_entry=None):
+        self.stream = stream
+        self.cache_entry = cache_entry
+        self.decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        self.incomplete_line = b""
+
+    def write(self, chunk):
+        end = chunk.rfind(b"\n") + 1
+        if end:
+            chunk, self.incomplete_line = self.incomplete_line + chunk[:end], chunk[end:]
+            self._write(chunk)
+        else:
+            self.incomplete_line += chunk
+
+    def _write(self, chunk):
+        self.stream.write(chunk)
+        if self.cache_entry:
+            self.cache_entry.record("stdout", self.decoder.decode(chunk))
+
+    def close(self):
+        if self.incomplete_line:
+            self._write(self.incomplete_line + b"\n")
+            self.incomplete_line = b""
+        if self.cache_entry:
+            self.cache_entry.record("stdout", self.decoder.decode(b"", final=True))
+
+
+class PostponedOutput:
+    """
+    Output of a background step, stored until the step is finalized. Lines are kept in memory until
+    their total size exceeds the limit; after that all the output is moved to a temporary file
+    """
+    def __init__(self, size_limit):
+        self.size_limit = size_limit
+        self.lines = []
+        self.size = 0
+        self.file = None
+
+    def append(self, is_stderr, line):
+        if self.file:
+            self.file.write(("e" if is_stderr else "o") + line + "\n")
+            return
+        self.lines.append((is_stderr, line))
+        self.size += len(line)
+        if self.size > self.size_limit:
+            self._spill()
+
+    def _spill(self):
+        self.file = tempfile.TemporaryFile("w+", encoding="utf-8", errors="replace", newline="\n")
+        for is_stderr, line in self.lines:
+            self.file.write(("e" if is_stderr else "o") + line + "\n")
+        self.lines = []
+
+    def __iter__(self):
+        yield from self.lines
+        if self.file:
+            self.file.seek(0)
+            for record in self.file:
+                yield record[0] == "e", record[1:-1]
+
+    def close(self):
+        self.lines = []
+        self.size = 0
+        if self.file:
+            self.file.close()
+            self.file = None
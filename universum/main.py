@@ -1,7 +1,7 @@
 from . import __title__
 from .lib.ci_exception import SilentAbortException
 from .lib.gravity import Module, Dependency
-from .modules import vcs, artifact_collector, reporter, launcher, code_report_collector
+from .modules import vcs, artifact_collector, reporter, launcher, code_report_collector, build_trace
 from .modules.output import needs_output
 
 __all__ = ["Main"]
@@ -15,6 +15,7 @@ class Main(Module):
     artifacts_factory = Dependency(artifact_collector.ArtifactCollector)
     reporter_factory = Dependency(reporter.Reporter)
     code_report_collector = Dependency(code_report_collector.CodeReportCollector)
+    build_trace_factory = Dependency(build_trace.BuildTrace)
 
     @staticmethod
     def define_arguments(argument_parser):
@@ -48,6 +49,7 @@ class Main(Module):
         self.artifacts = self.artifacts_factory()
         self.reporter = self.reporter_factory()
         self.code_report_collector = self.code_report_collector()
+        self.build_trace = self.build_trace_factory()
 
     def execute(self):
         if self.settings.clean_build:
@@ -67,9 +69,9 @@ class Main(Module):
                 raise SilentAbortException(application_exit_code=0)
 
         self.vcs.prepare_repository()
-        project_configs = self.launcher.process_project_configs()
-        afterall_configs = self.code_report_collector.prepare_environment(project_configs)
-        self.artifacts.set_and_clean_artifacts(project_configs)
+        step_plan = self.launcher.process_project_configs()
+        afterall_configs = self.code_report_collector.prepare_environment(step_plan)
+        self.artifacts.set_and_clean_artifacts(step_plan)
 
         self.reporter.report_build_started()
         self.launcher.launch_project()
@@ -81,9 +83,14 @@ class Main(Module):
             self.code_report_collector.report_code_report_results()
         self.artifacts.collect_artifacts()
         self.reporter.report_build_result()
+        self.reporter.save_build_timings(self.artifacts.create_text_file("BUILD_TIMINGS.json"))
 
     def finalize(self):
-        if self.settings.no_finalize:
-            self.out.log("Cleaning skipped because of '--no-finalize' option")
-            return
-        self.vcs.finalize()
+        try:
+            if self.settings.no_finalize:
+                self.out.log("Cleaning skipped because of '--no-finalize' option")
+                return
+            self.vcs.finalize()
+        finally:
+            # Saved on finalizing, so that the trace includes failed builds and finalizing itself
+            self.build_trace.save()
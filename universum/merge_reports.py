@@ -0,0 +1,137 @@
+import json
+import re
+
+from .lib.ci_exception import CriticalCiException
+from .lib.gravity import Module, Dependency
+from .lib.utils import make_block
+from .modules import reporter, step_durations, vcs
+from .modules.output import needs_output
+from .modules.structure_handler import Block, needs_structure
+
+__all__ = [
+    "MergeReports",
+    "merge_block_trees"
+]
+
+# Step numbering like ' [ 1/25 ] ' or ' [  +  ] ' added to block names by StructureHandler
+numbering_pattern = re.compile(r"^ \[ [ \d]*([/+])[ \d]* \] ")
+
+
+def merge_block_trees(trees, step_indexes, parent):
+    """
+    Merge block descriptions of several shards into one block tree: blocks with the same names are merged,
+    steps are sorted and numbered according to their indexes in the whole configuration
+
+    >>> root = Block("Universum")
+    >>> steps = lambda *children: dict(name="Executing build steps", status="Success", children=list(children))
+    >>> step = lambda name, status="Success": dict(name=name, status=status, children=[])
+    >>> merge_block_trees([[steps(step(" [ 1/2 ] A"), step(" [ 2/2 ] C"))],
+    ...                    [steps(step(" [ 1/1 ] B", "Failed"))]], [[0, 2], [1]], root)
+    >>> for block in root.children[0].children: str(block)
+    '1.1.  [ 1/3 ] A - Success'
+    '1.2.  [ 2/3 ] B - Failed'
+    '1.3.  [ 3/3 ] C - Success'
+    """
+    merged = []
+    for tree, indexes in zip(trees, step_indexes):
+        _merge_blocks(merged, tree, iter(indexes))
+    step_count = _count_steps(merged)
+    _create_blocks(merged, parent, [0], len(str(step_count)), step_count)
+
+
+def _merge_blocks(merged, blocks, indexes):
+    for block in blocks:
+        match = numbering_pattern.match(block["name"])
+        is_step = bool(match) and match.group(1) == "/"
+        name = block["name"][match.end():] if match else block["name"]
+        existing = None
+        if not is_step or block["children"]:
+            existing = next((item for item in merged if item["name"] == name and item["numbered"] == bool(match)), None)
+        if existing is None:
+            # Blocks other than steps (e.g. reporting background steps) are placed after all steps
+            existing = dict(name=name, numbered=bool(match), is_step=is_step, status="Success", children=[],
+                            index=next(indexes, float("inf")) if is_step else float("inf"))
+            merged.append(existing)
+        if block["status"] != "Success":
+            existing["status"] = block["status"]
+        _merge_blocks(existing["children"], block["children"], indexes)
+        if existing["children"]:
+            existing["children"].sort(key=lambda item: item["index"])
+            existing["index"] = min(existing["index"], existing["children"][0]["index"])
+    merged.sort(key=lambda item: item["index"])
+
+
+def _count_steps(merged):
+    return sum(1 if item["is_step"] else _count_steps(item["children"]) for item in merged)
+
+
+def _create_blocks(merged, parent, counter, number_length, step_count):
+    for item in merged:
+        name = item["name"]
+        if item["is_step"]:
+            counter[0] += 1
+            name = " [ {:>{}}/{} ] ".format(counter[0], number_length, step_count) + name
+        elif item["numbered"]:
+            name = " [ {:{length}}+{:{length}} ] ".format("", "", length=number_length) + name
+        block = Block(name, parent)
+        block.status = item["status"]
+        _create_blocks(item["children"], block, counter, number_length, step_count)
+
+
+@needs_output
+@needs_structure
+class MergeReports(Module):
+    description = "Reporting results of several shards of the same build"
+    reporter_factory = Dependency(reporter.Reporter)
+    vcs_factory = Dependency(vcs.MainVcs)
+    step_durations_factory = Dependency(step_durations.StepDurations)
+
+    @staticmethod
+    def define_arguments(parser):
+        action = parser.add_argument("shard_reports", nargs="+",
+                                     help="Paths to 'SHARD_REPORT_<index>.json' files, created by build runs with "
+                                          "'--shard-count' and '--shard-index' options")
+        # Set after adding the argument, as metavar of other arguments is used as environment variable name
+        action.metavar = "SHARD_REPORT"
+
+    def __init__(self, *args, **kwargs):
+        super(MergeReports, self).__init__(*args, **kwargs)
+        self.vcs = self.vcs_factory()
+        self.reporter = self.reporter_factory()
+        self.step_durations = self.step_durations_factory()
+
+    @make_block("Reading shard reports")
+    def read_shard_reports(self):
+        reports = []
+        for path in self.settings.shard_reports:
+            try:
+                with open(path, encoding="utf-8") as report_file:
+                    reports.append(json.load(report_file))
+            except (OSError, ValueError) as e:
+                raise CriticalCiException(f"Failed to read shard report '{path}': {e}")
+            self.out.log(f"Report '{path}' is read")
+        return reports
+
+    def execute(self):
+        reports = self.read_shard_reports()
+
+        result_block = Block("Merged build result")
+        merge_block_trees([report["blocks"] for report in reports],
+                          [report["step_indexes"] for report in reports], result_block)
+        for block in result_block.children:
+            self.reporter.add_block_to_report(block)
+        for report in reports:
+            self.reporter.report_artifacts(report["artifacts"])
+            for path, messages in report["code_report"].items():
+                for message in messages:
+                    self.reporter.code_report(path, message)
+            for name, duration in report["durations"].items():
+                self.step_durations.record(name, duration)
+        # Shards only read durations, so that all of them split the steps in the same way
+        self.step_durations.save()
+
+        self.reporter.report_initialized = True
+        self.reporter.report_build_result()
+
+    def finalize(self):
+        pass
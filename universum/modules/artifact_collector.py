@@ -11,7 +11,7 @@ import six
 from ..lib.ci_exception import CriticalCiException, CiException
 from ..lib.gravity import Dependency
 from ..lib.utils import make_block
-from ..lib import utils
+from ..lib import compressed_log, utils
 from .automation_server import AutomationServerForHostingBuild
 from .output import needs_output
 from .project_directory import ProjectDirectory
@@ -96,19 +96,40 @@ class ArtifactCollector(ProjectDirectory):
     def make_file_name(self, name):
         return utils.calculate_file_absolute_path(self.artifact_dir, name)
 
-    def create_text_file(self, name):
+    def _add_file(self, name):
+        file_name = self.make_file_name(name)
+        if file_name not in self.file_list:
+            if os.path.exists(file_name):
+                text = "File '" + os.path.basename(file_name) + "' already exists in artifact directory." + \
+                       "\nPossible reason of this error: previous build artifacts are not cleaned"
+                raise CriticalCiException(text)
+
+        self.file_list.add(file_name)
+        file_path = self.automation_server.artifact_path(self.artifact_dir, os.path.basename(file_name))
+        self.out.log("Adding file " + file_path + " to artifacts...")
+        return file_name
+
+    def create_text_file(self, name, rewrite=False):
+        """
+        :param rewrite: if True, the file created earlier in this run is written anew instead of being appended to
+        """
         try:
-            file_name = self.make_file_name(name)
-            if file_name not in self.file_list:
-                if os.path.exists(file_name):
-                    text = "File '" + os.path.basename(file_name) + "' already exists in artifact directory." + \
-                           "\nPossible reason of this error: previous build artifacts are not cleaned"
-                    raise CriticalCiException(text)
+            file_name = self._add_file(name)
+            return codecs.open(file_name, "w" if rewrite else "a", encoding="utf-8")
+
+        except IOError as e:
+            raise CiException("The following error occurred while working with file: " + str(e))
+
+    def create_compressed_text_file(self, name, compression):
+        """
+        Create the text file, compressed in background thread; along with it, the index of compressed blocks
+        is stored to the file with '.index.json' suffix
 
-            self.file_list.add(file_name)
-            file_path = self.automation_server.artifact_path(self.artifact_dir, os.path.basename(file_name))
-            self.out.log("Adding file " + file_path + " to artifacts...")
-            return codecs.open(file_name, "a", encoding="utf-8")
+        :param compression: one of :data:`universum.lib.compressed_log.compressions`
+        """
+        try:
+            file_name = self._add_file(name + compressed_log.compressions[compression])
+            return compressed_log.CompressedLogFile(file_name, file_name + ".index.json", compression)
 
         except IOError as e:
             raise CiException("The following error occurred while working with file: " + str(e))
@@ -155,10 +176,10 @@ class ArtifactCollector(ProjectDirectory):
         return new_artifact_list
 
     @make_block("Preprocessing artifact lists")
-    def set_and_clean_artifacts(self, project_configs, ignore_existing_artifacts=False):
+    def set_and_clean_artifacts(self, step_plan, ignore_existing_artifacts=False):
         artifact_list = []
         report_artifact_list = []
-        for configuration in project_configs.all():
+        for configuration in step_plan.get_steps():
             if "artifacts" in configuration:
                 path = utils.parse_path(configuration["artifacts"], self.settings.project_root)
                 clean = configuration.get("artifact_prebuild_clean", False)
@@ -225,6 +246,31 @@ class ArtifactCollector(ProjectDirectory):
             name = "Collecting '" + os.path.basename(path) + "'"
             self.structure.run_in_block(self.move_artifact, name, False, path)
 
+    def clean_collected_artifacts(self, step_plan):
+        """
+        Remove the artifacts and log files of the steps from `step_plan` from artifact directory, so that
+        these steps can be executed again without cleaning the artifacts of other steps
+        """
+        self.artifact_list = []
+        self.report_artifact_list = []
+        self.collected_report_artifacts = set()
+        for configuration in step_plan.get_steps():
+            # Log files are appended to, so the logs of previous runs would be mixed with new ones
+            log_name = self.make_file_name(configuration.get("name", "") + "_log.txt")
+            for extension in [""] + [extension + suffix for extension in compressed_log.compressions.values()
+                                     for suffix in ("", ".index.json")]:
+                if os.path.exists(log_name + extension):
+                    os.remove(log_name + extension)
+            for key in ("artifacts", "report_artifacts"):
+                if key not in configuration:
+                    continue
+                destination = os.path.join(self.artifact_dir, os.path.basename(configuration[key]))
+                for path in (destination, destination + ".zip"):
+                    if os.path.isdir(path):
+                        shutil.rmtree(path, ignore_errors=True)
+                    elif os.path.exists(path):
+                        os.remove(path)
+
     def clean_artifacts_silently(self):
         try:
             shutil.rmtree(self.artifact_dir)
@@ -0,0 +1,125 @@
+import json
+import os
+
+from ..lib import utils
+from ..lib.gravity import Module
+from .output import needs_output
+from .structure_handler import needs_structure
+
+__all__ = [
+    "BuildTrace",
+    "make_trace_events"
+]
+
+
+def _to_microseconds(value, origin):
+    return round((value - origin) * 1000000)
+
+
+def _assign_thread(threads, thread_indexes, interval):
+    """
+    Find the thread the block can be placed to: the thread of its parent if possible, otherwise the first thread
+    where it is properly nested, or a new one
+
+    :param threads: for each thread, stack of the blocks still open at the time of the block start
+    :param thread_indexes: indexes of the threads of all the blocks placed so far by their IDs
+    :param interval: start and finish time of the block, the block itself and IDs of its ancestors
+    :return: index of the thread
+    """
+    started, finished, block, ancestors = interval
+    candidates = list(range(len(threads)))
+    parent_thread = thread_indexes.get(id(block.parent))
+    if parent_thread is not None:
+        candidates.insert(0, parent_thread)
+    for index in candidates:
+        stack = threads[index]
+        while stack and stack[-1][1] <= started:
+            stack.pop()
+        if not stack or (id(stack[-1][0]) in ancestors and finished <= stack[-1][1]):
+            break
+    else:
+        index = len(threads)
+        threads.append([])
+    threads[index].append((block, finished))
+    thread_indexes[id(block)] = index
+    return index
+
+
+def make_trace_events(root):
+    """
+    Convert the tree of blocks into the list of Chrome Trace Event Format 'complete' events. Blocks overlapping
+    with other blocks that are not their parents (e.g. background and parallel steps) are placed to separate
+    threads of the trace, so that each thread contains properly nested events only
+
+    >>> from .structure_handler import Block
+    >>> root = Block("Universum")
+    >>> steps = Block("Executing build steps", root)
+    >>> first, second = Block("First", steps), Block("Second", steps)
+    >>> root.started, steps.started, steps.finished = 0, 0, 3
+    >>> first.started, first.finished, second.started, second.finished = 0, 2, 1, 3
+    >>> second.process_started, second.process_finished, second.cpu_time = 1.5, 2.5, 0.5
+    >>> [(event["name"], event["tid"], event["ts"], event["dur"]) for event in make_trace_events(root)]
+    [('Executing build steps', 0, 0, 3000000), ('First', 0, 0, 2000000), ('Second', 1, 1000000, 2000000), \
+('Process', 1, 1500000, 1000000)]
+    """
+    origin = root.started
+    intervals = []
+
+    def collect(block, ancestors):
+        if block.started is not None and block.finished is not None:
+            intervals.append((block.started, block.finished, block, ancestors))
+        for child in block.children:
+            collect(child, ancestors | {id(block)})
+
+    for child in root.children:
+        collect(child, frozenset())
+    # Parents are placed before their children, as they start no later and finish no earlier
+    intervals.sort(key=lambda interval: (interval[0], -interval[1]))
+
+    threads = []  # for each thread, stack of the blocks still open at the time of current block start
+    thread_indexes = {}
+    events = []
+    for started, finished, block, ancestors in intervals:
+        index = _assign_thread(threads, thread_indexes, (started, finished, block, ancestors))
+        events.append(dict(name=block.name.strip(), cat="block", ph="X", pid=1, tid=index,
+                           ts=_to_microseconds(started, origin), dur=_to_microseconds(finished, started),
+                           args=dict(number=block.number, status=block.status)))
+        if block.process_started is not None and block.process_finished is not None:
+            events.append(dict(name="Process", cat="process", ph="X", pid=1, tid=index,
+                               ts=_to_microseconds(block.process_started, origin),
+                               dur=_to_microseconds(block.process_finished, block.process_started),
+                               args=dict(cpu_time=block.cpu_time, max_rss_mb=block.max_rss)))
+
+    return events
+
+
+@needs_output
+@needs_structure
+class BuildTrace(Module):
+    @staticmethod
+    def define_arguments(argument_parser):
+        parser = argument_parser.get_or_create_group("Output")
+        parser.add_argument("--trace-file", dest="trace_file", metavar="UNIVERSUM_TRACE_FILE",
+                            help="File to store the timeline of the build to, in Chrome Trace Event Format, "
+                                 "to be opened in 'chrome://tracing' or Perfetto UI. Contains all the blocks "
+                                 "of the build log and the processes of the steps; steps executed simultaneously "
+                                 "are shown in separate threads")
+
+    def save(self):
+        """
+        Write all the blocks executed so far to the trace file, if it is set
+        """
+        if not self.settings.trace_file:
+            return
+        path = utils.parse_path(self.settings.trace_file, os.getcwd())
+        events = make_trace_events(self.structure.root_block)
+        thread_count = max((event["tid"] for event in events), default=0) + 1
+        metadata = [dict(name="process_name", ph="M", pid=1, args=dict(name="Universum"))]
+        for index in range(thread_count):
+            metadata.append(dict(name="thread_name", ph="M", pid=1, tid=index,
+                                 args=dict(name="Main" if not index else f"Simultaneous steps {index}")))
+        try:
+            with open(path, "w", encoding="utf-8") as trace_file:
+                json.dump(dict(traceEvents=metadata + events, displayTimeUnit="ms"), trace_file)
+        except OSError as e:
+            self.out.log_stderr(f"Failed to store build trace to '{path}': {e}")
@@ -32,9 +32,9 @@ class CodeReportCollector(ProjectDirectory):
         if not os.path.exists(self.report_path):
             os.makedirs(self.report_path)
 
-    def prepare_environment(self, project_configs):
+    def prepare_environment(self, step_plan):
         afterall_steps = []
-        for item in project_configs:
+        for item in step_plan.get_steps():
             if not item.get("code_report", False):
                 continue
 
@@ -0,0 +1,202 @@
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+
+from .. import __version__
+from ..lib.gravity import Dependency, Module
+from ..lib.module_arguments import IncorrectParameterError
+from .output import needs_output
+from .step_cache import StepCache, collect_input_files, hash_file
+
+__all__ = [
+    "ConfigCache",
+    "ConfigInputs"
+]
+
+
+def get_file_fingerprint(path):
+    if not os.path.isfile(path):
+        return None
+    hasher = hashlib.sha256()
+    try:
+        hash_file(hasher, path)
+    except OSError:
+        return None
+    return hasher.hexdigest()
+
+
+def get_hashed_environment(environment, names=None):
+    """
+    :param names: names of the variables to hash; all variables of `environment` are hashed if None
+    :return: the variables to hash, sorted by names
+
+    >>> get_hashed_environment(dict(BUILD_NUMBER="12", PATH="/bin"))
+    [('BUILD_NUMBER', '12'), ('PATH', '/bin')]
+    >>> get_hashed_environment(dict(BUILD_NUMBER="12", PATH="/bin"), ["PLATFORM", "PATH"])
+    [('PATH', '/bin'), ('PLATFORM', None)]
+    """
+    if names is None:
+        return sorted(environment.items())
+    return [(name, environment.get(name)) for name in sorted(names)]
+
+
+def get_environment_fingerprint(environment, names=None):
+    return hashlib.sha256(repr(get_hashed_environment(environment, names)).encode("utf-8")).hexdigest()
+
+
+def parse_list(value):
+    return [item.strip() for item in (value or "").split(",") if item.strip()]
+
+
+class ConfigInputs:
+    """
+    Inputs of config file evaluation that are checked before using the stored configurations: the config file
+    itself, all the Python modules loaded from the config file directory or project root, the files matching
+    the given patterns and the environment (the whole one, or only the listed variables). Nothing else is tracked:
+    e.g. reading any other files, listing directories or running external commands in the config file is not noticed
+    """
+
+    def __init__(self, config_path, project_root, patterns, environment_names=None):
+        self.config_path = os.path.abspath(config_path)
+        self.project_root = project_root
+        self.patterns = patterns
+        self.environment_names = environment_names
+        self.local_directories = [os.path.join(os.path.abspath(path), "")
+                                  for path in (os.path.dirname(config_path), project_root)]
+
+    def get_module_files(self):
+        result = set()
+        for module in list(sys.modules.values()):
+            path = getattr(module, "__file__", None)
+            if path and any(os.path.abspath(path).startswith(directory) for directory in self.local_directories):
+                result.add(os.path.abspath(path))
+        return result
+
+    def get_pattern_files(self):
+        return collect_input_files(self.patterns, self.project_root) if self.patterns else []
+
+    def collect(self):
+        """
+        :return: current state of the inputs, to be called right after config file evaluation
+        """
+        pattern_files = self.get_pattern_files()
+        paths = {self.config_path} | self.get_module_files() | set(pattern_files)
+        return dict(patterns=self.patterns, pattern_files=pattern_files,
+                    files={path: get_file_fingerprint(path) for path in paths},
+                    environment_names=self.environment_names,
+                    environment=get_environment_fingerprint(os.environ, self.environment_names))
+
+    def is_up_to_date(self, inputs):
+        """
+        :param inputs: state of the inputs returned by :meth:`collect` after some previous evaluation
+        :return: True if config file evaluation now would get the same inputs
+        """
+        return inputs["patterns"] == self.patterns and \
+            inputs.get("environment_names") == self.environment_names and \
+            inputs["environment"] == get_environment_fingerprint(os.environ, self.environment_names) and \
+            inputs["pattern_files"] == self.get_pattern_files() and \
+            all(get_file_fingerprint(path) == value for path, value in inputs["files"].items())
+
+
+@needs_output
+class ConfigCache(Module):
+    """
+    Results of config file evaluation, stored in the directory set by '--cache-dir'
+    """
+    step_cache_factory = Dependency(StepCache)
+    max_entries = 5
+
+    @staticmethod
+    def define_arguments(argument_parser):
+        parser = argument_parser.get_or_create_group("Configuration execution")
+        parser.add_argument("--cache-configs", action="store_true", dest="cache_configs",
+                            help="Store the configurations evaluated from config file in the directory set by "
+                                 "'--cache-dir', and load them instead of executing the config file again when "
+                                 "neither the config file, nor the local Python modules it imports, nor the files "
+                                 "set by '--config-inputs', nor any environment variables (or the ones set by "
+                                 "'--config-environment') are changed")
+        parser.add_argument("--config-inputs", dest="config_inputs", metavar="UNIVERSUM_CONFIG_INPUTS",
+                            help="Comma-separated list of paths to the files read by config file, relative to "
+                                 "project root; can contain shell-style wildcards. Required for '--cache-configs' "
+                                 "to notice the changes in these files, as no other file reads are tracked")
+        parser.add_argument("--config-environment", dest="config_environment",
+                            metavar="UNIVERSUM_CONFIG_ENVIRONMENT",
+                            help="Comma-separated list of names of the environment variables read by config file. "
+                                 "If set, '--cache-configs' only checks these variables instead of the whole "
+                                 "environment, so that e.g. build number set by CI does not prevent using "
+                                 "the stored configurations")
+
+    def __init__(self, *args, **kwargs):
+        super(ConfigCache, self).__init__(*args, **kwargs)
+        self.step_cache = self.step_cache_factory()
+        self.enabled = self.settings.cache_configs
+        if self.enabled and not self.step_cache.cache_dir:
+            raise IncorrectParameterError("the cache directory is not specified.\n"
+                                          "Please specify the directory to store evaluated configs in by using\n"
+                                          "'--cache-dir' command-line option or\n"
+                                          "UNIVERSUM_CACHE_DIR environment variable")
+
+    def get_cache_path(self, config_path, project_root):
+        key = hashlib.sha256(repr((__version__, config_path, project_root)).encode("utf-8")).hexdigest()
+        return os.path.join(self.step_cache.cache_dir, "configs", key + ".pickle")
+
+    def _load_entries(self, path):
+        if not os.path.exists(path):
+            return []
+        try:
+            with open(path, "rb") as cache_file:
+                return pickle.load(cache_file)
+        except Exception as e:  # pylint: disable = broad-except
+            self.out.log_stderr(f"Failed to read evaluated configs from cache: {e}")
+            return []
+
+    def _store_entries(self, path, entries):
+        directory = os.path.dirname(path)
+        try:
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+            handle, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(handle, "wb") as cache_file:
+                pickle.dump(entries, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, path)
+        except OSError as e:
+            self.out.log_stderr(f"Failed to store evaluated configs to cache: {e}")
+
+    def get_configs(self, config_path, project_root, evaluate):
+        """
+        :param evaluate: function executing the config file and returning the configurations
+        :return: configurations loaded from cache if their inputs are not changed; otherwise result of `evaluate`
+        """
+        if not self.enabled:
+            return evaluate()
+
+        environment_names = None
+        if self.settings.config_environment:
+            environment_names = parse_list(self.settings.config_environment)
+        config_inputs = ConfigInputs(config_path, project_root, parse_list(self.settings.config_inputs),
+                                     environment_names)
+        cache_path = self.get_cache_path(config_path, project_root)
+        entries = self._load_entries(cache_path)
+        # Configurations are stored pickled separately, so that only the matching entry is unpickled
+        for inputs, pickled_configs in entries:
+            if config_inputs.is_up_to_date(inputs):
+                self.out.log("Config file and its inputs did not change since it was evaluated last time, "
+                             "so the configurations are loaded from cache")
+                return pickle.loads(pickled_configs)
+
+        configs = evaluate()
+        inputs = config_inputs.collect()
+        try:
+            pickled_configs = pickle.dumps(configs, protocol=pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, AttributeError, TypeError) as e:
+            self.out.log_stderr(f"Evaluated configurations cannot be stored to cache: {e}")
+            return configs
+        entries.insert(0, (inputs, pickled_configs))
+        self._store_entries(cache_path, entries[:self.max_entries])
+        environment = "the environment" if environment_names is None \
+            else f"{len(environment_names)} environment variables"
+        self.out.log(f"Evaluated configurations are stored to cache; inputs are {len(inputs['files'])} files "
+                     f"and {environment}")
+        return configs
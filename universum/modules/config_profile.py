@@ -0,0 +1,149 @@
+import contextlib
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from ..configuration_support import Variations
+
+__all__ = [
+    "ConfigProfile",
+    "count_leaves"
+]
+
+
+def count_leaves(variations, counted=None):
+    """
+    Count the configurations generated by :meth:`.Variations.all()` without generating them.
+    Multiplied configurations share their children, so each shared list is only counted once
+
+    >>> count_leaves(Variations([dict(name="a"), dict(name="b")]) * Variations([dict(name="1"), dict(name="2")]))
+    4
+
+    :param variations: :class:`.Variations` object to count configurations in
+    :param counted: an inner parameter for recursive usage
+    :return: the number of leaf configurations
+    """
+    if counted is None:
+        counted = {}
+    result = counted.get(id(variations))
+    if result is None:
+        result = sum(count_leaves(item["children"], counted) if "children" in item else 1 for item in variations)
+        counted[id(variations)] = result
+    return result
+
+
+class ConfigProfile:
+    """
+    Measurements of config file processing: time spent on each stage, numbers of configurations,
+    peak memory and the biggest products created by multiplying :class:`.Variations` objects.
+    When not enabled, nothing is measured, so the same code can be used in both cases
+
+    >>> profile = ConfigProfile("configs.py", enabled=True)
+    >>> with profile.recording():
+    ...     configs = Variations([dict(name="a"), dict(name="b")]) * Variations([dict(name="1"), dict(name="2")])
+    >>> profile.record_leaves("evaluated", configs)
+    >>> report = profile.get_report()
+    >>> report["leaves"], [product["leaves"] for product in report["largest_products"]]
+    ({'evaluated': 4}, [4])
+    """
+
+    max_products = 10
+
+    def __init__(self, config_path, enabled):
+        self.config_path = config_path
+        self.enabled = enabled
+        self.stages = {}
+        self.leaves = {}
+        self.products = []
+        self.multiplication_time = 0.0
+        self.multiplication_count = 0
+        self.peak_memory = None
+        self._multiplying = False
+
+    @contextlib.contextmanager
+    def measure(self, stage):
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[stage] = self.stages.get(stage, 0.0) + time.perf_counter() - started
+
+    def record_leaves(self, stage, variations):
+        if self.enabled:
+            self.leaves[stage] = count_leaves(variations)
+
+    def _get_location(self, frame):
+        # Config file is executed from a string, so its frames have no file name
+        file_name = frame.f_code.co_filename
+        if file_name == "<string>":
+            file_name = self.config_path
+        return f"{os.path.basename(file_name)}:{frame.f_lineno}"
+
+    def _record_product(self, left, right, result, duration, frame):
+        self.multiplication_time += duration
+        self.multiplication_count += 1
+        counted = {}
+        self.products.append(dict(leaves=count_leaves(result, counted),
+                                  factors=[count_leaves(left, counted),
+                                           count_leaves(right, counted) if isinstance(right, Variations) else right],
+                                  seconds=round(duration, 6),
+                                  location=self._get_location(frame)))
+        self.products.sort(key=lambda product: product["leaves"], reverse=True)
+        del self.products[self.max_products:]
+
+    @contextlib.contextmanager
+    def recording(self):
+        """
+        Trace memory allocations and record multiplications of :class:`.Variations` objects
+        while the context is active. Only the outermost multiplications are recorded, as multiplying
+        configurations with children multiplies their children too
+        """
+        if not self.enabled:
+            yield
+            return
+
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start()
+        original_multiply = Variations.__mul__
+
+        def multiply(left, right):
+            if self._multiplying:
+                return original_multiply(left, right)
+            self._multiplying = True
+            started = time.perf_counter()
+            try:
+                result = original_multiply(left, right)
+            finally:
+                self._multiplying = False
+            self._record_product(left, right, result, time.perf_counter() - started,
+                                 sys._getframe(1))  # pylint: disable = protected-access
+            return result
+
+        Variations.__mul__ = multiply
+        try:
+            yield
+        finally:
+            Variations.__mul__ = original_multiply
+            self.peak_memory = tracemalloc.get_traced_memory()[1]
+            if not tracing:
+                tracemalloc.stop()
+
+    def get_report(self):
+        stages = {name: round(duration, 6) for name, duration in self.stages.items()}
+        return dict(config_path=self.config_path,
+                    seconds=stages,
+                    multiplication=dict(count=self.multiplication_count,
+                                        seconds=round(self.multiplication_time, 6)),
+                    leaves=self.leaves,
+                    peak_memory_mb=round(self.peak_memory / 1024 ** 2, 3) if self.peak_memory is not None else None,
+                    largest_products=self.products)
+
+    def save(self, file):
+        json.dump(self.get_report(), file, indent=4)
+        file.write("\n")
@@ -1,23 +1,36 @@
+import functools
+import heapq
+import itertools
 import os
 import re
+import shlex
+import signal
 import sys
+import threading
+import time
 from inspect import cleandoc
 
 import sh
 
 from .. import configuration_support
-from ..lib import utils
+from ..lib import compressed_log, python_pool, utils
 from ..lib.ci_exception import CiException, CriticalCiException, StepException
 from ..lib.gravity import Dependency
 from ..lib.module_arguments import IncorrectParameterError
+from ..lib.process_usage import SessionUsageSampler
+from ..lib.step_filters import StepNameMatcher
+from ..lib.step_output import ChunkedLogWriter, PostponedOutput
 from ..lib.utils import make_block
-from . import automation_server, api_support, artifact_collector, reporter, code_report_collector
+from . import automation_server, api_support, artifact_collector, reporter, code_report_collector, step_cache, \
+    step_durations, config_cache
+from .config_profile import ConfigProfile
 from .output import needs_output
 from .project_directory import ProjectDirectory
-from .structure_handler import needs_structure
+from .structure_handler import needs_structure, ResourceBudget, StepPlan
 
 __all__ = [
     "Launcher",
+    "EnvConditionChecker",
     "check_if_env_set"
 ]
 
@@ -29,6 +42,55 @@ def make_command(name):
         raise CiException(f"No such file or command as '{name}'")
 
 
+@functools.lru_cache(maxsize=None)
+def parse_env_conditions(expression):
+    """
+    Parse the value of 'if_env_set' key into the list of conditions, each consisting of the variable name,
+    the operator and the value. Parsed expressions are memorized, as the same expression is usually
+    shared by many configurations
+
+    >>> parse_env_conditions("MY_VAR != some value && OTHER_VAR && ")
+    (('MY_VAR', '!=', 'some value'), ('OTHER_VAR', None, None))
+    """
+    conditions = []
+    for var in expression.split("&&"):
+        if var.strip():
+            match = re.match(r"\s*([A-Za-z_]\w*)\s*(!=|==)\s*(.*?)\s*$", var)
+            # With no operator 'match' is None
+            if not match:
+                conditions.append((var.strip(), None, None))
+            else:
+                conditions.append(match.groups())
+    return tuple(conditions)
+
+
+positive_values = frozenset(["True", "true", "Yes", "yes", "Y", "y"])
+
+
+def evaluate_env_conditions(conditions, environment):
+    """
+    :param conditions: conditions returned by :func:`parse_env_conditions`
+    :param environment: mapping of environment variable names to their values
+    :return: True if all the conditions are met; False otherwise
+    """
+    for name, operator, value in conditions:
+        current_value = environment.get(name)
+        # With no operator variable should be obligatory set to any positive value
+        if operator is None:
+            if current_value not in positive_values:
+                return False
+
+        # In "==" case variable should be obligatory set to 'value'
+        elif operator == "==":
+            if current_value != value:
+                return False
+
+        # In "!=" case variable can be unset or set to any value not matching 'value'
+        elif current_value == value:
+            return False
+    return True
+
+
 def check_if_env_set(configuration):
     """
     Predicate function for :func:`universum.configuration_support.Variations.filter`,
@@ -55,67 +117,34 @@ def check_if_env_set(configuration):
     """
 
     if "if_env_set" in configuration:
-        variables = configuration["if_env_set"].split("&&")
-        for var in variables:
-            if var.strip():
-                match = re.match(r"\s*([A-Za-z_]\w*)\s*(!=|==)\s*(.*?)\s*$", var)
-
-                # With no operator 'match' is None
-                # In this case variable should be obligatory set to any positive value
-                if not match:
-                    if not os.getenv(var.strip()):
-                        return False
-                    if os.getenv(var.strip()) not in ["True", "true", "Yes", "yes", "Y", "y"]:
-                        return False
-                    continue
-
-                name, operator, value = match.groups()
-                # In "==" case variable should be obligatory set to 'value'
-                if operator == "==":
-                    if os.getenv(name) is None:
-                        return False
-                    if os.getenv(name) != value:
-                        return False
-
-                # In "!=" case variable can be unset or set to any value not matching 'value'
-                elif os.getenv(name) is not None:
-                    if os.getenv(name) == value:
-                        return False
+        return evaluate_env_conditions(parse_env_conditions(configuration["if_env_set"]), os.environ)
     return True
 
 
-def check_str_match(string, include_substrings, exclude_substrings):
-    """The function to check whether specified string contains 'include' and
-    does NOT contain 'exclude' substrings.
-
-    >>> check_str_match("step 1", [], [])
-    True
-
-    >>> check_str_match("step 1", ["step 1"], [])
-    True
-
-    >>> check_str_match("step 1", ["step 1"], ["step 1"])
-    False
+class EnvConditionChecker:
+    """
+    Same as :func:`check_if_env_set`, but the conditions are checked against the snapshot of environment
+    taken on creation. Configurations generated by multiplication usually share a few distinct 'if_env_set'
+    values, so the result is memorized for each value and only evaluated once
 
-    >>> check_str_match("step 1", [], ["step 1"])
-    False
+    >>> checker = EnvConditionChecker({"MY_VAR": "yes"})
+    >>> checker(dict(if_env_set="MY_VAR")), checker(dict(if_env_set="MY_VAR && OTHER_VAR")), checker(dict(name="A"))
+    (True, False, True)
+    """
 
-    >>> check_str_match("step 1", ["step "], ["1"])
-    False
+    def __init__(self, environment=None):
+        self.environment = dict(os.environ if environment is None else environment)
+        self.results = {}
 
-    :rtype: bool
-    """
-    result = not include_substrings
-    for substr in include_substrings:
-        if substr in string:
-            result = True
-            break
-
-    for substr in exclude_substrings:
-        if substr in string:
-            result = False
-            break
-    return result
+    def __call__(self, configuration):
+        if "if_env_set" not in configuration:
+            return True
+        expression = configuration["if_env_set"]
+        result = self.results.get(expression)
+        if result is None:
+            result = evaluate_env_conditions(parse_env_conditions(expression), self.environment)
+            self.results[expression] = result
+        return result
 
 
 def get_match_patterns(filters):
@@ -159,9 +188,62 @@ def get_match_patterns(filters):
     return include, exclude
 
 
+def split_into_shards(weights, shard_count):
+    """
+    Distribute items between shards, so that the sums of item weights in shards are as close as possible.
+    Heaviest items are distributed first, each to the shard with the lowest sum so far;
+    ties are resolved by item and shard indexes, so the result only depends on the passed weights
+
+    :return: list of shard indexes, one for each item
+
+    >>> split_into_shards([1, 1, 1, 1, 1], 2)
+    [0, 1, 0, 1, 0]
+    >>> split_into_shards([10, 1, 1, 5, 4], 2)
+    [0, 1, 0, 1, 1]
+    >>> split_into_shards([2, 3], 4)
+    [1, 0]
+    """
+    loads = [(0, shard) for shard in range(shard_count)]
+    result = [0] * len(weights)
+    for index in sorted(range(len(weights)), key=lambda i: (-weights[i], i)):
+        load, shard = heapq.heappop(loads)
+        result[index] = shard
+        heapq.heappush(loads, (load + weights[index], shard))
+    return result
+
+
+usage_sampler = SessionUsageSampler()
+
+
+def make_step_environment(item, additional_environment):
+    """
+    :return: environment the command of the step is executed with
+    """
+    environment = os.environ.copy()
+    environment.update(item.get("environment", {}))
+    environment.update(additional_environment)
+    return environment
+
+
+def format_command(command_path, args):
+    """
+    Format the command the same way as 'sh' does for the commands it runs
+
+    >>> format_command("/bin/sh", ["-c", "echo bad; exit 3"])
+    "/bin/sh -c 'echo bad; exit 3'"
+    """
+    return " ".join(shlex.quote(str(arg)) for arg in [command_path] + list(args))
+
+
 class Step:
+    # Size in bytes of output chunks read from the steps with logs redirected to files
+    log_chunk_size = 64 * 1024
+    # Time in seconds between SIGTERM and SIGKILL sent to the process group of the step that timed out
+    kill_delay = 5
+
     # TODO: change to non-singleton module and get all dependencies by ourselves
-    def __init__(self, item, out, fail_block, send_tag, log_file, working_directory, additional_environment):
+    def __init__(self, item, out, fail_block, send_tag, log_file, working_directory, additional_environment,
+                 cache_entry=None, timeout=None, postponed_output_limit=1024 * 1024, pool=None):
         super(Step, self).__init__()
         self.configuration = item
         self.out = out
@@ -169,16 +251,28 @@ class Step:
         self.send_tag = send_tag
         self.file = log_file
         self.working_directory = working_directory
+        self.cache_entry = cache_entry
+        self.timeout = timeout
+        self.pool = pool
 
-        self.environment = os.environ.copy()
-        user_environment = item.get("environment", {})
-        self.environment.update(user_environment)
-        self.environment.update(additional_environment)
+        self.environment = make_step_environment(item, additional_environment)
 
         self.cmd = None
         self.process = None
         self._is_background = False
-        self._postponed_out = []
+        self._postponed_out = PostponedOutput(postponed_output_limit)
+        self._cached_error = None
+        self._timer = None
+        self._timed_out = False
+        self._finished = threading.Event()
+        self._log_writer = None
+        self.started = None
+        self._usage = None
+        self.duration = None
+        self.finished = None
+        self.cpu_time = None
+        self.max_rss = None
+        self.cancelled = False
 
     def prepare_command(self): #FIXME: refactor
         try: #TODO: move try-catch block in a separate method
@@ -203,42 +297,140 @@ class Step:
             raise StepException()
         return True
 
+    def get_timeout(self):
+        if not self.timeout:
+            return None
+        try:
+            result = float(self.timeout)
+        except (TypeError, ValueError):
+            result = -1
+        if result <= 0:
+            self.fail_block(f"Step timeout should be a positive number of seconds, got '{self.timeout}' instead")
+            raise StepException()
+        return result
+
     def start(self, is_background):
         if not self.prepare_command():
             return
 
+        timeout = self.get_timeout()
+        runner = self.configuration.get("runner")
+        if runner not in (None, "python-pool"):
+            self.fail_block(f"Unknown step runner '{runner}'")
+            raise StepException()
+
         self._is_background = is_background
-        self._postponed_out = []
-        self.process = self.cmd(*self.configuration["command"][1:],
-                                _iter=True,
-                                _bg_exc=False,
-                                _cwd=self.working_directory,
-                                _env=self.environment,
-                                _bg=self._is_background,
-                                _out=self.handle_stdout,
-                                _err=self.handle_stderr)
+        self._postponed_out.close()
+        if self.cache_entry:
+            if self.cache_entry.exists():
+                self.restore_from_cache()
+                return
+            self.cache_entry.start_recording()
+
+        stdout_handler = self.handle_stdout
+        stdout_buffering = 1
+        if self.file and hasattr(self.file, "stream"):
+            # Log files need no splitting of output into lines
+            self._log_writer = ChunkedLogWriter(self.file.stream, self.cache_entry)
+            stdout_handler = self._log_writer
+            stdout_buffering = self.log_chunk_size
+
+        self.started = time.monotonic()
+        self.duration = None
+        self.finished = None
+        self.cpu_time = None
+        self.max_rss = None
+        if runner == "python-pool":
+            try:
+                self.process = self.pool.run(self.configuration["command"], self.environment,
+                                             self.working_directory, stdout_handler, self.handle_stderr)
+            except python_pool.PoolError as e:
+                self.fail_block(str(e))
+                raise StepException()
+        else:
+            self.process = self.cmd(*self.configuration["command"][1:],
+                                    _iter=True,
+                                    _bg_exc=False,
+                                    _cwd=self.working_directory,
+                                    _env=self.environment,
+                                    _bg=self._is_background,
+                                    _new_session=True,
+                                    _out=stdout_handler,
+                                    _out_bufsize=stdout_buffering,
+                                    _err=self.handle_stderr)
+        # Both the pool and 'sh' launch the step in a new session, so its session ID equals its PID
+        self._usage = usage_sampler.start(self.process.pid)
+        if is_background:
+            # To measure the duration of background step, its end should not wait for finalize()
+            threading.Thread(target=self.wait, daemon=True).start()
+        if timeout:
+            self._timed_out = False
+            self._finished.clear()
+            self._timer = threading.Timer(timeout, self._terminate_on_timeout)
+            self._timer.daemon = True
+            self._timer.start()
 
         log_cmd = utils.trim_and_convert_to_unicode(self.process.ran)
         self.out.log_external_command(log_cmd)
         if self.file:
             self.file.write("$ " + log_cmd + "\n")
 
+    def restore_from_cache(self):
+        self.out.log("Inputs of this step did not change since it was executed last time, "
+                     "so its results are restored from cache")
+        self._cached_error = self.cache_entry.get_error()
+        log_cmd = format_command(str(self.cmd), self.configuration["command"][1:])
+        self.out.log_external_command(log_cmd)
+        if self.file:
+            self.file.write("$ " + log_cmd + "\n")
+        self.cache_entry.replay(self.handle_stdout, self.handle_stderr)
+        self.cache_entry.restore_artifacts()
+
+    def _terminate_on_timeout(self):
+        self._timed_out = True
+        self._kill()
+
+    def cancel(self):
+        """
+        Kill the processes of the step that is still running, so that :meth:`finalize` reports it as cancelled
+        instead of waiting for it to finish. Does not block, so it is safe to call for several steps in a row
+        """
+        if self.process is None or self._finished.is_set():
+            return
+        self.cancelled = True
+        threading.Thread(target=self._kill, daemon=True).start()
+
+    def _kill(self):
+        # The step is launched in a new session, so its process group ID equals its PID;
+        # the whole group is signalled for child processes of the step not to survive it
+        for sig in (signal.SIGTERM, signal.SIGKILL):
+            try:
+                os.killpg(self.process.pid, sig)
+            except OSError:
+                return
+            if self._finished.wait(self.kill_delay):
+                return
+
     def handle_stdout(self, line=u""):
         line = utils.trim_and_convert_to_unicode(line)
+        if self.cache_entry:
+            self.cache_entry.record("stdout", line + "\n")
 
         if self.file:
             self.file.write(line + "\n")
         elif self._is_background:
-            self._postponed_out.append((self.out.log_shell_output, line))
+            self._postponed_out.append(False, line)
         else:
             self.out.log_shell_output(line)
 
     def handle_stderr(self, line):
         line = utils.trim_and_convert_to_unicode(line)
+        if self.cache_entry:
+            self.cache_entry.record("stderr", line + "\n")
         if self.file:
             self.file.write("stderr: " + line + "\n")
         elif self._is_background:
-            self._postponed_out.append((self.out.log_stderr, line))
+            self._postponed_out.append(True, line)
         else:
             self.out.log_stderr(line)
 
@@ -255,17 +447,36 @@ class Step:
     def finalize(self):
         try:
             text = ""
-            try:
-                self.process.wait()
-            except Exception as e:
-                if isinstance(e, sh.ErrorReturnCode):
-                    text = f"Module sh got exit code {e.exit_code}\n"
-                    if e.stderr:
-                        text += utils.trim_and_convert_to_unicode(e.stderr) + "\n"
-                else:
-                    text = str(e) + '\n'
+            if self._cached_error is not None:
+                text = self._cached_error
+            else:
+                try:
+                    self.process.wait()
+                except Exception as e:
+                    if isinstance(e, sh.ErrorReturnCode):
+                        text = f"Module sh got exit code {e.exit_code}\n"
+                        if e.stderr:
+                            text += utils.trim_and_convert_to_unicode(e.stderr) + "\n"
+                    else:
+                        text = str(e) + '\n'
+                self._stop_timer()
+                self._measure_duration()
+                if self._log_writer:
+                    self._log_writer.close()
+                    self._log_writer = None
+                if self.cancelled:
+                    text = ""
+                elif self._timed_out:
+                    text = f"Step timed out after {float(self.timeout):g} seconds, so all its processes were killed\n"
+                elif self.cache_entry:
+                    self.cache_entry.store(text)
 
             self._handle_postponed_out()
+            if self.cancelled:
+                self.out.log("Step was cancelled, so all its processes were killed")
+                if self.file:
+                    self.file.write("Step was cancelled, so all its processes were killed\n")
+                raise StepException()
             if text:
                 text = utils.trim_and_convert_to_unicode(text)
                 if self.file:
@@ -279,12 +490,49 @@ class Step:
             self.handle_stdout()
             if self.file:
                 self.file.close()
+            self._stop_timer()
+            self._postponed_out.close()
             self._is_background = False
+            self._cached_error = None
+
+    def wait(self):
+        """
+        Block until the launched process exits. Unlike :meth:`finalize`, does not report anything,
+        so it is safe to call from any thread
+        """
+        if self.process is None:
+            return
+        if isinstance(self.process, python_pool.PooledProcess):
+            self.process.join()
+        else:
+            # Unlike RunningCommand.wait(), OProc.wait() does not raise on non-zero exit code,
+            # so the exception is still raised later in finalize()
+            self.process.process.wait()
+        self._measure_duration()
+        self._finished.set()
+
+    def _measure_duration(self):
+        if self.started is not None and self.duration is None:
+            self.finished = time.monotonic()
+            self.duration = self.finished - self.started
+            usage, self._usage = self._usage, None
+            if usage is not None:
+                usage_sampler.finish(usage)
+                self.cpu_time, self.max_rss = usage.cpu_time, usage.max_rss
+
+    def _stop_timer(self):
+        self._finished.set()
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
 
     def _handle_postponed_out(self):
-        for item in self._postponed_out:
-            item[0](item[1])
-        self._postponed_out = []
+        for is_stderr, line in self._postponed_out:
+            if is_stderr:
+                self.out.log_stderr(line)
+            else:
+                self.out.log_shell_output(line)
+        self._postponed_out.close()
 
 
 @needs_output
@@ -295,6 +543,9 @@ class Launcher(ProjectDirectory):
     reporter_factory = Dependency(reporter.Reporter)
     server_factory = Dependency(automation_server.AutomationServerForHostingBuild)
     code_report_collector = Dependency(code_report_collector.CodeReportCollector)
+    step_cache_factory = Dependency(step_cache.StepCache)
+    step_durations_factory = Dependency(step_durations.StepDurations)
+    config_cache_factory = Dependency(config_cache.ConfigCache)
 
     @staticmethod
     def define_arguments(argument_parser):
@@ -304,6 +555,13 @@ class Launcher(ProjectDirectory):
                                         "Log file names are generated based on the names of build steps. "
                                         "By default, logs are printed to console when the build is launched on "
                                         "Jenkins or TeamCity agent")
+        output_parser.add_argument("--log-compression", dest="log_compression", metavar="UNIVERSUM_LOG_COMPRESSION",
+                                   choices=["none"] + sorted(compressed_log.compressions), default="none",
+                                   help="Compress the log files of build steps, when writing logs to files: "
+                                        "'gzip' or 'zstd' (requires 'zstandard' Python package). Logs are compressed "
+                                        "by blocks in background thread; the offsets of blocks and numbers of their "
+                                        "first lines are stored to '.index.json' file next to each log, so that "
+                                        "a viewer can decompress only the required part of the log. Default is 'none'")
 
         parser = argument_parser.get_or_create_group("Configuration execution",
                                                      "External command launching and reporting parameters")
@@ -317,6 +575,74 @@ class Launcher(ProjectDirectory):
                                  "Exlude using '!' symbol before filter. "
                                  "Example: -f='str1:!not str2' OR -f='str1' -f='!not str2'. "
                                  "See online docs for more details.")
+        parser.add_argument("--configs-dump-format", dest="configs_dump_format",
+                            metavar="UNIVERSUM_CONFIGS_DUMP_FORMAT", choices=["text", "jsonl"], default="text",
+                            help="Format of the dump of all configurations, stored to artifacts: 'text' (default) "
+                                 "means a human-readable list in 'CONFIGS_DUMP.txt'; 'jsonl' means JSON object "
+                                 "per configuration in 'CONFIGS_DUMP.jsonl', suitable for processing by tools")
+        parser.add_argument("--filter-type", dest="filter_type", metavar="UNIVERSUM_FILTER_TYPE",
+                            choices=["substring", "glob", "regex"], default="substring",
+                            help="How filters set by '--filter' are matched to step names: 'substring' (default) "
+                                 "means a filter should be a part of the name; 'glob' means the whole name "
+                                 "should match a filter with shell-style wildcards ('*', '?', '[seq]'); "
+                                 "'regex' means a regular expression filter should match a part of the name")
+
+        parser.add_argument("--profile-config", action="store_true", dest="profile_config",
+                            help="Measure the time spent on evaluating config file (including multiplication of "
+                                 "configurations), dumping, filtering and planning steps, the numbers of "
+                                 "configurations, peak memory and the largest products of multiplication, "
+                                 "and store them to 'CONFIGS_PROFILE.json' in artifacts")
+
+        parser.add_argument("--jobs", "-j", dest="jobs", type=int, default=1,
+                            help="Maximum number of build steps to be executed simultaneously. "
+                                 "By default steps are executed one by one; when set to a bigger number, "
+                                 "steps not depending on each other via 'depends_on' or 'critical' keys "
+                                 "are executed in parallel. Logs of such steps are printed in the order "
+                                 "of configuration, as soon as each step is finished")
+
+        parser.add_argument("--fail-fast", action="store_true", dest="fail_fast",
+                            help="When a critical step fails, kill all background and parallel steps that are "
+                                 "still running and report them as cancelled, instead of waiting for them "
+                                 "to finish. Steps that are not started yet are skipped")
+
+        parser.add_argument("--cpus", dest="cpus", metavar="UNIVERSUM_CPUS", type=float,
+                            help="Number of CPUs available for build steps executed simultaneously. A background "
+                                 "or parallel step with 'cpus' or 'memory_mb' keys is only started when "
+                                 "its needs fit into the CPUs and memory left by the running steps. "
+                                 "By default, the number of CPUs available to the process is used")
+        parser.add_argument("--memory-mb", dest="memory_mb", metavar="UNIVERSUM_MEMORY_MB", type=float,
+                            help="Size of memory in megabytes available for build steps executed simultaneously "
+                                 "(see '--cpus'). By default, the size of physical memory is used")
+
+        parser.add_argument("--order", dest="step_order", metavar="UNIVERSUM_STEP_ORDER",
+                            choices=["config", "longest-first"], default="config",
+                            help="Order of starting build steps that do not depend on each other "
+                                 "via 'depends_on', 'critical' or 'finish_background' keys. 'config' (default) "
+                                 "means the order of configuration; 'longest-first' means that the steps that "
+                                 "took longer in previous runs (see '--durations-file'), including the steps "
+                                 "waiting for them, are started first. Logs are printed in the order of "
+                                 "configuration anyway")
+
+        parser.add_argument("--shard-count", dest="shard_count", metavar="UNIVERSUM_SHARD_COUNT", type=int, default=1,
+                            help="Number of agents to split the build steps between. Steps are distributed "
+                                 "so that the total durations of steps in previous runs (see '--durations-file') "
+                                 "are as close as possible; every agent should use the same config, filters and "
+                                 "durations file. Results of all agents can be combined by 'merge-reports' command")
+        parser.add_argument("--shard-index", dest="shard_index", metavar="UNIVERSUM_SHARD_INDEX", type=int,
+                            help="Zero-based index of the steps part to be executed by current agent; "
+                                 "mandatory if '--shard-count' is more than one")
+
+        parser.add_argument("--step-timeout", dest="step_timeout", metavar="UNIVERSUM_STEP_TIMEOUT", type=float,
+                            help="Default time limit in seconds for each build step. A step that is still "
+                                 "running when the time is out is failed, and all its processes are killed. "
+                                 "Can be overridden for a single step with 'timeout' key in configuration. "
+                                 "By default steps have no time limit")
+
+        parser.add_argument("--background-output-limit", dest="background_output_limit", type=int, default=1024,
+                            metavar="UNIVERSUM_BACKGROUND_OUTPUT_LIMIT",
+                            help="Size in kilobytes of the output of a single background step to be kept in memory "
+                                 "until the step is finished. The output exceeding the limit is stored in "
+                                 "a temporary file instead. Default is 1024")
 
         parser.add_hidden_argument("--launcher-output", "-lo", dest="output", choices=["console", "file"],
                                    help="Deprecated option. Please use '--out' instead.", is_hidden=True)
@@ -327,6 +653,7 @@ class Launcher(ProjectDirectory):
         super(Launcher, self).__init__(*args, **kwargs)
         self.source_project_configs = None
         self.project_configs = None
+        self.step_plan = None
 
         self.output = self.settings.output
         if self.output is None:
@@ -334,6 +661,9 @@ class Launcher(ProjectDirectory):
                 self.output = "file"
             else:
                 self.output = "console"
+        if self.settings.log_compression != "none":
+            # Missing packages should be reported before any step is executed
+            compressed_log.make_compressor(self.settings.log_compression)
 
         if not getattr(self.settings, "config_path", None):
             raise IncorrectParameterError(
@@ -347,29 +677,84 @@ class Launcher(ProjectDirectory):
         self.reporter = self.reporter_factory()
         self.server = self.server_factory()
         self.code_report_collector = self.code_report_collector()
+        self.step_cache = self.step_cache_factory()
+        self.python_pool = python_pool.PythonPool()
+        self.step_durations = self.step_durations_factory()
+        self.config_cache = self.config_cache_factory()
+        self.launched_steps = []
+        self.budget = ResourceBudget(self.settings.cpus, self.settings.memory_mb)
         self.include_patterns, self.exclude_patterns = get_match_patterns(self.settings.step_filter)
+        self.step_name_matcher = StepNameMatcher(self.include_patterns, self.exclude_patterns,
+                                                 self.settings.filter_type)
+        if self.settings.jobs < 1:
+            raise IncorrectParameterError("the number of jobs ('--jobs') should be a positive integer")
+        if (self.settings.cpus is not None and self.settings.cpus <= 0) or \
+                (self.settings.memory_mb is not None and self.settings.memory_mb <= 0):
+            raise IncorrectParameterError("the number of CPUs ('--cpus') and the size of memory ('--memory-mb') "
+                                          "should be positive numbers")
+        if self.settings.background_output_limit < 0:
+            raise IncorrectParameterError("the background output limit ('--background-output-limit') "
+                                          "should not be negative")
+        if self.settings.shard_count < 1:
+            raise IncorrectParameterError("the number of shards ('--shard-count') should be a positive integer")
+        if self.settings.shard_count > 1:
+            if self.settings.shard_index is None:
+                raise IncorrectParameterError("the shard index is not specified.\n"
+                                              "Please specify the zero-based index of current shard by using\n"
+                                              "'--shard-index' command-line option or\n"
+                                              "UNIVERSUM_SHARD_INDEX environment variable")
+            if not 0 <= self.settings.shard_index < self.settings.shard_count:
+                raise IncorrectParameterError("the shard index ('--shard-index') should be "
+                                              "in range from 0 to shard count minus one")
 
     @make_block("Processing project configs")
     def process_project_configs(self):
         config_path = utils.parse_path(self.settings.config_path, self.settings.project_root)
         configuration_support.set_project_root(self.settings.project_root)
-        config_globals = {}
         sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
         sys.path.append(os.path.join(os.path.dirname(config_path)))
 
-        try:
+        def evaluate_configs():
+            config_globals = {}
             with open(config_path) as config:
                 exec(config.read(), config_globals)  # pylint: disable=exec-used
+            return config_globals["configs"]
 
-            self.source_project_configs = config_globals["configs"]
-            dump_file = self.artifacts.create_text_file("CONFIGS_DUMP.txt")
-            dump_file.write(self.source_project_configs.dump())
-            dump_file.close()
-
-            configs = self.source_project_configs.filter(check_if_env_set)
-            self.project_configs = configs.filter(lambda config: check_str_match(config['name'],
-                                                                                 self.include_patterns,
-                                                                                 self.exclude_patterns))
+        profile = ConfigProfile(config_path, self.settings.profile_config)
+        try:
+            with profile.recording():
+                with profile.measure("evaluation"):
+                    self.source_project_configs = self.config_cache.get_configs(config_path,
+                                                                                self.settings.project_root,
+                                                                                evaluate_configs)
+                profile.record_leaves("evaluated", self.source_project_configs)
+
+                with profile.measure("dumping"):
+                    if self.settings.configs_dump_format == "jsonl":
+                        dump_file = self.artifacts.create_text_file("CONFIGS_DUMP.jsonl")
+                    else:
+                        dump_file = self.artifacts.create_text_file("CONFIGS_DUMP.txt")
+                    self.source_project_configs.dump_to(dump_file,
+                                                        json_lines=self.settings.configs_dump_format == "jsonl")
+                    dump_file.close()
+
+                with profile.measure("filtering"):
+                    # Both conditions are checked in one pass through configurations
+                    env_condition_checker = EnvConditionChecker()
+                    self.project_configs = self.source_project_configs.filter(
+                        lambda config: env_condition_checker(config) and self.step_name_matcher(config['name']))
+                    if self.settings.shard_count > 1:
+                        self.project_configs = self.select_shard(self.project_configs)
+                profile.record_leaves("filtered", self.project_configs)
+
+                with profile.measure("planning"):
+                    # All further processing of configurations uses the plan instead of expanding them again
+                    self.step_plan = StepPlan(self.project_configs)
+
+            if profile.enabled:
+                profile_file = self.artifacts.create_text_file("CONFIGS_PROFILE.json")
+                profile.save(profile_file)
+                profile_file.close()
 
         except IOError as e:
             text = f"""{e}\n
@@ -390,7 +775,41 @@ class Launcher(ProjectDirectory):
                    "\nPlease copy 'configs.py' script to the CI scripts folder and run it " + \
                    "to make sure no exceptions occur in that case."
             raise CriticalCiException(text)
-        return self.project_configs
+        return self.step_plan
+
+    def select_shard(self, configs):
+        names = [item.get("name", "") for item in configs.iterate_leaves()]
+        durations = self.step_durations.get_all()
+        known_durations = [durations[name] for name in names if name in durations]
+        # Steps never executed before are considered to take average time
+        default_duration = sum(known_durations) / len(known_durations) if known_durations else 1.0
+        weights = [durations.get(name, default_duration) for name in names]
+
+        shards = split_into_shards(weights, self.settings.shard_count)
+        selected = [index for index, shard in enumerate(shards) if shard == self.settings.shard_index]
+        self.out.log(f"Shard {self.settings.shard_index} of {self.settings.shard_count}: executing "
+                     f"{len(selected)} of {len(names)} steps, estimated duration is "
+                     f"{sum(weights[index] for index in selected):.0f} seconds")
+        self.reporter.save_report_for_merging(self.artifacts.create_text_file(
+            f"SHARD_REPORT_{self.settings.shard_index}.json"), selected)
+
+        # Filter calls the checker for leaf configurations in the same order as they are returned by all()
+        selected = set(selected)
+        counter = itertools.count()
+        return configs.filter(lambda config: next(counter) in selected)
+
+    def record_step_durations(self):
+        # Cancelled steps did not run to the end, so their durations are not representative
+        durations = {step.configuration.get("name", ""): step.duration
+                     for step in self.launched_steps if step.duration is not None and not step.cancelled}
+        self.launched_steps = []
+        if self.settings.shard_count > 1:
+            # Durations file should not change until all shards are split, so it is updated by 'merge-reports'
+            self.reporter.save_durations_for_merging(durations)
+            return
+        for name, duration in durations.items():
+            self.step_durations.record(name, duration)
+        self.step_durations.save()
 
     def create_process(self, item):
         working_directory = utils.parse_path(utils.strip_path_start(item.get("directory", "").rstrip("/")),
@@ -404,17 +823,41 @@ class Launcher(ProjectDirectory):
 
         log_file = None
         if self.output == "file":
-            log_file = self.artifacts.create_text_file(item.get("name", "") + "_log.txt")
+            if self.settings.log_compression == "none":
+                log_file = self.artifacts.create_text_file(item.get("name", "") + "_log.txt")
+            else:
+                log_file = self.artifacts.create_compressed_text_file(item.get("name", "") + "_log.txt",
+                                                                      self.settings.log_compression)
             self.out.log("Execution log is redirected to file")
 
         additional_environment = self.api_support.get_environment_settings()
-        return Step(item, self.out, fail_block, self.server.add_build_tag,
-                    log_file, working_directory, additional_environment)
+        cache_entry = self.step_cache.get_entry(item, working_directory,
+                                                make_step_environment(item, additional_environment))
+        timeout = item.get("timeout", self.settings.step_timeout)
+        step = Step(item, self.out, fail_block, self.server.add_build_tag,
+                    log_file, working_directory, additional_environment, cache_entry, timeout,
+                    self.settings.background_output_limit * 1024, self.python_pool)
+        self.launched_steps.append(step)
+        return step
 
     def launch_custom_configs(self, custom_configs):
-        self.structure.execute_step_structure(custom_configs, self.create_process)
+        try:
+            self.structure.execute_step_structure(StepPlan(custom_configs), self.create_process,
+                                                  budget=self.budget, fail_fast=self.settings.fail_fast)
+        finally:
+            self.python_pool.close()
+            # Custom configs are additional runs of the same steps, so their durations are not stored
+            self.launched_steps = []
 
     @make_block("Executing build steps")
     def launch_project(self):
         self.reporter.add_block_to_report(self.structure.get_current_block())
-        self.structure.execute_step_structure(self.project_configs, self.create_process)
+        get_duration = None
+        if self.settings.step_order == "longest-first":
+            get_duration = self.step_durations.get_for_configuration
+        try:
+            self.structure.execute_step_structure(self.step_plan, self.create_process, self.settings.jobs,
+                                                  get_duration, self.budget, self.settings.fail_fast)
+        finally:
+            self.python_pool.close()
+            self.record_step_durations()
@@ -38,3 +38,6 @@ class BaseOutput(Module):
 
     def log_shell_output(self, line):
         raise NotImplementedError
+
+    def flush(self):
+        raise NotImplementedError
@@ -0,0 +1,104 @@
+import atexit
+import sys
+import threading
+import time
+
+__all__ = [
+    "BufferedWriter",
+    "stdout_writer"
+]
+
+
+class BufferedWriter:
+    """
+    Text collected in memory and written to the stream by a separate thread in big chunks, no later than
+    `latency` seconds after it was collected. The separate thread only writes the text when at least
+    `size_limit` characters are collected or `latency` seconds passed since the first of them was collected.
+    The text is always written in the order of :meth:`write` calls; :meth:`flush` writes all the collected
+    text right away, and is also called on exit
+    """
+
+    def __init__(self, get_stream=lambda: sys.stdout, latency=0.05, size_limit=64 * 1024):
+        """
+        :param get_stream: function returning the stream to write to; is called on each write,
+            so that the stream can be replaced (e.g. by tests capturing the output)
+        :param latency: maximum time in seconds the text is kept in memory before writing
+        :param size_limit: size of collected text in characters to be written without waiting for `latency`
+        """
+        self.get_stream = get_stream
+        self.latency = latency
+        self.size_limit = size_limit
+        self._chunks = []
+        self._size = 0
+        self._first_time = None
+        self._lock = threading.Lock()
+        self._has_text = threading.Event()
+        self._is_full = threading.Event()
+        # Taking the collected text and writing it are done under one lock, so that the order is kept
+        self._write_lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+
+    def write(self, text):
+        with self._lock:
+            self._chunks.append(text)
+            self._size += len(text)
+            is_first = len(self._chunks) == 1
+            if is_first:
+                self._first_time = time.monotonic()
+            is_full = self._size >= self.size_limit
+            closed = self._closed
+            if self._thread is None and not closed:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+        # After closing there is no thread to write the text
+        if closed:
+            self.flush()
+            return
+        # Events are only set on changes, as setting them is much slower than appending the text
+        if is_first:
+            self._has_text.set()
+        if is_full and not self._is_full.is_set():
+            self._is_full.set()
+
+    def flush(self):
+        with self._write_lock:
+            with self._lock:
+                text = "".join(self._chunks)
+                self._chunks = []
+                self._size = 0
+            if text:
+                stream = self.get_stream()
+                stream.write(text)
+                stream.flush()
+
+    def _run(self):
+        while not self._closed:
+            self._has_text.wait()
+            # Text written after clearing the event is either taken by the following flush or sets it again
+            self._has_text.clear()
+            # More text is collected for a while, unless there is already enough to write
+            while True:
+                with self._lock:
+                    if self._closed or not self._chunks or self._size >= self.size_limit:
+                        break
+                    remaining = self._first_time + self.latency - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._is_full.wait(remaining)
+                # The event might be set for the text already taken by previous flush, so the size is checked again
+                self._is_full.clear()
+            self.flush()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        self._has_text.set()
+        self._is_full.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+# Shared by all output drivers, so that the order of their output is kept
+stdout_writer = BufferedWriter()
@@ -0,0 +1,85 @@
+import atexit
+import json
+import threading
+import time
+
+from .base_output import BaseOutput
+
+__all__ = [
+    "EventLogOutput"
+]
+
+
+class EventLogOutput(BaseOutput):
+    """
+    Output driver writing build events to a file as JSON Lines: one JSON object per event, containing
+    the time of the event (seconds since epoch), its type and details. It is used along with the main driver,
+    so that the build can be processed by tools without parsing the console log. Output of the steps
+    is not included, except for the lines printed to stderr.
+
+    Every method also accepts the time of the event, for the events recorded earlier and replayed later
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(EventLogOutput, self).__init__(*args, **kwargs)
+        self.file = None
+        self._lock = threading.Lock()
+
+    def open(self, path):
+        # The file is only appended to, so that several runs can share it
+        self.file = open(path, "a", encoding="utf-8")
+        # Closed on exit however the run ends, so that the events written last are not lost
+        atexit.register(self.close)
+
+    def close(self):
+        with self._lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def write_event(self, event, timestamp, **details):
+        text = json.dumps(dict(time=round(time.time() if timestamp is None else timestamp, 6), event=event,
+                               **details), ensure_ascii=False, separators=(",", ":"), default=str)
+        with self._lock:
+            # Events of the threads still running on exit are dropped after the file is closed
+            if self.file is not None:
+                self.file.write(text + "\n")
+
+    def open_block(self, num_str, name, timestamp=None):
+        self.write_event("open_block", timestamp, number=num_str, name=name)
+
+    def close_block(self, num_str, name, status, timestamp=None):
+        self.write_event("close_block", timestamp, number=num_str, name=name, status=status)
+        self.flush()
+
+    def report_error(self, description, timestamp=None):
+        self.write_event("build_problem", timestamp, text=description)
+
+    def report_skipped(self, message, timestamp=None):
+        self.write_event("skipped", timestamp, text=message)
+
+    def report_step(self, message, status, timestamp=None):
+        self.write_event("step_result", timestamp, text=message, status=status)
+
+    def change_status(self, message, timestamp=None):
+        self.write_event("status", timestamp, text=message)
+
+    def log_exception(self, line, timestamp=None):
+        self.write_event("error", timestamp, text=line)
+
+    def log_stderr(self, line, timestamp=None):
+        self.write_event("stderr", timestamp, text=line)
+
+    def log(self, line, timestamp=None):
+        self.write_event("log", timestamp, text=line)
+
+    def log_external_command(self, command, timestamp=None):
+        self.write_event("command", timestamp, text=command)
+
+    def log_shell_output(self, line, timestamp=None):
+        pass
+
+    def flush(self, timestamp=None):
+        with self._lock:
+            if self.file is not None:
+                self.file.flush()
@@ -1,10 +1,17 @@
+import contextlib
+import os
+import time
+
 from ...lib.gravity import Module, Dependency
+from ...lib.module_arguments import IncorrectParameterError
 from ...lib import utils
+from .event_log_output import EventLogOutput
 from .terminal_based_output import TerminalBasedOutput
 from .teamcity_output import TeamcityOutput
 
 __all__ = [
-    "needs_output"
+    "needs_output",
+    "OutputRecorder"
 ]
 
 
@@ -21,9 +28,25 @@ def needs_output(klass):
     return klass
 
 
+class OutputRecorder:
+    """
+    Driver stub storing all the calls instead of printing them, so that they can be
+    replayed later by the real driver in the same order
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        def record(*args):
+            self.calls.append((name, args, time.time()))
+        return record
+
+
 class Output(Module):
     teamcity_driver_factory = Dependency(TeamcityOutput)
     terminal_driver_factory = Dependency(TerminalBasedOutput)
+    event_log_factory = Dependency(EventLogOutput)
 
     @staticmethod
     def define_arguments(argument_parser):
@@ -31,6 +54,12 @@ class Output(Module):
         parser.add_argument("--out-type", "-ot", dest="type", choices=["tc", "term", "jenkins"],
                             help="Type of output to produce (tc - TeamCity, jenkins - Jenkins, term - terminal). "
                                  "TeamCity environment is detected automatically when launched on build agent.")
+        parser.add_argument("--event-log", dest="event_log", metavar="UNIVERSUM_EVENT_LOG",
+                            help="File to append build events to, in addition to the output set by '--out-type': "
+                                 "opening and closing blocks (including build steps) with their statuses, "
+                                 "launched commands, log messages, errors, stderr lines of steps and build status "
+                                 "changes. Every line of the file is a JSON object with 'time', 'event' and "
+                                 "event-specific keys")
 
     def __init__(self, *args, **kwargs):
         super(Output, self).__init__(*args, **kwargs)
@@ -38,37 +67,80 @@ class Output(Module):
                                           teamcity_factory=self.teamcity_driver_factory,
                                           jenkins_factory=self.terminal_driver_factory,
                                           env_type=self.settings.type)
+        self.event_log = None
+        if self.settings.event_log:
+            self.event_log = self.event_log_factory()
+            try:
+                self.event_log.open(utils.parse_path(self.settings.event_log, os.getcwd()))
+            except OSError as e:
+                raise IncorrectParameterError(f"failed to open event log file: {e}")
+        self.recorder = None
+
+    @contextlib.contextmanager
+    def postponed(self, recorder):
+        """
+        Redirect all output to `recorder` instead of printing it; the output can later be printed
+        by :meth:`replay`. Is intended for steps executed in parallel, whose logs should not mix
+        """
+        driver = self.driver
+        self.driver = recorder
+        self.recorder = recorder
+        try:
+            yield recorder
+        finally:
+            self.driver = driver
+            self.recorder = None
+
+    def replay(self, recorder):
+        for name, args, timestamp in recorder.calls:
+            getattr(self.driver, name)(*args)
+            if self.event_log is not None:
+                getattr(self.event_log, name)(*args, timestamp=timestamp)
+        recorder.calls = []
+
+    def _call(self, name, *args):
+        getattr(self.driver, name)(*args)
+        # Postponed calls are passed to event log on replay, with the time they were recorded
+        if self.event_log is not None and self.recorder is None:
+            getattr(self.event_log, name)(*args)
 
     def log(self, line):
-        self.driver.log(line)
+        self._call("log", line)
 
     def log_external_command(self, command):
-        self.driver.log_external_command(command)
+        self._call("log_external_command", command)
 
     def open_block(self, number, name):
-        self.driver.open_block(number, name)
+        self._call("open_block", number, name)
 
     def close_block(self, number, name, status):
-        self.driver.close_block(number, name, status)
+        self._call("close_block", number, name, status)
 
     def report_build_status(self, status):
-        self.driver.change_status(status)
+        self._call("change_status", status)
 
     # TODO: pass build problem to the Report module
     def report_build_problem(self, problem):
-        self.driver.report_error(problem)
+        self._call("report_error", problem)
 
     def report_skipped(self, message):
-        self.driver.report_skipped(message)
+        self._call("report_skipped", message)
 
     def report_step(self, message, status):
-        self.driver.report_step(message, status)
+        self._call("report_step", message, status)
 
     def log_exception(self, line):
-        self.driver.log_exception(line)
+        self._call("log_exception", line)
 
     def log_stderr(self, line):
-        self.driver.log_stderr(line)
+        self._call("log_stderr", line)
 
     def log_shell_output(self, line):
+        # Output of steps is not included in event log, and is the most frequent call
         self.driver.log_shell_output(line)
+
+    def flush(self):
+        """
+        Write all the output collected by the driver right away
+        """
+        self._call("flush")
@@ -1,47 +1,58 @@
 from .base_output import BaseOutput
+from .buffered_writer import stdout_writer
 
 __all__ = [
     "TeamcityOutput"
 ]
 
+escape_table = str.maketrans({'\r': None, '|': '||', '\'': '|\'', '[': '|[', ']': '|]'})
+
 
 def escape(message):
-    return message.replace('\r', '').replace('|', '||').replace('\'', '|\'').replace('[', '|[').replace(']', '|]')
+    """
+    >>> escape("[1/2] 'step'|")
+    "|[1/2|] |'step|'||"
+    """
+    return message.translate(escape_table)
+
+
+def print_messages(message, status):
+    stdout_writer.write("".join(f"##teamcity[message text='{escape(line)}' status='{status}']\n"
+                                for line in message.split("\n")))
 
 
 class TeamcityOutput(BaseOutput):
     def open_block(self, num_str, name):
-        print(u"##teamcity[blockOpened name='{} {}']".format(num_str, escape(name)))
+        stdout_writer.write(f"##teamcity[blockOpened name='{num_str} {escape(name)}']\n")
+        stdout_writer.flush()
 
     def close_block(self, num_str, name, status):
-        print(u"##teamcity[blockClosed name='{} {}']".format(num_str, escape(name)))
+        stdout_writer.write(f"##teamcity[blockClosed name='{num_str} {escape(name)}']\n")
+        stdout_writer.flush()
 
     def report_error(self, description):
-        print(u"##teamcity[buildProblem description='<{}>']".format(escape(description)))
+        stdout_writer.write(f"##teamcity[buildProblem description='<{escape(description)}>']\n")
 
     def report_skipped(self, message):
-        lines = message.split("\n")
-        for single_line in lines:
-            print(u"##teamcity[message text='{}' status='WARNING']".format(escape(single_line)))
+        print_messages(message, "WARNING")
 
     def change_status(self, message):
-        print(u"##teamcity[buildStatus text='{}']".format(escape(message)))
+        stdout_writer.write(f"##teamcity[buildStatus text='{escape(message)}']\n")
 
     def log_exception(self, line):
-        lines = line.split("\n")
-        for single_line in lines:
-            print(u"##teamcity[message text='{}' status='ERROR']".format(escape(single_line)))
+        print_messages(line, "ERROR")
 
     def log_stderr(self, line):
-        lines = line.split("\n")
-        for single_line in lines:
-            print(u"##teamcity[message text='{}' status='WARNING']".format(escape(single_line)))
+        print_messages(line, "WARNING")
 
     def log(self, line):
-        print(u"==>", line)
+        stdout_writer.write(f"==> {line}\n")
 
     def log_external_command(self, command):
-        print(u"$", command)
+        stdout_writer.write(f"$ {command}\n")
 
     def log_shell_output(self, line):
-        print(line)
+        stdout_writer.write(f"{line}\n")
+
+    def flush(self):
+        stdout_writer.flush()
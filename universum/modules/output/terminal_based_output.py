@@ -1,7 +1,5 @@
-import sys
-
-from six.moves import range
 from .base_output import BaseOutput
+from .buffered_writer import stdout_writer
 
 __all__ = [
     "TerminalBasedOutput"
@@ -19,42 +17,49 @@ class Colors:
 
 
 def stdout(*args, **kwargs):
-    sys.stdout.write(''.join(args))
+    text = ''.join(args)
     if not kwargs.get("no_enter", False):
-        sys.stdout.write('\n')
+        text += '\n'
+    stdout_writer.write(text)
 
 
 class TerminalBasedOutput(BaseOutput):
     def __init__(self, *args, **kwargs):
         super(TerminalBasedOutput, self).__init__(*args, **kwargs)
         self.block_level = 0
+        self.indent_prefix = ""
 
-    def indent(self):
-        for x in range(0, self.block_level):
-            stdout("  " * x, " |   ", no_enter=True)
+    def set_block_level(self, block_level):
+        self.block_level = block_level
+        # The prefix is only changed with block level, so it is not built for every line
+        self.indent_prefix = "".join("  " * x + " |   " for x in range(block_level))
 
     def print_lines(self, *args):
-        result = ''.join(args)
-        lines = result.splitlines(False)
-        for line in lines:
-            self.indent()
-            stdout(line)
+        lines = ''.join(args).splitlines(False)
+        if lines:
+            prefix = self.indent_prefix
+            stdout(prefix, ('\n' + prefix).join(lines))
 
     def open_block(self, num_str, name):
-        self.indent()
-        stdout(num_str, ' ', Colors.blue, name, Colors.reset)
-        self.block_level += 1
+        stdout(self.indent_prefix, num_str, ' ', Colors.blue, name, Colors.reset)
+        self.set_block_level(self.block_level + 1)
+        stdout_writer.flush()
 
     def close_block(self, num_str, name, status):
-        self.block_level -= 1
-        self.indent()
+        self.set_block_level(self.block_level - 1)
 
         if status == "Failed":
-            stdout(self.block_level * "  ", " \u2514 ", Colors.red, "[Failed]", Colors.reset)
+            color, text = Colors.red, "[Failed]"
+        elif status == "Cancelled":
+            color, text = Colors.dark_yellow, "[Cancelled]"
         else:
-            stdout(self.block_level * "  ", " \u2514 ", Colors.green, "[Success]", Colors.reset)
-        self.indent()
-        stdout()
+            color, text = Colors.green, "[Success]"
+        stdout(self.indent_prefix, self.block_level * "  ", " \u2514 ", color, text, Colors.reset, '\n',
+               self.indent_prefix)
+        stdout_writer.flush()
+
+    def flush(self):
+        stdout_writer.flush()
 
     def report_error(self, description):
         pass
@@ -1,3 +1,4 @@
+import json
 from collections import defaultdict
 
 from ..lib.gravity import Module, Dependency
@@ -8,10 +9,30 @@ from .structure_handler import needs_structure
 
 __all__ = [
     "ReportObserver",
-    "Reporter"
+    "Reporter",
+    "block_to_dict",
+    "block_timings_to_dict"
 ]
 
 
+def block_to_dict(block):
+    return dict(name=block.name, status=block.status, children=[block_to_dict(child) for child in block.children])
+
+
+def block_timings_to_dict(block, origin):
+    """
+    :param origin: monotonic time the start of the block is counted from
+    """
+    def round_value(value):
+        return None if value is None else round(value, 3)
+
+    started = None if block.started is None else block.started - origin
+    return dict(number=block.number, name=block.name, status=block.status, started=round_value(started),
+                duration=round_value(block.duration), cpu_time=round_value(block.cpu_time),
+                max_rss_mb=round_value(block.max_rss),
+                children=[block_timings_to_dict(child, origin) for child in block.children])
+
+
 class ReportObserver:
     """
     Abstract base class for reporting modules
@@ -56,6 +77,9 @@ class Reporter(Module):
         self.blocks_to_report = []
         self.artifacts_to_report = []
         self.code_report_comments = defaultdict(list)
+        self.merge_file = None
+        self.durations_to_merge = {}
+        self.step_indexes = []
 
         self.automation_server = self.automation_server_factory()
 
@@ -84,6 +108,14 @@ class Reporter(Module):
         for observer in self.observers:
             observer.report_start(text)
 
+    def clear_report(self):
+        """
+        Forget the blocks and artifacts to report, so that the steps executed again are reported separately
+        """
+        self.blocks_to_report = []
+        self.artifacts_to_report = []
+        self.code_report_comments = defaultdict(list)
+
     def add_block_to_report(self, block):
         self.blocks_to_report.append(block)
 
@@ -93,6 +125,41 @@ class Reporter(Module):
     def code_report(self, path, message):
         self.code_report_comments[path].append(message)
 
+    def save_report_for_merging(self, file, step_indexes):
+        """
+        Instead of reporting build result, write it to the file to be reported later
+        together with results of other shards of the same build
+
+        :param file: file object to write the result to
+        :param step_indexes: indexes of the steps executed in current shard among all the configurations
+        """
+        self.merge_file = file
+        self.step_indexes = step_indexes
+
+    def save_durations_for_merging(self, durations):
+        self.durations_to_merge.update(durations)
+
+    def _save_report(self):
+        report = dict(blocks=[block_to_dict(block) for block in self.blocks_to_report],
+                      artifacts=self.artifacts_to_report,
+                      code_report=self.code_report_comments,
+                      durations=self.durations_to_merge,
+                      step_indexes=self.step_indexes)
+        self.merge_file.write(json.dumps(report, indent=4))
+        self.merge_file.close()
+        self.merge_file = None
+
+    def save_build_timings(self, file):
+        """
+        Write the durations of all the blocks executed so far, and CPU time and peak RSS of the steps, to the file
+
+        :param file: file object to write the timings to; is closed afterwards
+        """
+        root = self.structure.root_block
+        timings = [block_timings_to_dict(block, root.started) for block in root.children]
+        file.write(json.dumps(dict(blocks=timings), indent=4))
+        file.close()
+
     @make_block("Reporting build result", pass_errors=False)
     def report_build_result(self):
         if self.report_initialized is False:
@@ -109,6 +176,11 @@ class Reporter(Module):
             text += "  All steps succeeded"
             self.out.log("  All steps succeeded")
 
+        if self.merge_file is not None:
+            self._save_report()
+            self.out.log("Build result is saved to be reported together with other shards. Skipping...")
+            return
+
         if not self.observers:
             self.out.log("Nowhere to report. Skipping...")
             return
@@ -143,11 +215,11 @@ class Reporter(Module):
 
     def _report_steps_recursively(self, block, text, indent):
         if not self.settings.only_fails:
-            text += indent + str(block) + '\n'
-            self.out.report_step(indent + str(block), block.status)
+            text += indent + str(block) + block.get_usage_text() + '\n'
+            self.out.report_step(indent + str(block) + block.get_usage_text(), block.status)
         elif not block.is_successful():
-            text += str(block) + '\n'
-            self.out.report_step(str(block), block.status)
+            text += str(block) + block.get_usage_text() + '\n'
+            self.out.report_step(str(block) + block.get_usage_text(), block.status)
 
         is_successful = block.is_successful()
         for substep in block.children:
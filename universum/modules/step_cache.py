@@ -0,0 +1,275 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import glob2
+import glob2.impl
+
+from .. import __version__
+from ..lib import utils
+from .output import needs_output
+from .project_directory import ProjectDirectory
+
+__all__ = [
+    "StepCache",
+    "StepCacheEntry"
+]
+
+
+def hash_file(hasher, file_path):
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            hasher.update(chunk)
+
+
+class PathSetGlobber(glob2.impl.Globber):
+    """
+    Globber searching the given paths instead of the file system, so that the paths of deleted files
+    can be matched to patterns the same way as the paths of existing ones
+
+    >>> globber = PathSetGlobber(["/p/src/a.c", "/p/src/lib/b.c", "/p/src/lib/b.h", "/p/README"])
+    >>> sorted(globber.glob("/p/src/**/*.c"))
+    ['/p/src/a.c', '/p/src/lib/b.c']
+    >>> globber.glob("/p/*.c"), globber.isdir("/p/src"), globber.isdir("/p/README")
+    ([], True, False)
+    """
+
+    def __init__(self, paths):
+        self.paths = set()
+        self.directories = {}
+        for path in paths:
+            path = os.path.normpath(path)
+            self.paths.add(path)
+            parent, name = os.path.split(path)
+            while name:
+                self.directories.setdefault(parent, set()).add(name)
+                parent, name = os.path.split(parent)
+
+    def listdir(self, path):
+        names = self.directories.get(os.path.normpath(path))
+        if names is None:
+            raise OSError(f"Not a directory: '{path}'")
+        return sorted(names)
+
+    def isdir(self, path):
+        return os.path.normpath(path) in self.directories
+
+    def islink(self, path):
+        return False
+
+    def exists(self, path):
+        path = os.path.normpath(path)
+        return path in self.paths or path in self.directories
+
+
+def collect_input_files(patterns, project_root, paths=None):
+    """
+    :param patterns: path or list of paths relative to `project_root`, that can contain shell-style wildcards
+    :param paths: absolute paths to match instead of the files on disk; they do not need to exist
+    :return: sorted list of the matching files, including all the files of matching directories
+    """
+    if isinstance(patterns, str):
+        patterns = [patterns]
+    globber = glob2.impl.Globber() if paths is None else PathSetGlobber(paths)
+    input_files = set()
+    for pattern in patterns:
+        for matching_path in globber.glob(utils.parse_path(pattern, project_root)):
+            if not globber.isdir(matching_path):
+                input_files.add(matching_path)
+            elif paths is None:
+                for dir_path, _, file_names in os.walk(matching_path):
+                    input_files.update(os.path.join(dir_path, name) for name in file_names)
+            else:
+                prefix = os.path.join(os.path.normpath(matching_path), "")
+                input_files.update(path for path in globber.paths if path.startswith(prefix))
+    return sorted(input_files)
+
+
+def copy_path(source, destination):
+    if os.path.exists(destination):
+        return
+    destination_dir = os.path.dirname(destination)
+    if destination_dir and not os.path.exists(destination_dir):
+        os.makedirs(destination_dir)
+    if os.path.isdir(source):
+        shutil.copytree(source, destination, symlinks=True)
+    else:
+        shutil.copy2(source, destination)
+
+
+class StepCacheEntry:
+    """
+    Results of one step stored in cache: the step log, the error message (empty for successful steps)
+    and the copies of the step artifacts, all stored in a directory named by the hash of the step inputs
+    """
+
+    def __init__(self, cache_dir, key, project_root, artifact_patterns, cache_failures=False):
+        self.key = key
+        self.path = os.path.join(cache_dir, key)
+        self.cache_dir = cache_dir
+        self.project_root = project_root
+        self.artifact_patterns = artifact_patterns
+        self.cache_failures = cache_failures
+        self._temp_path = None
+        self._log = None
+
+    def exists(self):
+        return os.path.exists(os.path.join(self.path, "result.json"))
+
+    def get_error(self):
+        with open(os.path.join(self.path, "result.json")) as result_file:
+            return json.load(result_file)["error"]
+
+    def replay(self, handle_stdout, handle_stderr):
+        handlers = dict(stdout=handle_stdout, stderr=handle_stderr)
+        # Output might be recorded in chunks not matching the line boundaries
+        incomplete_lines = dict(stdout="", stderr="")
+        with open(os.path.join(self.path, "log.jsonl"), encoding="utf-8") as log:
+            for record in log:
+                stream, text = json.loads(record)
+                lines = (incomplete_lines[stream] + text).split("\n")
+                incomplete_lines[stream] = lines.pop()
+                for line in lines:
+                    handlers[stream](line)
+        for stream, line in incomplete_lines.items():
+            if line:
+                handlers[stream](line)
+
+    def restore_artifacts(self):
+        artifacts_path = os.path.join(self.path, "artifacts")
+        if not os.path.exists(artifacts_path):
+            return
+        for dir_path, _, file_names in os.walk(artifacts_path):
+            for file_name in file_names:
+                source = os.path.join(dir_path, file_name)
+                destination = os.path.join(self.project_root, os.path.relpath(source, artifacts_path))
+                copy_path(source, destination)
+
+    def start_recording(self):
+        self._temp_path = tempfile.mkdtemp(prefix="." + self.key, dir=self.cache_dir)
+        self._log = open(os.path.join(self._temp_path, "log.jsonl"), "w", encoding="utf-8")
+
+    def record(self, stream, text):
+        if self._log and text:
+            self._log.write(json.dumps([stream, text]) + "\n")
+
+    def store(self, error):
+        if not self._log:
+            return
+        self._log.close()
+        self._log = None
+        # Failures might be caused by something not included in the hash, e.g. network or disk space
+        if error and not self.cache_failures:
+            shutil.rmtree(self._temp_path, ignore_errors=True)
+            self._temp_path = None
+            return
+        try:
+            for pattern in self.artifact_patterns:
+                for matching_path in glob2.glob(pattern):
+                    relative_path = os.path.relpath(matching_path, self.project_root)
+                    copy_path(matching_path, os.path.join(self._temp_path, "artifacts", relative_path))
+            with open(os.path.join(self._temp_path, "result.json"), "w") as result_file:
+                json.dump(dict(error=error), result_file)
+            # Renaming is atomic, so simultaneous steps with the same inputs cannot corrupt the entry
+            os.rename(self._temp_path, self.path)
+        except OSError:
+            shutil.rmtree(self._temp_path, ignore_errors=True)
+        self._temp_path = None
+
+
+@needs_output
+class StepCache(ProjectDirectory):
+    @staticmethod
+    def define_arguments(argument_parser):
+        parser = argument_parser.get_or_create_group("Configuration execution")
+        parser.add_argument("--cache-dir", dest="cache_dir", metavar="UNIVERSUM_CACHE_DIR",
+                            help="Directory to store the results of build steps between runs. If set, the steps "
+                                 "with 'cache_inputs' key are not executed when their command, environment and "
+                                 "input files did not change since the previous run; instead their log, "
+                                 "result and artifacts are restored from cache")
+        parser.add_argument("--cache-failures", action="store_true", dest="cache_failures",
+                            help="Store the results of failed steps in cache as well; by default only "
+                                 "successful steps are cached, so failed ones are executed again")
+
+    def __init__(self, *args, **kwargs):
+        super(StepCache, self).__init__(*args, **kwargs)
+        self.cache_dir = None
+        if self.settings.cache_dir:
+            self.cache_dir = utils.parse_path(self.settings.cache_dir, os.getcwd())
+
+    def get_step_cache_dir(self):
+        result = os.path.join(self.cache_dir, "steps")
+        if not os.path.exists(result):
+            os.makedirs(result)
+        return result
+
+    def get_artifact_patterns(self, configuration):
+        result = []
+        for key in ("artifacts", "report_artifacts"):
+            if key in configuration:
+                result.append(utils.parse_path(configuration[key], self.settings.project_root))
+        return result
+
+    @staticmethod
+    def get_hashed_environment(configuration, environment):
+        """
+        :param environment: environment the step command is executed with
+        :return: all the variables of `environment`, or only the ones listed in 'cache_environment' key
+            along with the ones set in 'environment' key, if 'cache_environment' is set
+
+        >>> StepCache.get_hashed_environment(dict(environment=dict(A="1")), dict(A="1", PATH="/bin"))
+        {'A': '1', 'PATH': '/bin'}
+        >>> StepCache.get_hashed_environment(dict(environment=dict(A="1"), cache_environment="CC"),
+        ...                                  dict(A="1", PATH="/bin", CC="gcc"))
+        {'A': '1', 'CC': 'gcc'}
+        """
+        names = configuration.get("cache_environment")
+        if names is None:
+            result = dict(environment)
+        else:
+            if isinstance(names, str):
+                names = [names]
+            result = dict(configuration.get("environment", {}))
+            result.update((name, environment.get(name)) for name in names)
+        # The file with Universum API data is created anew for every run, so its name is always different
+        result.pop("UNIVERSUM_DATA_FILE", None)
+        return result
+
+    def calculate_key(self, configuration, working_directory, environment):
+        hasher = hashlib.sha256()
+        description = dict(version=__version__,
+                           command=configuration.get("command", []),
+                           environment=self.get_hashed_environment(configuration, environment),
+                           directory=os.path.relpath(working_directory, self.settings.project_root),
+                           artifacts=[configuration.get("artifacts"), configuration.get("report_artifacts")],
+                           inputs=configuration["cache_inputs"])
+        hasher.update(json.dumps(description, sort_keys=True).encode("utf-8"))
+
+        for file_path in collect_input_files(configuration["cache_inputs"], self.settings.project_root):
+            hasher.update(os.path.relpath(file_path, self.settings.project_root).encode("utf-8") + b"\0")
+            hash_file(hasher, file_path)
+        return hasher.hexdigest()
+
+    def get_entry(self, configuration, working_directory, environment):
+        """
+        :param environment: environment the step command is executed with
+        :return: :class:`StepCacheEntry` for the step, or None if the step results should not be cached
+        """
+        if not self.cache_dir or not configuration.get("cache_inputs"):
+            return None
+
+        artifact_patterns = self.get_artifact_patterns(configuration)
+        project_root = os.path.join(self.settings.project_root, "")
+        if any(not pattern.startswith(project_root) for pattern in artifact_patterns):
+            self.out.log("Step artifacts are located outside of project root and cannot be cached")
+            return None
+
+        try:
+            key = self.calculate_key(configuration, working_directory, environment)
+        except OSError as e:
+            self.out.log_stderr("Cannot calculate the hash of step inputs, caching is disabled: " + str(e))
+            return None
+        return StepCacheEntry(self.get_step_cache_dir(), key, self.settings.project_root, artifact_patterns,
+                              self.settings.cache_failures)
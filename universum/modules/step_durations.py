@@ -0,0 +1,90 @@
+import json
+import os
+import tempfile
+import threading
+
+from ..lib import utils
+from ..lib.gravity import Dependency, Module
+from .output import needs_output
+from .step_cache import StepCache
+
+__all__ = [
+    "StepDurations"
+]
+
+
+@needs_output
+class StepDurations(Module):
+    """
+    Wall-clock durations of build steps in previous runs, stored in a JSON file and keyed by step names
+    """
+    step_cache_factory = Dependency(StepCache)
+
+    @staticmethod
+    def define_arguments(argument_parser):
+        parser = argument_parser.get_or_create_group("Configuration execution")
+        parser.add_argument("--durations-file", dest="durations_file", metavar="UNIVERSUM_DURATIONS_FILE",
+                            help="JSON file to read the durations of build steps in previous runs from, "
+                                 "and to store the durations of steps in current run to. "
+                                 "By default, 'durations.json' in the directory set by '--cache-dir' is used; "
+                                 "if neither is set, durations are not stored")
+
+    def __init__(self, *args, **kwargs):
+        super(StepDurations, self).__init__(*args, **kwargs)
+        self.step_cache = self.step_cache_factory()
+        self.path = None
+        if self.settings.durations_file:
+            self.path = utils.parse_path(self.settings.durations_file, os.getcwd())
+        elif self.step_cache.cache_dir:
+            self.path = os.path.join(self.step_cache.cache_dir, "durations.json")
+        self._durations = None
+        self._measured = {}
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, encoding="utf-8") as durations_file:
+                return {str(name): float(value) for name, value in json.load(durations_file).items()}
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            self.out.log_stderr(f"Failed to read step durations from '{self.path}': {e}")
+            return {}
+
+    def get_all(self):
+        """
+        :return: dictionary of step durations in seconds, by step names
+        """
+        if self._durations is None:
+            self._durations = self._load()
+        return self._durations
+
+    def get(self, name):
+        return self.get_all().get(name)
+
+    def get_for_configuration(self, configuration):
+        return self.get(configuration.get("name", ""))
+
+    def record(self, name, duration):
+        with self._lock:
+            self._measured[name] = duration
+
+    def save(self):
+        if not self.path or not self._measured:
+            return
+        # Re-read the file, as it can be updated by other runs sharing it (e.g. other shards)
+        durations = self._load()
+        with self._lock:
+            durations.update(self._measured)
+            self._measured = {}
+        try:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            handle, temp_path = tempfile.mkstemp(dir=directory or None, suffix=".tmp")
+            with os.fdopen(handle, "w", encoding="utf-8") as durations_file:
+                json.dump(durations, durations_file, indent=4, sort_keys=True)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            self.out.log_stderr(f"Failed to store step durations to '{self.path}': {e}")
+        self._durations = durations
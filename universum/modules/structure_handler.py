@@ -1,12 +1,18 @@
-import copy
+import heapq
+import os
+import queue
+import threading
+import time
 
 from .. import configuration_support
 from ..lib.ci_exception import SilentAbortException, StepException, CriticalCiException
 from ..lib.gravity import Module, Dependency
-from .output import needs_output
+from .output import needs_output, OutputRecorder
 
 __all__ = [
-    "needs_structure"
+    "needs_structure",
+    "ResourceBudget",
+    "StepPlan"
 ]
 
 
@@ -49,6 +55,12 @@ class Block:
     True
     >>> b2 is b4.parent
     True
+
+    >>> b4.get_usage_text()
+    ''
+    >>> b4.started, b4.finished, b4.cpu_time, b4.max_rss = 10.0, 22.5, 9.25, 120.0
+    >>> b4.get_usage_text()
+    ' (12.50 s, CPU 9.25 s, peak RSS 120.0 MB)'
     """
 
     def __init__(self, name: str, parent: 'Block' = None):
@@ -56,6 +68,15 @@ class Block:
         self.status = "Success"
         self.children = []
 
+        # Monotonic time of opening and closing the block; for steps also the time of starting and exiting
+        # of their processes, CPU time in seconds and peak RSS in megabytes of the processes, if known
+        self.started = None
+        self.finished = None
+        self.process_started = None
+        self.process_finished = None
+        self.cpu_time = None
+        self.max_rss = None
+
         self._parent = parent
         self.number = ''
         if self.parent:
@@ -73,37 +94,714 @@ class Block:
     def is_successful(self) -> bool:
         return self.status == "Success"
 
+    @property
+    def duration(self):
+        if self.started is None or self.finished is None:
+            return None
+        return self.finished - self.started
+
+    def copy_usage(self, block: 'Block'):
+        self.started = block.started
+        self.finished = block.finished
+        self.process_started = block.process_started
+        self.process_finished = block.process_finished
+        self.cpu_time = block.cpu_time
+        self.max_rss = block.max_rss
+
+    def get_usage_text(self) -> str:
+        figures = []
+        if self.duration is not None:
+            figures.append(f"{self.duration:.2f} s")
+        if self.cpu_time is not None:
+            figures.append(f"CPU {self.cpu_time:.2f} s")
+        if self.max_rss is not None:
+            figures.append(f"peak RSS {self.max_rss:.1f} MB")
+        return " ({})".format(", ".join(figures)) if figures else ""
+
+
+class StepPlan:
+    """
+    Configurations compiled into flat lists, so that the tree of :class:`.Variations` is expanded only once.
+    Groups and steps are stored in the order of configuration, and the items of all lists with the same index
+    describe the same group or step: its name with numbering, configuration combined with all its parents
+    (as :class:`.StepConfig`), whether it is critical, the index of its parent group (-1 for top level)
+    and the indexes of its members
+
+    >>> from universum.configuration_support import Variations
+    >>> plan = StepPlan(Variations([dict(name="Build ", command=["make"], critical=True)]) *
+    ...                 Variations([dict(name="A", command=["a"]), dict(name="B", command=["b"])]))
+    >>> plan.names
+    [' [  +  ] Build ', ' [ 1/2 ] Build A', ' [ 2/2 ] Build B']
+    >>> plan.configurations[2]
+    {'name': 'Build B', 'command': ['make', 'b']}
+    >>> plan.is_critical, plan.parents, plan.children, plan.roots
+    ([True, False, False], [-1, 0, 0], [[1, 2], [], []], [0])
+    >>> plan.get_steps()
+    [{'name': 'Build A', 'command': ['make', 'a']}, {'name': 'Build B', 'command': ['make', 'b']}]
+    """
+
+    def __init__(self, variations):
+        self.names = []
+        self.configurations = []
+        self.is_critical = []
+        self.is_group = []
+        self.parents = []
+        self.children = []
+        self.roots = []
+        self.step_indexes = []
+        self._add_variations(variations, None, -1)
+
+        step_num_len = len(str(len(self.step_indexes)))
+        group_numbering = " [ {:{length}}+{:{length}} ] ".format("", "", length=step_num_len)
+        step_number = 0
+        for index, name in enumerate(self.names):
+            if self.is_group[index]:
+                self.names[index] = group_numbering + name
+            else:
+                step_number += 1
+                self.names[index] = " [ {:>{}}/{} ] ".format(step_number, step_num_len,
+                                                             len(self.step_indexes)) + name
+
+    def _add_variations(self, variations, parent, parent_index):
+        for obj_a in variations:
+            item = configuration_support.StepConfig.create(parent, obj_a)
+            index = len(self.names)
+            self.names.append(item.get("name", ' '))
+            self.configurations.append(item)
+            self.is_critical.append(obj_a.get("critical", False))
+            self.is_group.append("children" in obj_a)
+            self.parents.append(parent_index)
+            self.children.append([])
+            if parent_index < 0:
+                self.roots.append(index)
+            else:
+                self.children[parent_index].append(index)
+            if "children" in obj_a:
+                self._add_variations(obj_a["children"], item, index)
+            else:
+                self.step_indexes.append(index)
+
+    @property
+    def step_count(self):
+        return len(self.step_indexes)
+
+    def get_steps(self):
+        """
+        :return: combined configurations of all steps, in the order of configuration
+        """
+        return [self.configurations[index] for index in self.step_indexes]
+
+
+def get_step_dependencies(configuration):
+    """
+    >>> get_step_dependencies(dict(name="step"))
+    []
+    >>> get_step_dependencies(dict(depends_on="build"))
+    ['build']
+    >>> get_step_dependencies(dict(depends_on=["build", "unpack"]))
+    ['build', 'unpack']
+    """
+    dependencies = configuration.get("depends_on", [])
+    if isinstance(dependencies, str):
+        return [dependencies]
+    return list(dependencies)
+
+
+def detect_cpu_count():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def detect_memory_mb():
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 1024 ** 2
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+class ResourceBudget:
+    """
+    Agent capacity in CPUs and megabytes of memory, shared between the steps executed simultaneously.
+    A step is only started when its 'cpus' and 'memory_mb' needs fit into the capacity left by running steps;
+    a step needing more than the whole capacity is started when no other step with declared needs is running
+
+    >>> budget = ResourceBudget(cpus=4, memory_mb=1000)
+    >>> budget.fits(dict(name="Link", cpus=2, memory_mb=800))
+    True
+    >>> budget.acquire(dict(name="Link", cpus=2, memory_mb=800))
+    >>> budget.fits(dict(name="Link other", memory_mb=300))
+    False
+    >>> budget.fits(dict(name="Compile", cpus=2))
+    True
+    >>> budget.release(dict(name="Link", cpus=2, memory_mb=800))
+    >>> budget.fits(dict(name="Huge", memory_mb=5000))
+    True
+    >>> budget.get_needs(dict(name="Bad", cpus="all"))
+    Traceback (most recent call last):
+        ...
+    universum.lib.ci_exception.CriticalCiException: Step 'Bad' has invalid 'cpus' value 'all': \
+should be a non-negative number
+    """
+
+    keys = ("cpus", "memory_mb")
+
+    def __init__(self, cpus=None, memory_mb=None):
+        """
+        :param cpus: number of CPUs; detected if not set
+        :param memory_mb: size of memory in megabytes; detected if not set, and not limited if detection fails
+        """
+        self.capacity = dict(cpus=cpus or detect_cpu_count(), memory_mb=memory_mb or detect_memory_mb())
+        self.used = dict.fromkeys(self.keys, 0)
+        self.lock = threading.Lock()
+
+    def get_needs(self, item):
+        result = {}
+        for key in self.keys:
+            value = item.get(key, 0)
+            try:
+                result[key] = float(value)
+            except (TypeError, ValueError):
+                result[key] = -1
+            if result[key] < 0:
+                raise CriticalCiException(f"Step '{item.get('name', '')}' has invalid '{key}' value '{value}': "
+                                          "should be a non-negative number")
+        return result
+
+    def fits(self, item):
+        needs = self.get_needs(item)
+        with self.lock:
+            if not any(self.used.values()):
+                return True
+            return all(self.capacity[key] is None or self.used[key] + needs[key] <= self.capacity[key]
+                       for key in self.keys)
+
+    def acquire(self, item):
+        needs = self.get_needs(item)
+        with self.lock:
+            for key in self.keys:
+                self.used[key] += needs[key]
+
+    def release(self, item):
+        needs = self.get_needs(item)
+        with self.lock:
+            for key in self.keys:
+                self.used[key] = max(self.used[key] - needs[key], 0)
+
+
+class CriticalScope:
+    """
+    All the steps of one critical configuration (a single step or a group of steps);
+    the steps following such configuration should not start until all of these are finished
+    """
+
+    def __init__(self):
+        self.pending = 0
+        self.failed = False
+        self.waiters = []
+
+
+class ScheduledStep:
+    def __init__(self, index, item, name, is_critical):
+        self.index = index
+        self.item = item
+        self.name = name
+        self.is_critical = is_critical
+        self.is_background = item.get("background", False)
+
+        self.scopes = []  # critical scopes this step belongs to
+        self.waited_scopes = []  # critical scopes to be finished before this step starts
+        self.required = []  # steps listed in 'depends_on'
+        self.dependents = []
+        self.blockers = 0
+
+        self.priority = 0  # steps with lower values are started first, if several steps are ready
+        self.block = Block(name)  # detached block to collect the status until the step is printed
+        self.recorder = None
+        self.process = None
+        self.result = None  # "Success", "Failed", "Cancelled" or "Skipped"
+        self.skip_reason = ""
+
+
+class StepScheduler:
+    """
+    State of one execution of the steps of :class:`StepPlan`. A new scheduler is created for each execution,
+    so that nothing (e.g. step results) is left from the previous ones
+    """
+
+    def __init__(self, structure, step_executor, budget, fail_fast):
+        self.structure = structure
+        self.out = structure.out
+        self.step_executor = step_executor
+        self.budget = budget
+        self.fail_fast = fail_fast
+        self.cancelling = False
+
+    def cancel_running_steps(self):
+        raise NotImplementedError
+
+
+class SequentialScheduler(StepScheduler):
+    """
+    Steps executed one by one in the order of configurations, except for background steps,
+    that are only waited for when some step needs it
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(SequentialScheduler, self).__init__(*args, **kwargs)
+        self.active_background_steps = []
+        self.step_results = {}
+
+    def cancel_running_steps(self):
+        self.cancelling = True
+        for step in self.active_background_steps:
+            step['process'].cancel()
+
+    def execute_one_step(self, configuration, is_critical):
+        process = self.step_executor(configuration)
+
+        background = configuration.get("background", False)
+        self.budget.acquire(configuration)
+        try:
+            process.start(is_background=background)
+        except Exception:
+            self.budget.release(configuration)
+            raise
+        if not background:
+            try:
+                process.finalize()
+            except StepException:
+                self.step_results[configuration.get("name", "")] = False
+                raise
+            finally:
+                self.budget.release(configuration)
+                self.structure.record_step_usage(self.structure.get_current_block(), process, False)
+            self.step_results[configuration.get("name", "")] = True
+            return
+
+        self.out.log("Will continue in background")
+        self.active_background_steps.append({'name': configuration.get("name", ""),
+                                             'process': process,
+                                             'block': self.structure.get_current_block(),
+                                             'is_critical': is_critical,
+                                             'configuration': configuration})
+
+    def finalize_background_step(self, step):
+        try:
+            try:
+                step['process'].finalize()
+            finally:
+                self.budget.release(step['configuration'])
+                self.structure.record_step_usage(step['block'], step['process'], True)
+            self.step_results[step['name']] = True
+            self.out.log("This background step finished successfully")
+        except StepException:
+            self.step_results[step['name']] = False
+            if step['process'].cancelled:
+                step['block'].status = "Cancelled"
+                self.out.log_stderr("This background step was cancelled")
+                return True
+            if step['is_critical']:
+                if self.fail_fast:
+                    self.cancel_running_steps()
+                self.out.log_stderr("This background step failed, and as it was critical, "
+                                    "all further steps will be skipped")
+                return False
+            self.out.log_stderr("This background step failed")
+        return True
+
+    def wait_for_background_steps(self, item):
+        """
+        Wait for the background steps that should be finished before the step starts: all of them
+        for 'finish_background' step, the ones freeing resources it needs, and the ones it depends on
+
+        :return: False if a critical background step failed, so the step should be skipped
+        """
+        if item.get("finish_background", False) and self.active_background_steps:
+            self.out.log("All ongoing background steps should be finished before next step execution")
+            if not self.report_background_steps():
+                return False
+
+        if not self.budget.fits(item):
+            self.out.log("Not enough CPUs or memory for this step, waiting for background steps "
+                         "to finish and free them")
+            while self.active_background_steps and not self.budget.fits(item):
+                if not self.report_background_steps(self.active_background_steps[:1]):
+                    return False
+
+        dependencies = get_step_dependencies(item)
+        awaited = [step for step in self.active_background_steps if step['name'] in dependencies]
+        if awaited:
+            self.out.log("Background steps this step depends on should be finished before its execution")
+            if not self.report_background_steps(awaited):
+                return False
+        return True
+
+    def execute_steps_recursively(self, plan, indexes, skipped=False):
+        child_step_failed = False
+        for index in indexes:
+            step_name = plan.names[index]
+            item = plan.configurations[index]
+            try:
+                if plan.is_group[index]:
+                    # Here pass_errors=True, because any exception outside executing build step
+                    # is not step-related and should stop script executing
+                    self.structure.run_in_block(self.execute_steps_recursively, step_name, True,
+                                                plan, plan.children[index], skipped)
+                    continue
+                if skipped:
+                    self.structure.report_skipped_block(step_name)
+                    continue
+
+                if not self.wait_for_background_steps(item):
+                    self.structure.report_skipped_block(step_name)
+                    skipped = True
+                    raise StepException()
+
+                failed_dependency = self.find_failed_dependency(get_step_dependencies(item))
+                if failed_dependency is not None:
+                    self.structure.report_skipped_block(step_name, f"failure of step '{failed_dependency}'")
+                    self.step_results[item.get("name", "")] = False
+                    continue
+
+                # Here pass_errors=False, because any exception while executing build step
+                # can be step-related and may not affect other steps
+                self.structure.run_in_block(self.execute_one_step, step_name, False, item, plan.is_critical[index])
+            except StepException:
+                child_step_failed = True
+                if plan.is_critical[index]:
+                    self.structure.report_critical_block_failure()
+                    skipped = True
+        if child_step_failed:
+            raise StepException()
+
+    def find_failed_dependency(self, dependencies):
+        """
+        :return: the name of a failed or skipped dependency; None if all dependencies succeeded
+        """
+        for name in dependencies:
+            if name not in self.step_results:
+                self.out.log_stderr(f"Step '{name}' this step depends on was not executed before it; "
+                                    "the dependency is ignored")
+            elif not self.step_results[name]:
+                return name
+        return None
+
+    def report_background_steps(self, steps=None):
+        if steps is None:
+            steps = list(self.active_background_steps)
+        result = True
+        for item in steps:
+            self.active_background_steps.remove(item)
+            if not self.structure.run_in_block(self.finalize_background_step,
+                                               "Waiting for background step '" + item['name'] + "' to finish...",
+                                               True, item):
+                result = False
+        if not self.active_background_steps:
+            self.out.log("All ongoing background steps completed")
+        return result
+
+    def execute(self, step_plan):
+        try:
+            self.execute_steps_recursively(step_plan, step_plan.roots)
+        except StepException:
+            pass
+
+        if self.active_background_steps:
+            self.structure.run_in_block(self.report_background_steps, "Reporting background steps", False)
+
+
+class ParallelScheduler(StepScheduler):
+    """
+    Steps started as soon as the steps they wait for are finished, up to `jobs` at a time (not counting
+    background steps); the logs of the steps are still printed in the order of configurations
+    """
+
+    def __init__(self, structure, step_executor, budget, fail_fast, jobs):
+        super(ParallelScheduler, self).__init__(structure, step_executor, budget, fail_fast)
+        self.jobs = jobs
+        self.plan = dict(operations=[], steps=[], names={}, scopes=[])
+        self.ready_steps = []  # heaps of (priority, index) of the steps that are not waiting for other steps
+        self.ready_background_steps = []
+        self.waiting_steps = []  # steps ready to start, but not fitting into the resource budget
+        self.running_steps = set()
+        self.running_count = 0  # number of running steps, not counting background ones
+        self.finished_steps = queue.Queue()
+
+    def cancel_running_steps(self):
+        self.cancelling = True
+        for step in self.running_steps:
+            if step.process is not None:
+                step.process.cancel()
+
+    def plan_steps_recursively(self, step_plan, indexes, waited_scopes, member_scopes):
+        plan = self.plan
+        waited_scopes = list(waited_scopes)
+        for index in indexes:
+            item = step_plan.configurations[index]
+
+            scope = None
+            scopes = member_scopes
+            if step_plan.is_critical[index]:
+                scope = CriticalScope()
+                scopes = member_scopes + [scope]
+
+            if step_plan.is_group[index]:
+                plan['operations'].append(("open", step_plan.names[index]))
+                self.plan_steps_recursively(step_plan, step_plan.children[index], waited_scopes, scopes)
+                plan['operations'].append(("close", scope))
+            else:
+                step = ScheduledStep(len(plan['steps']), item, step_plan.names[index], step_plan.is_critical[index])
+                step.scopes = scopes
+                step.waited_scopes = list(waited_scopes)
+                for current_scope in scopes:
+                    current_scope.pending += 1
+                for current_scope in waited_scopes:
+                    current_scope.waiters.append(step)
+                    step.blockers += 1
+
+                for name in get_step_dependencies(item):
+                    if name not in plan['names']:
+                        self.out.log_stderr(f"Step '{name}' that step '{item.get('name', '')}' depends on "
+                                            "is not found before it; the dependency is ignored")
+                    step.required.extend(plan['names'].get(name, []))
+                # 'finish_background' step waits for all the previous steps, but does not depend on their results
+                dependencies = plan['steps'] if item.get("finish_background", False) else step.required
+                for dependency in set(dependencies):
+                    dependency.dependents.append(step)
+                    step.blockers += 1
+
+                plan['steps'].append(step)
+                plan['names'].setdefault(item.get("name", ""), []).append(step)
+                plan['operations'].append(("step", step))
+
+            if scope:
+                plan['scopes'].append(scope)
+                waited_scopes.append(scope)
+
+    def check_step_skipped(self, step):
+        if self.cancelling:
+            step.skip_reason = "critical step failure"
+            return True
+        for scope in step.waited_scopes:
+            if scope.failed:
+                step.skip_reason = "critical step failure"
+                return True
+        for dependency in step.required:
+            if dependency.result != "Success":
+                step.skip_reason = f"failure of step '{dependency.item.get('name', '')}'"
+                return True
+        return False
+
+    def start_step(self, step):
+        structure = self.structure
+        step.recorder = OutputRecorder()
+        current_block = structure.current_block
+        structure.current_block = step.block
+        step.block.started = time.monotonic()
+        try:
+            with self.out.postponed(step.recorder):
+                step.process = self.step_executor(step.item)
+                step.process.start(is_background=True)
+        except StepException:
+            step.process = None
+        except Exception as e:
+            step.process = None
+            with self.out.postponed(step.recorder):
+                structure.fail_block(step.block, str(e))
+        finally:
+            structure.current_block = current_block
+
+        def wait_for_step():
+            if step.process is not None:
+                step.process.wait()
+            self.finished_steps.put(step)
+
+        threading.Thread(target=wait_for_step, daemon=True).start()
+
+    def finalize_step(self, step):
+        structure = self.structure
+        if step.process is not None:
+            current_block = structure.current_block
+            structure.current_block = step.block
+            try:
+                with self.out.postponed(step.recorder):
+                    step.process.finalize()
+            except StepException:
+                if step.process.cancelled:
+                    step.block.status = "Cancelled"
+            except Exception as e:
+                with self.out.postponed(step.recorder):
+                    structure.fail_block(step.block, str(e))
+            finally:
+                structure.current_block = current_block
+                structure.record_step_usage(step.block, step.process, True)
+        if step.block.finished is None:
+            step.block.finished = time.monotonic()
+        step.result = step.block.status
+
+    def print_steps(self, position):
+        """
+        Print the logs of all finished steps up to the first one still being executed
+        :return: position of the first operation that is not yet printed
+        """
+        structure = self.structure
+        operations = self.plan['operations']
+        while position < len(operations):
+            kind, data = operations[position]
+            if kind == "open":
+                structure.open_block(data)
+            elif kind == "close":
+                structure.close_block()
+                if data and data.failed:
+                    structure.report_critical_block_failure()
+            elif data.result is None:
+                break
+            elif data.result == "Skipped":
+                structure.report_skipped_block(data.name, data.skip_reason)
+            else:
+                structure.open_block(data.name)
+                structure.current_block.status = data.block.status
+                structure.current_block.copy_usage(data.block)
+                self.out.replay(data.recorder)
+                structure.close_block()
+                if data.is_critical and data.result != "Success":
+                    structure.report_critical_block_failure()
+            position += 1
+        return position
+
+    @staticmethod
+    def prioritize_longest_steps(steps, get_duration):
+        """
+        Set step priorities so that the steps with the longest expected time until the end of execution
+        are started first: that is the expected duration of the step itself plus the longest of such times
+        among the steps waiting for it. Steps with unknown duration are considered to take average time
+        """
+        durations = [get_duration(step.item) for step in steps]
+        known_durations = [duration for duration in durations if duration is not None]
+        default_duration = sum(known_durations) / len(known_durations) if known_durations else 0
+        remaining_times = [0] * len(steps)
+        # Steps only wait for the steps with lower indexes, so each step is processed after all its successors
+        for step in reversed(steps):
+            successors = list(step.dependents)
+            for scope in step.scopes:
+                successors.extend(scope.waiters)
+            duration = durations[step.index]
+            remaining_times[step.index] = (default_duration if duration is None else duration) + \
+                max((remaining_times[successor.index] for successor in successors), default=0)
+            step.priority = -remaining_times[step.index]
+
+    def make_ready(self, step):
+        heapq.heappush(self.ready_background_steps if step.is_background else self.ready_steps,
+                       (step.priority, step.index))
+
+    def unblock(self, step):
+        step.blockers -= 1
+        if not step.blockers:
+            self.make_ready(step)
+
+    def complete(self, step):
+        for scope in step.scopes:
+            scope.pending -= 1
+            if step.result == "Failed":
+                scope.failed = True
+                if self.fail_fast and not self.cancelling:
+                    self.cancel_running_steps()
+            if not scope.pending:
+                for waiter in scope.waiters:
+                    self.unblock(waiter)
+        for dependent in step.dependents:
+            self.unblock(dependent)
+
+    def start_ready_steps(self):
+        while self.ready_background_steps or (self.ready_steps and self.running_count < self.jobs):
+            if self.ready_background_steps:
+                step = self.plan['steps'][heapq.heappop(self.ready_background_steps)[1]]
+            else:
+                step = self.plan['steps'][heapq.heappop(self.ready_steps)[1]]
+            if self.check_step_skipped(step):
+                step.result = "Skipped"
+                self.complete(step)
+                continue
+            if not self.budget.fits(step.item):
+                self.waiting_steps.append(step)
+                continue
+            if not step.is_background:
+                self.running_count += 1
+            self.budget.acquire(step.item)
+            self.running_steps.add(step)
+            self.start_step(step)
+
+    def handle_finished_step(self):
+        step = self.finished_steps.get()
+        if not step.is_background:
+            self.running_count -= 1
+        self.budget.release(step.item)
+        self.running_steps.discard(step)
+        for waiting_step in self.waiting_steps:
+            self.make_ready(waiting_step)
+        self.waiting_steps = []
+        self.finalize_step(step)
+        self.complete(step)
+
+    def execute(self, step_plan, get_duration=None):
+        self.plan_steps_recursively(step_plan, step_plan.roots, [], [])
+        if get_duration is not None:
+            self.prioritize_longest_steps(self.plan['steps'], get_duration)
+
+        for scope in self.plan['scopes']:
+            if not scope.pending:
+                for waiter in scope.waiters:
+                    waiter.blockers -= 1
+        for step in self.plan['steps']:
+            if not step.blockers:
+                self.make_ready(step)
+
+        printed = 0
+        while True:
+            self.start_ready_steps()
+            printed = self.print_steps(printed)
+            if printed == len(self.plan['operations']):
+                break
+            self.handle_finished_step()
+
 
 @needs_output
 class StructureHandler(Module):
     def __init__(self, *args, **kwargs):
         super(StructureHandler, self).__init__(*args, **kwargs)
-        block_structure = Block("Universum")
-        self.current_block = block_structure
-        self.configs_current_number = 0
-        self.configs_total_count = 0
-        self.active_background_steps = []
+        self.root_block = Block("Universum")
+        self.root_block.started = time.monotonic()
+        self.current_block = self.root_block
+        self.scheduler = None
 
     def open_block(self, name):
         new_block = Block(name, self.current_block)
+        new_block.started = time.monotonic()
         self.current_block = new_block
 
         self.out.open_block(new_block.number, name)
 
     def close_block(self):
         block = self.current_block
+        # Blocks of background and parallel steps are finished when their processes exit
+        if block.finished is None:
+            block.finished = time.monotonic()
         self.current_block = self.current_block.parent
         self.out.close_block(block.number, block.name, block.status)
 
     def report_critical_block_failure(self):
         self.out.report_skipped("Critical step failed. All further configurations will be skipped")
+        if self.scheduler is not None and self.scheduler.fail_fast:
+            self.scheduler.cancel_running_steps()
 
-    def report_skipped_block(self, name):
+    def report_skipped_block(self, name, reason="critical step failure"):
         new_skipped_block = Block(name, self.current_block)
         new_skipped_block.status = "Skipped"
 
         self.out.report_skipped(new_skipped_block.number + " " + name +
-                                " skipped because of critical step failure")
+                                " skipped because of " + reason)
 
     def fail_current_block(self, error=None): #TODO: why don't used empty str by default?
         block = self.get_current_block()
@@ -118,6 +816,19 @@ class StructureHandler(Module):
     def get_current_block(self):
         return self.current_block
 
+    @staticmethod
+    def record_step_usage(block, process, is_finished):
+        """
+        :param is_finished: whether the block should be finished when the process of the step exited,
+            and not when it is closed
+        """
+        block.process_started = process.started
+        block.process_finished = process.finished
+        block.cpu_time = process.cpu_time
+        block.max_rss = process.max_rss
+        if is_finished:
+            block.finished = process.finished or time.monotonic()
+
     # The exact block will be reported as failed only if pass_errors is False
     # Otherwise the exception will be passed to the higher level function and handled there
     def run_in_block(self, operation, block_name, pass_errors, *args, **kwargs):
@@ -138,99 +849,29 @@ class StructureHandler(Module):
             self.close_block()
         return result
 
-    def execute_one_step(self, configuration, executor, is_critical):
-        process = executor(configuration)
-
-        background = configuration.get("background", False)
-        process.start(is_background=background)
-        if not background:
-            process.finalize()
-            return
-
-        self.out.log("Will continue in background")
-        self.active_background_steps.append({'name': configuration.get("name", ""),
-                                             'finalizer': process.finalize,
-                                             'is_critical': is_critical})
-
-    def finalize_background_step(self, step):
+    def execute_step_structure(self, step_plan, step_executor, jobs=1, get_duration=None, budget=None,
+                               fail_fast=False):
+        """
+        :param step_plan: :class:`StepPlan` of the steps to execute
+        :param jobs: maximum number of steps executed simultaneously
+        :param get_duration: function returning expected duration of the step by its configuration, or None if
+            it is unknown; if passed, steps not depending on each other are reordered to finish execution faster
+        :param budget: :class:`ResourceBudget` limiting the steps executed simultaneously; detected if not passed
+        :param fail_fast: whether to cancel the running steps when a critical step fails
+        """
+        budget = budget or ResourceBudget()
+        # Check the values before any step is started
+        for item in step_plan.get_steps():
+            budget.get_needs(item)
+
+        # Reordering of steps is only implemented by the scheduler of parallel steps;
+        # with one job it still runs background steps simultaneously with others
         try:
-            step['finalizer']()
-            self.out.log("This background step finished successfully")
-        except StepException:
-            if step['is_critical']:
-                self.out.log_stderr("This background step failed, and as it was critical, "
-                                    "all further steps will be skipped")
-                return False
-            self.out.log_stderr("This background step failed")
-        return True
-
-    def execute_steps_recursively(self, parent, variations, step_executor, skipped=False):
-        if parent is None:
-            parent = dict()
-
-        step_num_len = len(str(self.configs_total_count))
-        child_step_failed = False
-        for obj_a in variations:
-            try:
-                item = configuration_support.combine(parent, copy.deepcopy(obj_a))
-
-                if "children" in obj_a:
-                    # Here pass_errors=True, because any exception outside executing build step
-                    # is not step-related and should stop script executing
-
-                    numbering = " [ {:{length}}+{:{length}} ] ".format("", "", length=step_num_len)
-                    step_name = numbering + item.get("name", ' ')
-                    self.run_in_block(self.execute_steps_recursively, step_name, True,
-                                      item, obj_a["children"], step_executor, skipped)
-                else:
-                    self.configs_current_number += 1
-                    numbering = " [ {:>{}}/{} ] ".format(
-                        self.configs_current_number,
-                        step_num_len,
-                        self.configs_total_count
-                    )
-                    step_name = numbering + item.get("name", ' ')
-                    if skipped:
-                        self.report_skipped_block(step_name)
-                        continue
-
-                    if item.get("finish_background", False) and self.active_background_steps:
-                        self.out.log("All ongoing background steps should be finished before next step execution")
-                        if not self.report_background_steps():
-                            self.report_skipped_block(step_name)
-                            skipped = True
-                            raise StepException()
-
-                    # Here pass_errors=False, because any exception while executing build step
-                    # can be step-related and may not affect other steps
-                    self.run_in_block(self.execute_one_step, step_name, False,
-                                      item, step_executor, obj_a.get("critical", False))
-            except StepException:
-                child_step_failed = True
-                if obj_a.get("critical", False):
-                    self.report_critical_block_failure()
-                    skipped = True
-        if child_step_failed:
-            raise StepException()
-
-    def report_background_steps(self):
-        result = True
-        for item in self.active_background_steps:
-            if not self.run_in_block(self.finalize_background_step,
-                                     "Waiting for background step '" + item['name'] + "' to finish...",
-                                     True, item):
-                result = False
-        self.out.log("All ongoing background steps completed")
-        self.active_background_steps = []
-        return result
-
-    def execute_step_structure(self, configs, step_executor):
-        self.configs_total_count = sum(1 for _ in configs.all())
-
-        try:
-            self.execute_steps_recursively(None, configs, step_executor)
-        except StepException:
-            pass
-
-        if self.active_background_steps:
-            self.run_in_block(self.report_background_steps, "Reporting background steps", False)
+            if jobs > 1 or get_duration is not None:
+                self.scheduler = ParallelScheduler(self, step_executor, budget, fail_fast, jobs)
+                self.scheduler.execute(step_plan, get_duration)
+            else:
+                self.scheduler = SequentialScheduler(self, step_executor, budget, fail_fast)
+                self.scheduler.execute(step_plan)
+        finally:
+            self.scheduler = None
@@ -1,9 +1,73 @@
 import os
+import time
 
+from universum.lib import utils
+from universum.lib.ci_exception import CiException, CriticalCiException, SilentAbortException
+from universum.lib.gravity import Dependency
+from universum.modules.build_trace import BuildTrace
 from universum.modules.launcher import Launcher
+from universum.modules.step_cache import collect_input_files
+from universum.modules.structure_handler import StepPlan, get_step_dependencies
+
+__all__ = [
+    "Nonci",
+    "take_snapshot",
+    "get_changed_paths"
+]
+
+
+def take_snapshot(root, excluded_directories):
+    """
+    :param root: directory to look for files in, recursively
+    :param excluded_directories: absolute paths of directories to skip; hidden directories are skipped as well
+    :return: dictionary of modification times and sizes of all files, by their absolute paths
+    """
+    result = {}
+    directories = [os.path.abspath(root)]
+    while directories:
+        try:
+            entries = list(os.scandir(directories.pop()))
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if not entry.name.startswith(".") and entry.path not in excluded_directories:
+                        directories.append(entry.path)
+                else:
+                    stat = entry.stat(follow_symlinks=False)
+                    result[entry.path] = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                continue
+    return result
+
+
+def get_changed_paths(old_snapshot, new_snapshot):
+    """
+    >>> sorted(get_changed_paths({"a": (1, 1), "b": (1, 1), "c": (1, 1)}, {"b": (2, 1), "c": (1, 1), "d": (1, 1)}))
+    ['a', 'b', 'd']
+
+    :return: set of paths of the files created, changed or removed between two snapshots
+    """
+    return {path for path in old_snapshot.keys() | new_snapshot.keys()
+            if old_snapshot.get(path) != new_snapshot.get(path)}
 
 
 class Nonci(Launcher):
+    build_trace_factory = Dependency(BuildTrace)
+
+    @staticmethod
+    def define_arguments(argument_parser):
+        parser = argument_parser.get_or_create_group("Configuration execution")
+        parser.add_argument("--watch", action="store_true", dest="watch",
+                            help="After executing the build steps, keep watching the files in project root and "
+                                 "execute the steps again when they change: all steps if the config file is "
+                                 "changed, otherwise only the steps with changed 'cache_inputs' files, the steps "
+                                 "without 'cache_inputs' key and the steps depending on them via 'depends_on'. "
+                                 "Hidden directories and the artifact directory are not watched")
+        parser.add_argument("--watch-interval", dest="watch_interval", metavar="UNIVERSUM_WATCH_INTERVAL",
+                            type=float, default=1.0,
+                            help="Interval in seconds between checks of the watched files. Default is 1")
 
     def __init__(self, *args, **kwargs):
         # Patch settings before parent class is initialized
@@ -14,19 +78,117 @@ class Nonci(Launcher):
             self.settings.project_root = os.getcwd()
 
         super().__init__(*args, **kwargs)
+        self.build_trace = self.build_trace_factory()
 
     def execute(self):
 
         self.out.log("Cleaning artifacts...")
         self.artifacts.clean_artifacts_silently()
 
-        project_configs = self.process_project_configs()
-        self.artifacts.set_and_clean_artifacts(project_configs, ignore_existing_artifacts=True)
+        self.process_project_configs()
+        self.run_steps()
+
+        if self.settings.watch:
+            self.watch()
+
+    def run_steps(self):
+        self.artifacts.set_and_clean_artifacts(self.step_plan, ignore_existing_artifacts=True)
 
         self.launch_project()
         self.reporter.report_initialized = True
         self.reporter.report_build_result()
         self.artifacts.collect_artifacts()
+        # Steps executed again in watch mode are added to the timings of the previous runs
+        self.reporter.save_build_timings(self.artifacts.create_text_file("BUILD_TIMINGS.json", rewrite=True))
+
+    def get_config_path(self):
+        return os.path.abspath(utils.parse_path(self.settings.config_path, self.settings.project_root))
+
+    def take_snapshot(self):
+        excluded_directories = {os.path.abspath(self.artifacts.artifact_dir)}
+        if self.step_cache.cache_dir:
+            excluded_directories.add(os.path.abspath(self.step_cache.cache_dir))
+        result = take_snapshot(self.settings.project_root, excluded_directories)
+        # Config file is not necessarily located in project root
+        config_path = self.get_config_path()
+        if os.path.exists(config_path):
+            stat = os.stat(config_path)
+            result[config_path] = (stat.st_mtime_ns, stat.st_size)
+        return result
+
+    def select_affected_steps(self, changed_paths):
+        """
+        :param changed_paths: absolute paths of the files changed since the steps were executed
+        :return: :class:`.Variations` object, containing only the steps to execute again
+        """
+        affected_names = set()
+
+        def is_affected(configuration):
+            patterns = configuration.get("cache_inputs")
+            if patterns is None:
+                affected = True
+            else:
+                # Changed paths are matched the same way as input files are collected by step cache,
+                # including the paths of deleted files
+                affected = bool(collect_input_files(patterns, self.settings.project_root, changed_paths))
+            # Steps can only depend on the previous ones, so the dependencies are already checked
+            affected = affected or any(name in affected_names for name in get_step_dependencies(configuration))
+            if affected:
+                affected_names.add(configuration.get("name", ""))
+            return affected
+
+        return self.project_configs.filter(is_affected)
+
+    def rerun(self, changed_paths):
+        """
+        :return: True if any steps were executed again; False otherwise
+        """
+        if self.get_config_path() in changed_paths:
+            self.out.log("Config file is changed, so it is processed again and all steps are executed")
+            self.artifacts.clean_artifacts_silently()
+            self.reporter.clear_report()
+            self.process_project_configs()
+            self.run_steps()
+            return True
+
+        affected_configs = self.select_affected_steps(changed_paths)
+        if not affected_configs:
+            self.out.log("Some files are changed, but no steps depend on them")
+            return False
+        self.out.log("Some files are changed, so the steps depending on them are executed again")
+        all_steps = self.step_plan
+        self.step_plan = StepPlan(affected_configs)
+        try:
+            self.artifacts.clean_collected_artifacts(self.step_plan)
+            self.reporter.clear_report()
+            self.run_steps()
+        finally:
+            self.step_plan = all_steps
+        return True
+
+    def watch(self):
+        self.out.log("Watching for changes of files in project root. Press Ctrl+C to stop")
+        snapshot = self.take_snapshot()
+        try:
+            while True:
+                time.sleep(self.settings.watch_interval)
+                changed_paths = get_changed_paths(snapshot, self.take_snapshot())
+                if not changed_paths:
+                    continue
+                try:
+                    executed = self.rerun(changed_paths)
+                except SilentAbortException:
+                    # The error is already reported in the failed block
+                    executed = True
+                except (CiException, CriticalCiException) as e:
+                    self.out.log_exception(str(e))
+                    executed = True
+                # Files changed by the steps themselves should not cause the steps to be executed again
+                snapshot = self.take_snapshot()
+                if executed:
+                    self.out.log("Watching for changes of files in project root. Press Ctrl+C to stop")
+        except KeyboardInterrupt:
+            self.out.log("Stopped watching for changes")
 
     def finalize(self):
-        pass
+        self.build_trace.save()